@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_active_listings(apps, schema_editor):
+    SellerProfile = apps.get_model('accounts', 'SellerProfile')
+    Product = apps.get_model('marketplace', 'Product')
+    counts = (
+        Product.objects.filter(is_sold=False, expired=False)
+        .order_by()
+        .values('seller_id')
+        .annotate(n=Count('id'))
+    )
+    for row in counts:
+        SellerProfile.objects.filter(user_id=row['seller_id']).update(active_listing_count=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_sellerprofile'),
+        ('marketplace', '0002_product_expired_product_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sellerprofile',
+            name='active_listing_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_active_listings, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,6 @@
 # accounts/models.py
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from cloudinary.models import CloudinaryField
 from django.conf import settings
 from django.utils import timezone
@@ -19,6 +19,9 @@ class SellerProfile(models.Model):
     verified_until = models.DateTimeField(null=True, blank=True)
     max_listings = models.IntegerField(default=1)  # Base limit for unverified
     listing_duration_days = models.IntegerField(default=7)  # Base duration for unverified
+    # Unsold, unexpired listings; kept by marketplace/counters.py and doubles
+    # as the quota: a new listing is only admitted while this is < max_listings
+    active_listing_count = models.PositiveIntegerField(default=0, editable=False)
     store_name = models.CharField(max_length=100, blank=True)
     store_description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -27,12 +30,27 @@ class SellerProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - Verified: {self.is_verified}"
 
+    def save(self, *args, **kwargs):
+        # active_listing_count only moves through F() updates; a full save of
+        # an instance loaded earlier must not write its stale copy back. Only
+        # while the row exists (locked until the save is done): one deleted
+        # meanwhile is re-inserted whole, as usual.
+        if self._state.adding or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            if type(self)._base_manager.select_for_update().filter(pk=self.pk).exists():
+                deferred = self.get_deferred_fields()
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != 'active_listing_count'
+                    and field.attname not in deferred
+                ]
+            super().save(*args, **kwargs)
+
     def can_post_more_listings(self):
         """Check if seller can post a new product based on their current active listings count."""
-        # Import Product here to avoid circular import
-        from marketplace.models import Product
-        active_count = Product.objects.filter(seller=self.user, is_sold=False, expired=False).count()
-        return active_count < self.max_listings
+        # Advisory only; marketplace.counters.reserve_listing_slot enforces the limit atomically
+        return self.active_listing_count < self.max_listings
 
     def get_listing_expiry_date(self):
         """Return the expiry date for a new listing based on seller's duration."""
@@ -53,17 +71,9 @@ class SellerProfile(models.Model):
             self.max_listings = 1
             self.listing_duration_days = 7
             self.save()
-            
-@receiver(post_save, sender='accounts.CustomUser')
-def create_seller_profile(sender, instance, created, **kwargs):
-    if created:
-        SellerProfile.objects.create(user=instance)            
 
 
 # Signal to create SellerProfile for new users
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_seller_profile(sender, instance, created, **kwargs):
     if created:
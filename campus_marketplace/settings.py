@@ -54,6 +54,8 @@ INSTALLED_APPS = [
     'lostfound',
     'housing',
     'food',
+    'feed',
+    'geocoding',
     'mpesa',
     
     'allauth',
@@ -111,6 +113,31 @@ DATABASES = {
     }
 }
 
+# Version counters in this cache tell each worker when its in-memory data
+# (e.g. the category registry) is stale, so production must point it at a
+# backend shared by all workers (Redis/Memcached); LocMem is per-process.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds between in-process listing expiry runs (0 disables; use
+# `manage.py expire_products` from cron instead)
+MARKETPLACE_EXPIRY_INTERVAL = int(os.getenv('MARKETPLACE_EXPIRY_INTERVAL', '0'))
+
+# Seconds between in-process "related products" refreshes, which only build
+# when a listing changed (0 disables; use `manage.py build_recommendations`
+# from cron instead)
+MARKETPLACE_RECOMMENDER_INTERVAL = int(os.getenv('MARKETPLACE_RECOMMENDER_INTERVAL', '0'))
+
+# Geocoding (see geocoding/pipeline.py). The worker is off by default: set
+# GEOCODER_WORKER=1 in ONE process only (Nominatim allows a single request per
+# second per client), or run `manage.py geocode_pending` from cron instead.
+GEOCODER_BACKEND = os.getenv('GEOCODER_BACKEND', 'utils.geocoder.NominatimGeocoder')
+GEOCODER_WORKER = os.getenv('GEOCODER_WORKER', '0') == '1'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
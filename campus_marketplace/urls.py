@@ -1,7 +1,7 @@
 # campus_marketplace/urls.py
 from django.contrib import admin
 from django.urls import path, include
-from django.views.generic import TemplateView
+from feed import views as feed_views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -12,12 +12,14 @@ admin.site.index_title = "Welcome to Campus Marketplace Admin"
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', TemplateView.as_view(template_name='home.html'), name='home'),
+    path('', feed_views.home, name='home'),
+    path('search/', feed_views.search, name='search'),
     path('accounts/', include('accounts.urls', namespace='accounts')),
     path('marketplace/', include('marketplace.urls', namespace='marketplace')),
     path('lostfound/', include('lostfound.urls', namespace='lostfound')),
     path('housing/', include('housing.urls', namespace='housing')),
     path('food/', include('food.urls', namespace='food')),
+    path('feed/', include('feed.urls', namespace='feed')),
     path('mpesa/', include('mpesa.urls')),
     path('accounts/', include('allauth.urls')),
     #path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
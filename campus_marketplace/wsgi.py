@@ -14,3 +14,26 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'campus_marketplace.settings')
 
 application = get_wsgi_application()
+
+# Long-running workers expire listings in-process when
+# MARKETPLACE_EXPIRY_INTERVAL is set (see marketplace/expiry.py)
+from marketplace.expiry import start_scheduler  # noqa: E402
+
+start_scheduler()
+
+# Related products are refreshed in-process when
+# MARKETPLACE_RECOMMENDER_INTERVAL is set (see marketplace/recommender.py)
+from marketplace.recommender import start_recommender  # noqa: E402
+
+start_recommender()
+
+# Product views are buffered in memory and written in batches (marketplace/popularity.py)
+from marketplace.popularity import start_view_flusher  # noqa: E402
+
+start_view_flusher()
+
+# Listings saved without coordinates are geocoded by a rate-limited worker
+# when GEOCODER_WORKER is set (see geocoding/pipeline.py)
+from geocoding.pipeline import start_geocoder  # noqa: E402
+
+start_geocoder()
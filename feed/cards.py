@@ -0,0 +1,119 @@
+# feed/cards.py
+"""
+Keeps ``ListingCard`` rows in step with the four listing apps.
+
+Each source model has a builder that turns one of its rows into the card
+fields. The builders read plain model fields only, so the backfill
+migration can run them on historical models too. Cards are written with
+one upsert per batch (``INSERT ... ON CONFLICT (kind, object_id) DO
+UPDATE``).
+"""
+from django.apps import apps as global_apps
+
+
+def _public_id(image):
+    return getattr(image, 'public_id', None) or ''
+
+
+def product_card(product):
+    return {
+        'title': product.title,
+        'price': product.price,
+        'thumbnail': _public_id(product.image),
+        'city': '',
+        'created_at': product.created_at,
+        'active': not product.is_sold and not product.expired,
+    }
+
+
+def housing_card(listing):
+    return {
+        'title': listing.title,
+        'price': listing.price,
+        'thumbnail': _public_id(listing.main_image),
+        'city': listing.city or '',
+        'created_at': listing.created_at,
+        'active': listing.is_available,
+    }
+
+
+def food_card(vendor):
+    return {
+        'title': vendor.name,
+        'price': None,
+        'thumbnail': _public_id(vendor.main_image),
+        'city': vendor.city or '',
+        'created_at': vendor.created_at,
+        'active': vendor.is_active,
+    }
+
+
+def lostfound_card(item):
+    return {
+        'title': item.item_name,
+        'price': None,
+        'thumbnail': _public_id(item.image),
+        'city': '',
+        'created_at': item.created_at,
+        'active': item.status != 'returned',
+    }
+
+
+# kind -> (source model, card builder)
+SOURCES = {
+    'product': ('marketplace.Product', product_card),
+    'housing': ('housing.HousingListing', housing_card),
+    'food': ('food.FoodVendor', food_card),
+    'lostfound': ('lostfound.LostFoundItem', lostfound_card),
+}
+
+CARD_FIELDS = ['title', 'price', 'thumbnail', 'city', 'created_at', 'active']
+
+# Saves that touch only these fields leave the card as it is
+IGNORED_UPDATES = {'views_count', 'popularity', 'updated_at'}
+
+
+def sync_cards(kind, objects, apps=global_apps):
+    """Create or refresh the cards of ``objects`` (rows of ``kind``'s source model)."""
+    ListingCard = apps.get_model('feed', 'ListingCard')
+    build = SOURCES[kind][1]
+    cards = [ListingCard(kind=kind, object_id=obj.pk, **build(obj)) for obj in objects]
+    if cards:
+        ListingCard.objects.bulk_create(
+            cards, update_conflicts=True, unique_fields=['kind', 'object_id'], update_fields=CARD_FIELDS,
+        )
+    return len(cards)
+
+
+def sync_ids(kind, ids, apps=global_apps):
+    """Refresh the cards of ``kind`` rows ``ids`` from the database, dropping those that are gone."""
+    ids = set(ids)
+    Source = apps.get_model(SOURCES[kind][0])
+    objects = list(Source.objects.filter(pk__in=ids).order_by())
+    remove_cards(kind, ids - {obj.pk for obj in objects}, apps)
+    return sync_cards(kind, objects, apps)
+
+
+def remove_cards(kind, ids, apps=global_apps):
+    if ids:
+        apps.get_model('feed', 'ListingCard').objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+def rebuild(apps=global_apps, chunk_size=500):
+    """Re-derive every card from the source tables."""
+    ListingCard = apps.get_model('feed', 'ListingCard')
+    total = 0
+    for kind, (label, _) in SOURCES.items():
+        Source = apps.get_model(label)
+        chunk = []
+        for obj in Source.objects.order_by('pk').iterator(chunk_size=chunk_size):
+            chunk.append(obj)
+            if len(chunk) == chunk_size:
+                total += sync_cards(kind, chunk, apps)
+                chunk = []
+        total += sync_cards(kind, chunk, apps)
+        # Cards whose source row no longer exists
+        ListingCard.objects.filter(kind=kind).exclude(
+            object_id__in=Source.objects.values('pk')
+        ).delete()
+    return total
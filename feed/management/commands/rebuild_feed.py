@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from feed.cards import rebuild
+from feed.search import rebuild_indexes
+
+class Command(BaseCommand):
+    help = 'Re-derive every campus feed card and search index from the marketplace, housing, food and lost & found tables'
+
+    def handle(self, *args, **options):
+        total = rebuild()
+        self.stdout.write(f"{total} feed cards rebuilt.")
+        for table in rebuild_indexes():
+            self.stdout.write(f"Search index {table} rebuilt.")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingCard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Marketplace'), ('housing', 'Housing'), ('food', 'Food'), ('lostfound', 'Lost & Found')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('thumbnail', models.CharField(blank=True, max_length=255)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField()),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(condition=models.Q(('active', True)), fields=['-created_at', '-id'], name='listingcard_feed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='listingcard_kind_object_uniq')],
+            },
+        ),
+    ]
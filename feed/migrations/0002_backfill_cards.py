@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    from feed.cards import rebuild
+    rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0001_initial'),
+        ('marketplace', '0013_product_popularity'),
+        ('housing', '0004_alter_housinglisting_latitude_and_more'),
+        ('food', '0001_initial'),
+        ('lostfound', '0004_alter_lostfounditem_date_lost'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Full-text indexes for campus-wide search (see feed/search.py)
+
+from django.db import migrations
+
+# table -> (source table, indexed columns)
+FTS_TABLES = {
+    'feed_housing_fts': ('housing_housinglisting', ['title', 'description', 'address', 'neighborhood', 'city']),
+    'feed_food_fts': ('food_foodvendor', ['name', 'description', 'cuisine_type', 'address', 'city']),
+    'feed_lostfound_fts': ('lostfound_lostfounditem', ['item_name', 'description', 'location']),
+}
+
+
+def create_fts_indexes(apps, schema_editor):
+    # FTS5 is SQLite-only; elsewhere search falls back to icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (source, columns) in FTS_TABLES.items():
+        names = ', '.join(columns)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"{names}, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(f"INSERT INTO {table} (rowid, {names}) SELECT id, {names} FROM {source}")
+
+
+def drop_fts_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in FTS_TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0002_backfill_cards'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_indexes, drop_fts_indexes),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:23
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listingcard',
+            index=models.Index(condition=models.Q(('active', True)), fields=['kind', '-created_at', '-id'], name='listingcard_kind_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingcard',
+            index=models.Index(django.db.models.functions.text.Lower('city'), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('active', True)), name='listingcard_city_feed_idx'),
+        ),
+    ]
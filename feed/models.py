@@ -0,0 +1,73 @@
+# feed/models.py
+from cloudinary import CloudinaryResource
+from django.db import models
+from django.db.models.functions import Lower
+from django.urls import reverse
+
+
+class ListingCard(models.Model):
+    """
+    Denormalized copy of a listing from any app, for the campus-wide feed.
+    Written only by feed/cards.py, from the source apps' signals.
+    """
+    KIND_CHOICES = [
+        ('product', 'Marketplace'),
+        ('housing', 'Housing'),
+        ('food', 'Food'),
+        ('lostfound', 'Lost & Found'),
+    ]
+
+    # URL name of each kind's detail page
+    DETAIL_URLS = {
+        'product': 'marketplace:product_detail',
+        'housing': 'housing:listing_detail',
+        'food': 'food:vendor_detail',
+        'lostfound': 'lostfound:item_detail',
+    }
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Cloudinary public_id of the listing's main image
+    thumbnail = models.CharField(max_length=255, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField()
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # The feed: active cards, newest first, one range scan per page
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='listingcard_feed_idx',
+                condition=models.Q(active=True),
+            ),
+            # The same scan narrowed to one kind or one city, so a rare
+            # filter value doesn't walk every other card to fill a page
+            models.Index(
+                fields=['kind', '-created_at', '-id'],
+                name='listingcard_kind_feed_idx',
+                condition=models.Q(active=True),
+            ),
+            models.Index(
+                Lower('city'), models.F('created_at').desc(), models.F('id').desc(),
+                name='listingcard_city_feed_idx',
+                condition=models.Q(active=True),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='listingcard_kind_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
+
+    def get_absolute_url(self):
+        return reverse(self.DETAIL_URLS[self.kind], args=[self.object_id])
+
+    @property
+    def image(self):
+        """The thumbnail as a Cloudinary resource, for ``{% responsive_img %}``."""
+        return CloudinaryResource(self.thumbnail) if self.thumbnail else None
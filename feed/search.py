@@ -0,0 +1,312 @@
+# feed/search.py
+"""
+Campus-wide search across the marketplace, housing, food and lost & found.
+
+Each app has its own full-text index: products use the marketplace's FTS5
+table (``marketplace/search.py``), and the other three get one FTS5 table
+each, kept in step by ``feed/signals.py``. A query runs one sub-search per
+``Section``; each matches its index, joins the hits to the already
+denormalized ``ListingCard`` rows (active ones only) and takes the best
+``CANDIDATES`` by BM25.
+
+Scores are then made comparable across sections: a section's BM25 scores
+are divided by its best one, so relevance is in ``(0, 1]`` everywhere, and
+blended with a freshness term that halves every ``RECENCY_HALF_LIFE``.
+The page shows each section's ``top_k`` plus the best few overall.
+
+Sub-searches run concurrently on a small thread pool (``FEED_SEARCH_WORKERS``
+threads; 0 runs them one after another in the request thread). Every
+sub-search gets ``FEED_SEARCH_TIME_BUDGET`` seconds, enforced by the
+database itself (an SQLite progress handler, ``statement_timeout`` on
+PostgreSQL), so a slow index gives an empty, ``timed_out`` section instead
+of a slow page.
+
+On databases without FTS5 tables a section falls back to ``icontains``
+over the same columns, ranked by recency alone.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.conf import settings
+from django.db import OperationalError, ProgrammingError, close_old_connections, connection, transaction
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from marketplace.search import FTS_TABLE as PRODUCT_FTS_TABLE, match_expression, tokenize
+
+from .models import ListingCard
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 5
+TOP_RESULTS = 5
+CANDIDATES = 20  # per section, re-ranked with the recency boost
+RECENCY_WEIGHT = 0.3
+RECENCY_HALF_LIFE = 14  # days
+TIME_BUDGET = 0.5  # seconds per sub-search, unless FEED_SEARCH_TIME_BUDGET says otherwise
+WORKERS = 4  # unless FEED_SEARCH_WORKERS says otherwise
+# SQLite VM instructions between deadline checks
+PROGRESS_STEPS = 1000
+
+
+class Section:
+    """One app's sub-search: its FTS5 table and the source columns it indexes."""
+
+    def __init__(self, kind, source, table, columns, weights, fallback_fields=None, managed=True):
+        self.kind = kind
+        self.source = source
+        self.table = table
+        self.columns = columns
+        self.weights = weights
+        # Lookups for the icontains fallback; the indexed columns by default
+        self.fallback_fields = fallback_fields or columns
+        # Whether feed/signals.py maintains the table (products have their own)
+        self.managed = managed
+
+    @property
+    def label(self):
+        return dict(ListingCard.KIND_CHOICES)[self.kind]
+
+    def index(self, obj):
+        names = ', '.join(self.columns)
+        placeholders = ', '.join(['%s'] * len(self.columns))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [obj.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, {names}) VALUES (%s, {placeholders})',
+                [obj.pk] + [getattr(obj, column) for column in self.columns],
+            )
+
+    def remove(self, object_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [object_id])
+
+    def rebuild(self):
+        names = ', '.join(self.columns)
+        source = apps.get_model(self.source)._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(f'INSERT INTO {self.table} (rowid, {names}) SELECT id, {names} FROM {source}')
+
+    def cards(self, query):
+        """Best active cards for ``query``, each with a ``search_score`` (higher is better)."""
+        cards = ListingCard.objects.filter(kind=self.kind, active=True)
+        if has_index(self.table):
+            match = match_expression(query)
+            if match is None:
+                return []
+            weights = ', '.join(str(w) for w in self.weights)
+            matching_ids = RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match])
+            # bm25() is negative, more negative = better match
+            rank = RawSQL(
+                f'SELECT -bm25({self.table}, {weights}) FROM {self.table} '
+                f'WHERE {self.table} MATCH %s AND rowid = "feed_listingcard"."object_id"',
+                [match],
+                output_field=FloatField(),
+            )
+            cards = cards.filter(object_id__in=matching_ids).annotate(search_score=rank)
+            return list(cards.order_by('-search_score', '-id')[:CANDIDATES])
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+        matching = apps.get_model(self.source).objects.all()
+        for term in terms:
+            condition = Q()
+            for name in self.fallback_fields:
+                condition |= Q(**{f'{name}__icontains': term})
+            matching = matching.filter(condition)
+        cards = list(cards.filter(object_id__in=matching.values('pk')).order_by('-created_at', '-id')[:CANDIDATES])
+        for card in cards:
+            card.search_score = 1.0
+        return cards
+
+
+SECTIONS = [
+    Section(
+        'product', 'marketplace.Product', PRODUCT_FTS_TABLE,
+        ['title', 'description', 'seller_name'], (10.0, 2.0, 1.0),
+        fallback_fields=['title', 'description', 'seller__username'], managed=False,
+    ),
+    Section(
+        'housing', 'housing.HousingListing', 'feed_housing_fts',
+        ['title', 'description', 'address', 'neighborhood', 'city'], (10.0, 2.0, 3.0, 3.0, 3.0),
+    ),
+    Section(
+        'food', 'food.FoodVendor', 'feed_food_fts',
+        ['name', 'description', 'cuisine_type', 'address', 'city'], (10.0, 2.0, 5.0, 3.0, 3.0),
+    ),
+    Section(
+        'lostfound', 'lostfound.LostFoundItem', 'feed_lostfound_fts',
+        ['item_name', 'description', 'location'], (10.0, 2.0, 3.0),
+    ),
+]
+
+SECTIONS_BY_KIND = {section.kind: section for section in SECTIONS}
+
+
+_tables = None
+
+
+def has_index(table):
+    """Whether ``table`` (an FTS5 table) exists in this database."""
+    global _tables
+    if _tables is None:
+        try:
+            _tables = frozenset(connection.introspection.table_names()) if connection.vendor == 'sqlite' else frozenset()
+        except (OperationalError, ProgrammingError):
+            return False
+    return table in _tables
+
+
+def reset_indexes():
+    """Forget which FTS tables exist (used after migrations)."""
+    global _tables
+    _tables = None
+
+
+def rebuild_indexes():
+    """Re-index every feed-managed section from its source table; returns the tables rebuilt."""
+    rebuilt = []
+    for section in SECTIONS:
+        if section.managed and has_index(section.table):
+            section.rebuild()
+            rebuilt.append(section.table)
+    return rebuilt
+
+
+@contextmanager
+def time_budget(seconds):
+    """Abort any query on this thread's connection still running after ``seconds``."""
+    if connection.vendor == 'sqlite':
+        connection.ensure_connection()
+        deadline = time.monotonic() + seconds
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+    elif connection.vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [max(int(seconds * 1000), 1)])
+            yield
+    else:
+        yield
+
+
+@dataclass
+class SectionResult:
+    kind: str
+    label: str
+    results: list = field(default_factory=list)
+    timed_out: bool = False
+
+    @property
+    def best_score(self):
+        return self.results[0].search_score if self.results else 0.0
+
+
+def freshness(created_at, now):
+    """1.0 for a listing made at ``now``, halving every ``RECENCY_HALF_LIFE`` days."""
+    age_days = max((now - created_at).total_seconds(), 0) / 86400
+    return 0.5 ** (age_days / RECENCY_HALF_LIFE)
+
+
+def rescore(cards, now):
+    """Normalize ``cards``' raw scores by the best one and blend in recency, best first."""
+    best = max((card.search_score for card in cards), default=0.0)
+    for card in cards:
+        relevance = card.search_score / best if best > 0 else 1.0
+        card.relevance = relevance
+        card.search_score = (1 - RECENCY_WEIGHT) * relevance + RECENCY_WEIGHT * freshness(card.created_at, now)
+    return sorted(cards, key=lambda card: (-card.search_score, -card.pk))
+
+
+def run_section(section, query, budget, top_k=TOP_K, now=None):
+    """One sub-search within ``budget`` seconds; never raises for a slow or failing index."""
+    result = SectionResult(section.kind, section.label)
+    try:
+        with time_budget(budget):
+            cards = section.cards(query)
+    except OperationalError as e:
+        # "interrupted" on SQLite, QueryCanceled on PostgreSQL
+        result.timed_out = True
+        logger.warning('Search of %s for %r ran out of time: %s', section.kind, query, e)
+        return result
+    except Exception:
+        logger.exception('Search of %s for %r failed', section.kind, query)
+        return result
+    result.results = rescore(cards, now or timezone.now())[:top_k]
+    return result
+
+
+def _run_in_worker(section, query, budget, top_k, now):
+    try:
+        return run_section(section, query, budget, top_k, now)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='feed-search')
+        return _executor
+
+
+@dataclass
+class SearchResults:
+    query: str
+    sections: list
+    top: list
+
+    @property
+    def timed_out(self):
+        return [section.kind for section in self.sections if section.timed_out]
+
+    def __bool__(self):
+        return any(section.results for section in self.sections)
+
+
+def search(query, kinds=None, top_k=TOP_K):
+    """
+    Search every section (or those in ``kinds``) for ``query``. Sections come
+    back best match first; ``top`` is the best ``TOP_RESULTS`` overall.
+    """
+    sections = [s for s in SECTIONS if kinds is None or s.kind in kinds]
+    budget = getattr(settings, 'FEED_SEARCH_TIME_BUDGET', TIME_BUDGET)
+    workers = getattr(settings, 'FEED_SEARCH_WORKERS', WORKERS)
+    now = timezone.now()
+    if not tokenize(query):
+        results = [SectionResult(s.kind, s.label) for s in sections]
+    elif not workers:
+        results = [run_section(s, query, budget, top_k, now) for s in sections]
+    else:
+        executor = _get_executor(workers)
+        futures = [executor.submit(_run_in_worker, s, query, budget, top_k, now) for s in sections]
+        # The database aborts slow queries; this only guards against a stuck pool
+        done, _ = wait(futures, timeout=budget * 2 + 1)
+        results = []
+        for section, future in zip(sections, futures):
+            if future in done:
+                results.append(future.result())
+            else:
+                future.cancel()
+                results.append(SectionResult(section.kind, section.label, timed_out=True))
+    results.sort(key=lambda r: -r.best_score)
+    top = sorted(
+        (card for r in results for card in r.results), key=lambda card: (-card.search_score, -card.pk)
+    )[:TOP_RESULTS]
+    return SearchResults(query, results, top)
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+from marketplace.models import Product
+from marketplace.signals import products_updated
+
+from .cards import IGNORED_UPDATES, SOURCES, remove_cards, sync_cards, sync_ids
+from .search import SECTIONS_BY_KIND, has_index, reset_indexes
+
+
+def _connect(kind, model):
+    section = SECTIONS_BY_KIND[kind]
+    # Products are indexed by marketplace/signals.py
+    indexed = section.managed
+
+    def card_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+        if raw or (update_fields is not None and set(update_fields) <= IGNORED_UPDATES):
+            return
+        sync_cards(kind, [instance])
+        if indexed and has_index(section.table):
+            section.index(instance)
+
+    def card_deleted(sender, instance, **kwargs):
+        remove_cards(kind, [instance.pk])
+        if indexed and has_index(section.table):
+            section.remove(instance.pk)
+
+    post_save.connect(card_saved, sender=model, weak=False, dispatch_uid=f'feed.card_saved.{kind}')
+    post_delete.connect(card_deleted, sender=model, weak=False, dispatch_uid=f'feed.card_deleted.{kind}')
+
+
+for _kind, (_label, _) in SOURCES.items():
+    _connect(_kind, _label)
+
+
+def resync_products(sender, product_ids, **kwargs):
+    """Bulk product updates send no post_save."""
+    sync_ids('product', product_ids)
+
+
+products_updated.connect(resync_products, sender=Product, dispatch_uid='feed.resync_products')
+
+
+def refresh_search_indexes(sender, **kwargs):
+    """The FTS tables may have just been created or dropped."""
+    reset_indexes()
+
+
+post_migrate.connect(refresh_search_indexes, dispatch_uid='feed.refresh_search_indexes')
@@ -0,0 +1,229 @@
+import datetime
+import unittest
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from food.models import FoodVendor
+from housing.models import HousingListing
+from lostfound.models import LostFoundItem
+from marketplace.bulk import run_bulk_action
+from marketplace.models import Category, Product
+
+from . import search as site_search
+from .cards import rebuild
+from .models import ListingCard
+
+
+class ListingCardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='student', password='pw')
+        category = Category.objects.create(name='Feed Test')
+        cls.product = Product.objects.create(
+            seller=cls.user, category=category, title='Desk lamp', description='Used item',
+            price=100, condition='good',
+        )
+        cls.listing = HousingListing.objects.create(
+            user=cls.user, title='Bedsitter near campus', description='Quiet', city='Kisumu', price=8000,
+            bedrooms=1, bathrooms=1, available_from=datetime.date.today(),
+            contact_name='Student', contact_phone='0700000000',
+        )
+        cls.vendor = FoodVendor.objects.create(
+            user=cls.user, name='Mama Oliech', description='Fish', address='Main gate', city='Kisumu',
+            phone='0700000000', opening_time=datetime.time(8), closing_time=datetime.time(20),
+        )
+        cls.item = LostFoundItem.objects.create(
+            user=cls.user, item_name='Blue umbrella', description='Left in the library', location='Library',
+            contact_info='student@example.com', date_lost=datetime.date.today(),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def card(self, kind, object_id):
+        return ListingCard.objects.get(kind=kind, object_id=object_id)
+
+    def test_signals_keep_cards_in_step(self):
+        self.assertEqual(ListingCard.objects.filter(active=True).count(), 4)
+        self.assertEqual(self.card('food', self.vendor.pk).city, 'Kisumu')
+
+        self.item.status = 'returned'
+        self.item.save()
+        self.assertFalse(self.card('lostfound', self.item.pk).active)
+
+        # Bulk updates send no post_save
+        run_bulk_action(self.user, 'sold', [self.product.pk])
+        self.assertFalse(self.card('product', self.product.pk).active)
+
+        self.listing.delete()
+        self.assertFalse(ListingCard.objects.filter(kind='housing', object_id=self.listing.pk).exists())
+
+        # View counters don't rewrite cards
+        with CaptureQueriesContext(connection) as ctx:
+            self.vendor.increment_views()
+        self.assertFalse([q for q in ctx.captured_queries if 'feed_listingcard' in q['sql']])
+
+    def test_rebuild_matches_signals(self):
+        expected = set(ListingCard.objects.values_list('kind', 'object_id', 'title', 'active'))
+        ListingCard.objects.all().delete()
+        ListingCard.objects.create(kind='product', object_id=999999, title='Gone', created_at=self.product.created_at)
+        rebuild()
+        self.assertEqual(set(ListingCard.objects.values_list('kind', 'object_id', 'title', 'active')), expected)
+
+    def test_feed_pages(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(len(response.context['cards']), 4)
+        self.assertContains(response, 'Mama Oliech')
+
+        response = self.client.get(reverse('feed:campus_feed'), {'city': 'kisumu'})
+        self.assertEqual([card.title for card in response.context['cards']], ['Mama Oliech', 'Bedsitter near campus'])
+        response = self.client.get(reverse('feed:campus_feed'), {'kind': 'lostfound'})
+        self.assertEqual([card.title for card in response.context['cards']], ['Blue umbrella'])
+
+    def test_feed_requires_login(self):
+        self.client.logout()
+        url = reverse('feed:campus_feed')
+        response = self.client.get(url, {'kind': 'product'})
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={url}%3Fkind%3Dproduct", fetch_redirect_response=False)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+    def test_feed_is_one_indexed_range_scan(self):
+        for params, index in [
+            ({}, 'listingcard_feed_idx'),
+            ({'kind': 'housing'}, 'listingcard_kind_feed_idx'),
+            ({'city': 'Kisumu'}, 'listingcard_city_feed_idx'),
+        ]:
+            with self.subTest(params=params):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.get(reverse('feed:campus_feed'), params)
+                queries = [q['sql'] for q in ctx.captured_queries if 'feed_listingcard' in q['sql']]
+                self.assertEqual(len(queries), 1)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + queries[0])
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertRegex(plan, rf'USING INDEX {index}\b')
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+def make_listings(user):
+    category = Category.objects.create(name='Search Test')
+    Product.objects.create(
+        seller=user, category=category, title='Study desk', description='Solid wood desk with drawers',
+        price=2500, condition='good',
+    )
+    Product.objects.create(
+        seller=user, category=category, title='Desk chair', description='Sold already',
+        price=900, condition='good', is_sold=True,
+    )
+    HousingListing.objects.create(
+        user=user, title='Furnished bedsitter', description='Comes with a study desk and wardrobe',
+        price=9000, bedrooms=1, bathrooms=1, available_from=datetime.date.today(),
+        contact_name='Student', contact_phone='0700000000',
+    )
+    FoodVendor.objects.create(
+        user=user, name='Desk Side Cafe', description='Coffee and snacks', address='Library wing',
+        phone='0700000000', opening_time=datetime.time(7), closing_time=datetime.time(18),
+    )
+    LostFoundItem.objects.create(
+        user=user, item_name='Calculator', description='Casio, left on a desk in room 4', location='Room 4',
+        contact_info='student@example.com', date_lost=datetime.date.today(),
+    )
+
+
+@override_settings(FEED_SEARCH_WORKERS=0)
+class GlobalSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='searcher', password='pw')
+        make_listings(cls.user)
+
+    def test_sections_are_typed_ranked_and_active_only(self):
+        results = site_search.search('desk')
+        sections = {section.kind: section for section in results.sections}
+        self.assertEqual(set(sections), {'product', 'housing', 'food', 'lostfound'})
+        self.assertEqual([card.title for card in sections['product'].results], ['Study desk'])
+        self.assertEqual([card.title for card in sections['food'].results], ['Desk Side Cafe'])
+        for section in results.sections:
+            self.assertFalse(section.timed_out)
+            # Each section's best match is normalized to full relevance
+            self.assertEqual(section.results[0].relevance, 1.0)
+        self.assertEqual(len(results.top), 4)
+        scores = [card.search_score for card in results.top]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_recency_breaks_relevance_ties(self):
+        old = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        now = old + datetime.timedelta(days=28)
+        cards = [
+            ListingCard(pk=1, kind='product', object_id=1, title='old', created_at=old),
+            ListingCard(pk=2, kind='product', object_id=2, title='new', created_at=now),
+        ]
+        for card in cards:
+            card.search_score = 3.0
+        ranked = site_search.rescore(cards, now)
+        self.assertEqual([card.title for card in ranked], ['new', 'old'])
+        self.assertAlmostEqual(ranked[1].search_score, 0.7 + 0.3 * 0.25)
+
+    def test_index_follows_edits_and_deletes(self):
+        item = LostFoundItem.objects.get(item_name='Calculator')
+        item.item_name = 'Graphing calculator'
+        item.description = 'Texas Instruments'
+        item.save()
+        self.assertFalse(site_search.search('casio').top)
+        self.assertEqual([card.title for card in site_search.search('graphing').top], ['Graphing calculator'])
+        item.delete()
+        self.assertFalse(site_search.search('graphing'))
+
+    def test_slow_section_times_out_alone(self):
+        section = site_search.SECTIONS_BY_KIND['housing']
+        with mock.patch.object(site_search, 'PROGRESS_STEPS', 1), self.assertLogs('feed.search', 'WARNING'):
+            result = site_search.run_section(section, 'desk', budget=0)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(result.results, [])
+        # The connection is usable again afterwards
+        self.assertEqual(len(site_search.run_section(section, 'desk', budget=1).results), 1)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'progress handler budget is SQLite-specific')
+    def test_time_budget_interrupts_queries(self):
+        with self.assertRaises(OperationalError):
+            with site_search.time_budget(0.05), connection.cursor() as cursor:
+                cursor.execute(
+                    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) '
+                    'SELECT count(*) FROM n'
+                )
+
+    def test_search_requires_login(self):
+        url = reverse('search')
+        response = self.client.get(url, {'q': 'desk'})
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={url}%3Fq%3Ddesk", fetch_redirect_response=False)
+
+    def test_search_page_and_json(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search'), {'q': 'desk'})
+        self.assertContains(response, 'Best matches')
+        self.assertContains(response, 'Furnished bedsitter')
+
+        response = self.client.get(reverse('search'), {'q': 'desk', 'kind': 'product'}, HTTP_ACCEPT='application/json')
+        data = response.json()
+        self.assertEqual([section['type'] for section in data['sections']], ['product'])
+        self.assertEqual(data['sections'][0]['results'][0]['title'], 'Study desk')
+
+        data = self.client.get(reverse('search'), {'q': ''}, HTTP_ACCEPT='application/json').json()
+        self.assertEqual(data['top'], [])
+
+
+class ConcurrentSearchTests(TransactionTestCase):
+
+    def test_sections_run_on_worker_threads(self):
+        make_listings(get_user_model().objects.create_user(username='searcher', password='pw'))
+        with override_settings(FEED_SEARCH_WORKERS=2):
+            results = site_search.search('desk')
+        self.assertEqual(len(results.top), 4)
+        self.assertEqual(results.timed_out, [])
@@ -0,0 +1,100 @@
+# feed/views.py
+from django.contrib.auth.decorators import login_required
+from django.db.models.functions import Lower
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from marketplace.pagination import paginate_keyset
+
+from . import search as site_search
+from .models import ListingCard
+
+HOME_CARDS = 6
+PAGE_SIZE = 24
+
+
+def _feed(params):
+    """Active cards matching the ``kind`` and ``city`` filters in ``params``, and the filters applied."""
+    cards = ListingCard.objects.filter(active=True)
+    kind = params.get('kind') or ''
+    if kind not in dict(ListingCard.KIND_CHOICES):
+        kind = ''
+    city = (params.get('city') or '').strip()
+    if kind:
+        cards = cards.filter(kind=kind)
+    if city:
+        # Matches listingcard_city_feed_idx, which iexact's LIKE can't use
+        cards = cards.alias(city_key=Lower('city')).filter(city_key=city.lower())
+    return cards, {'kind': kind, 'city': city}
+
+
+def home(request):
+    """Landing page; signed-in users get the latest listings across campus."""
+    context = {}
+    if request.user.is_authenticated:
+        context['cards'] = paginate_keyset(ListingCard.objects.filter(active=True), per_page=HOME_CARDS)
+    return render(request, 'home.html', context)
+
+
+@login_required
+def campus_feed(request):
+    """Latest listings from every app, newest first, filterable by kind and city"""
+    cards, filters = _feed(request.GET)
+    page = paginate_keyset(cards, request.GET.get('cursor'), per_page=PAGE_SIZE)
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = f'?{params.urlencode()}'
+    return render(request, 'feed/feed.html', {
+        'cards': page,
+        'next_url': next_url,
+        'kinds': ListingCard.KIND_CHOICES,
+        'filters': filters,
+    })
+
+
+def _card_json(card):
+    return {
+        'type': card.kind,
+        'id': card.object_id,
+        'title': card.title,
+        'url': card.get_absolute_url(),
+        'price': str(card.price) if card.price is not None else None,
+        'city': card.city,
+        'created_at': card.created_at.isoformat(),
+        'score': round(card.search_score, 4),
+    }
+
+
+@login_required
+def search(request):
+    """Search every app at once; ``kind`` narrows it to one section with more results"""
+    query = (request.GET.get('q') or '').strip()
+    kind = request.GET.get('kind') or ''
+    if kind in site_search.SECTIONS_BY_KIND:
+        results = site_search.search(query, kinds=[kind], top_k=site_search.CANDIDATES)
+    else:
+        kind = ''
+        results = site_search.search(query)
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'query': query,
+            'top': [_card_json(card) for card in results.top],
+            'sections': [
+                {
+                    'type': section.kind,
+                    'label': section.label,
+                    'timed_out': section.timed_out,
+                    'results': [_card_json(card) for card in section.results],
+                }
+                for section in results.sections
+            ],
+        })
+    return render(request, 'feed/search.html', {
+        'query': query,
+        'kind': kind,
+        'results': results,
+        'kinds': ListingCard.KIND_CHOICES,
+    })
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='foodvendor',
+            index=models.Index(fields=['latitude', 'longitude'], name='food_latlng_idx'),
+        ),
+    ]
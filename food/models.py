@@ -97,6 +97,10 @@ class FoodVendor(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Map tiles read vendors by bounding box (see food/tiles.py)
+            models.Index(fields=['latitude', 'longitude'], name='food_latlng_idx'),
+        ]
         verbose_name = "Food Vendor"
         verbose_name_plural = "Food Vendors"
     
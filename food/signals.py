@@ -0,0 +1,6 @@
+from utils.tiles import track_tiles
+
+from .models import FoodVendor
+from .tiles import food_tiles
+
+track_tiles(food_tiles, FoodVendor, ignored_updates={'views_count', 'updated_at'})
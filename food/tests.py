@@ -1,3 +1,44 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from utils.tiles import tiles_for_point
+
+from .models import FoodVendor
+
+CAMPUS = (-1.2795, 36.8163)
+
+
+class VendorMapTileTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='vendor', password='pw')
+        self.vendor = FoodVendor.objects.create(
+            user=self.user, name='Campus Grill', description='Grill', address='Gate B',
+            phone='0700000000', opening_time=datetime.time(8), closing_time=datetime.time(20),
+            latitude=CAMPUS[0], longitude=CAMPUS[1],
+        )
+        FoodVendor.objects.create(
+            user=self.user, name='Closed Kiosk', description='Closed', address='Gate B',
+            phone='0700000000', opening_time=datetime.time(8), closing_time=datetime.time(20),
+            latitude=CAMPUS[0], longitude=CAMPUS[1], is_active=False,
+        )
+        _, x, y = tiles_for_point(*CAMPUS)[17]
+        self.url = reverse('food:map_tile', args=[17, x, y])
+
+    def test_tile_lists_active_vendors_and_follows_edits(self):
+        response = self.client.get(self.url)
+        features = response.json()['features']
+        self.assertEqual([f['properties']['title'] for f in features], ['Campus Grill'])
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': response['ETag']}).status_code, 304)
 
-# Create your tests here.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.name = 'Campus Grill & Grub'
+            self.vendor.save()
+        response = self.client.get(self.url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features'][0]['properties']['title'], 'Campus Grill & Grub')
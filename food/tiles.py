@@ -0,0 +1,34 @@
+# food/tiles.py
+"""Active food vendors as clustered map tiles (see utils/tiles.py)."""
+from django.urls import reverse
+
+from utils.tiles import TileLayer
+
+from .models import FoodVendor
+
+
+def within_bbox(queryset, bbox):
+    """Narrow a ``FoodVendor`` queryset to vendors inside ``bbox`` (served by ``food_latlng_idx``)."""
+    return queryset.filter(
+        latitude__range=(bbox.min_lat, bbox.max_lat),
+        longitude__range=(bbox.min_lng, bbox.max_lng),
+    )
+
+
+def _describe(row):
+    pk, _, _, name, cuisine_type = row
+    return {
+        'id': pk,
+        'title': name,
+        'cuisine': cuisine_type,
+        'url': reverse('food:vendor_detail', args=[pk]),
+    }
+
+
+food_tiles = TileLayer(
+    'food',
+    get_queryset=lambda: FoodVendor.objects.filter(is_active=True),
+    within=within_bbox,
+    fields=['name', 'cuisine_type'],
+    describe=_describe,
+)
@@ -7,6 +7,7 @@ app_name = 'food'
 urlpatterns = [
     path('', views.home, name='home'),
     path('vendors/', views.FoodVendorListView.as_view(), name='vendor_list'),
+    path('tiles/<int:z>/<int:x>/<int:y>.json', views.map_tile, name='map_tile'),
     path('vendor/<int:pk>/', views.FoodVendorDetailView.as_view(), name='vendor_detail'),
     path('vendor/add/', views.FoodVendorCreateView.as_view(), name='add_vendor'),
     path('vendor/<int:pk>/edit/', views.FoodVendorUpdateView.as_view(), name='edit_vendor'),
@@ -8,6 +8,9 @@ from django.db.models import Q, Avg
 from .models import FoodVendor, MenuItem, FoodReview
 from .forms import FoodVendorForm, MenuItemForm, FoodReviewForm, FoodSearchForm
 from django.urls import reverse_lazy
+from django.views.decorators.http import require_safe
+from utils.tiles import tile_response
+from .tiles import food_tiles
 
 class MyRestaurantsView(LoginRequiredMixin, ListView):
     """View for user to see their own restaurants"""
@@ -330,4 +333,10 @@ class RestaurantMenuManagementView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         context['menu_items'] = self.object.menu_items.all().order_by('category', 'name')
         context['categories'] = dict(MenuItem.CATEGORY_CHOICES)
-        return context    
\ No newline at end of file
+        return context    
+
+
+@require_safe
+def map_tile(request, z, x, y):
+    """Clustered GeoJSON tile of active vendors for the map"""
+    return tile_response(request, food_tiles, z, x, y)
@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import GeocodedAddress
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = ['query', 'latitude', 'longitude', 'expires_at', 'looked_up_at']
+    list_filter = [('latitude', admin.EmptyFieldListFilter)]
+    search_fields = ['key', 'query']
+    readonly_fields = ['key', 'query', 'latitude', 'longitude', 'looked_up_at']
+
+    # Delete an entry to force a fresh lookup; answers come from the geocoder only
+    def has_add_permission(self, request):
+        return False
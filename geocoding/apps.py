@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class GeocodingConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'geocoding'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (queues listings saved without coordinates)
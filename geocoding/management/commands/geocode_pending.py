@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from geocoding.pipeline import SWEEP_BATCH, GeocodePipeline, GeocodeQueue, TokenBucket
+from utils.geocoder import get_geocoder
+
+
+class Command(BaseCommand):
+    help = 'Geocode housing listings and food vendors that have no coordinates yet, in the foreground'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=SWEEP_BATCH, help='Most listings to queue per source')
+        parser.add_argument(
+            '--rate', type=float,
+            help='Lookups per second (default GEOCODER_RATE); only raise it for a local geocoder',
+        )
+
+    def handle(self, *args, **options):
+        bucket = TokenBucket(options['rate']) if options['rate'] else None
+        # A private queue, so a running worker's jobs aren't taken over
+        pipeline = GeocodePipeline(get_geocoder(), bucket, GeocodeQueue())
+        queued = pipeline.sweep(options['limit'])
+        addresses = len(pipeline.queue)
+        start = time.perf_counter()
+        stats = pipeline.drain()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{queued} listings, {addresses} distinct addresses in {elapsed:.1f}s: "
+            f"{stats['cached']} from cache, {stats['looked_up']} looked up, "
+            f"{stats['not_found']} not found, {stats['failed']} failed, {stats['applied']} listings located."
+        )
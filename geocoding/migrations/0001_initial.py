@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Normalized address', max_length=400, unique=True)),
+                ('query', models.CharField(help_text='What the geocoder was asked', max_length=400)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=8, max_digits=12, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=8, max_digits=12, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('looked_up_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Geocoded Address',
+                'verbose_name_plural': 'Geocoded Addresses',
+            },
+        ),
+    ]
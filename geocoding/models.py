@@ -0,0 +1,33 @@
+# geocoding/models.py
+from django.db import models
+
+
+class GeocodedAddress(models.Model):
+    """
+    Cached geocoder answer for one normalized address. Found addresses are
+    kept for good; "not found" answers expire so a later lookup can retry.
+    """
+    key = models.CharField(max_length=400, unique=True, help_text="Normalized address")
+    query = models.CharField(max_length=400, help_text="What the geocoder was asked")
+    latitude = models.DecimalField(max_digits=12, decimal_places=8, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=12, decimal_places=8, null=True, blank=True)
+    # Null for found addresses; when a "not found" answer may be retried
+    expires_at = models.DateTimeField(null=True, blank=True)
+    looked_up_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Geocoded Address"
+        verbose_name_plural = "Geocoded Addresses"
+
+    def __str__(self):
+        if self.found:
+            return f"{self.query} -> {self.latitude}, {self.longitude}"
+        return f"{self.query} -> not found"
+
+    @property
+    def found(self):
+        return self.latitude is not None and self.longitude is not None
+
+    @property
+    def point(self):
+        return (float(self.latitude), float(self.longitude)) if self.found else None
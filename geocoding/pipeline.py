@@ -0,0 +1,296 @@
+# geocoding/pipeline.py
+"""
+Background geocoding for housing listings and food vendors.
+
+Saving a listing never waits on the network. A listing saved without
+coordinates is pending by virtue of its empty latitude and longitude. In
+the process running the worker, ``geocoding/signals.py`` also puts its
+normalized address on ``geocode_queue`` once the transaction commits;
+other processes leave it for the next sweep. The queue holds one job
+per normalized address, so twenty listings in the same building cost one
+lookup. A ``GeocodeWorker`` thread then works through the queue:
+
+1. the persistent ``GeocodedAddress`` cache is checked first; found
+   addresses are kept for good, "not found" answers for ``NEGATIVE_TTL``;
+2. otherwise the geocoder is called, at most ``GEOCODER_RATE`` requests a
+   second (a ``TokenBucket``; Nominatim allows one), and its answer cached;
+3. the coordinates are saved on every listing still waiting for that
+   address, with ``save(update_fields=...)``, so the spatial index, map
+   tiles and feed all hear about it.
+
+Lookups that fail in transit are retried up to ``MAX_ATTEMPTS`` times and
+never cached. The queue lives in memory; the worker also sweeps the tables
+for listings still missing coordinates, ``SWEEP_BATCH`` at a time every
+``SWEEP_INTERVAL`` seconds, which picks up listings saved in other
+processes and jobs lost to a restart.
+
+Start the worker with ``start_geocoder()`` (done in ``wsgi.py`` when
+``GEOCODER_WORKER`` is set, which it isn't by default) in one process
+only: the queue and the rate limit are per process. ``manage.py geocode_pending`` does a sweep and drains the queue
+in the foreground.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from utils.geocoder import GeocodingError, address_query, get_geocoder, normalize_address
+
+from .models import GeocodedAddress
+
+logger = logging.getLogger(__name__)
+
+# kind -> model with address, city, latitude and longitude fields
+SOURCES = {
+    'housing': 'housing.HousingListing',
+    'food': 'food.FoodVendor',
+}
+
+RATE = 1.0  # lookups per second, unless GEOCODER_RATE says otherwise
+NEGATIVE_TTL = timedelta(days=1)
+MAX_ATTEMPTS = 3
+SWEEP_INTERVAL = 10 * 60  # seconds
+SWEEP_BATCH = 500
+
+
+class TokenBucket:
+    """Blocking rate limiter: ``rate`` tokens a second, holding at most ``capacity``."""
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        # Waiters queue on the lock, so they are served one token at a time
+        with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                self._sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+@dataclass
+class Job:
+    query: str
+    # (kind, pk) of every listing waiting for this address
+    targets: set = field(default_factory=set)
+    attempts: int = 0
+
+
+class GeocodeQueue:
+    """FIFO of lookups keyed by normalized address; a repeated address joins the queued job."""
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._ready = threading.Condition()
+
+    def put(self, key, query, targets, attempts=0):
+        with self._ready:
+            job = self._jobs.get(key)
+            if job is None:
+                self._jobs[key] = Job(query, set(targets), attempts)
+            else:
+                job.targets.update(targets)
+                job.attempts = max(job.attempts, attempts)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Oldest ``(key, job)``, waiting up to ``timeout`` seconds; None if there is none."""
+        with self._ready:
+            if not self._jobs and timeout:
+                self._ready.wait(timeout)
+            if not self._jobs:
+                return None
+            return self._jobs.popitem(last=False)
+
+    def __len__(self):
+        with self._ready:
+            return len(self._jobs)
+
+
+geocode_queue = GeocodeQueue()
+
+
+def needs_geocoding(obj):
+    return (obj.latitude is None or obj.longitude is None) and bool(normalize_address(obj.address, obj.city))
+
+
+def enqueue(kind, obj, queue=geocode_queue):
+    queue.put(normalize_address(obj.address, obj.city), address_query(obj.address, obj.city), [(kind, obj.pk)])
+
+
+def _coordinate(value):
+    return Decimal(str(round(value, 6)))
+
+
+class GeocodePipeline:
+    """Drains a ``GeocodeQueue`` through the cache and a rate-limited geocoder."""
+
+    def __init__(self, geocoder=None, bucket=None, queue=geocode_queue):
+        self.geocoder = geocoder or get_geocoder()
+        self.bucket = bucket or TokenBucket(getattr(settings, 'GEOCODER_RATE', RATE))
+        self.queue = queue
+        # kind -> last pk the previous sweep saw
+        self._swept = {}
+
+    def lookup(self, key, query, stats):
+        """``(lat, lng)`` or None for a normalized address; raises ``GeocodingError``."""
+        now = timezone.now()
+        cached = GeocodedAddress.objects.filter(key=key).first()
+        if cached is not None and (cached.expires_at is None or cached.expires_at > now):
+            stats['cached'] += 1
+            return cached.point
+        self.bucket.acquire()
+        point = self.geocoder.geocode(query)
+        stats['looked_up'] += 1
+        GeocodedAddress.objects.update_or_create(key=key, defaults={
+            'query': query[:400],
+            'latitude': _coordinate(point[0]) if point else None,
+            'longitude': _coordinate(point[1]) if point else None,
+            'expires_at': None if point else now + NEGATIVE_TTL,
+        })
+        return point
+
+    def apply(self, key, point, targets):
+        """Save ``point`` on the ``targets`` still waiting for address ``key``; returns how many."""
+        applied = 0
+        for kind, pk in sorted(targets):
+            obj = apps.get_model(SOURCES[kind]).objects.filter(pk=pk).first()
+            # Skip listings deleted, located by hand or re-addressed meanwhile
+            if obj is None or not needs_geocoding(obj) or normalize_address(obj.address, obj.city) != key:
+                continue
+            obj.latitude, obj.longitude = _coordinate(point[0]), _coordinate(point[1])
+            obj.save(update_fields=['latitude', 'longitude'])
+            applied += 1
+        return applied
+
+    def process_one(self, timeout=None, stats=None):
+        """Handle the next queued address; returns False if the queue stayed empty."""
+        stats = Counter() if stats is None else stats
+        item = self.queue.get(timeout)
+        if item is None:
+            return False
+        key, job = item
+        try:
+            point = self.lookup(key, job.query, stats)
+        except GeocodingError:
+            stats['failed'] += 1
+            if job.attempts + 1 < MAX_ATTEMPTS:
+                self.queue.put(key, job.query, job.targets, job.attempts + 1)
+            logger.warning('Geocoding %r failed (attempt %d)', job.query, job.attempts + 1, exc_info=True)
+            return True
+        if point is None:
+            stats['not_found'] += 1
+        else:
+            stats['applied'] += self.apply(key, point, job.targets)
+        return True
+
+    def drain(self):
+        """Process everything queued, in the calling thread; returns counts by outcome."""
+        stats = Counter()
+        while self.process_one(stats=stats):
+            pass
+        return stats
+
+    def sweep(self, limit=SWEEP_BATCH):
+        """
+        Queue the next ``limit`` listings per source that still have no
+        coordinates. Each sweep carries on after the last listing the
+        previous one saw, starting over once a source is exhausted, so
+        addresses that are never found can't crowd out the rest. Addresses
+        with an unexpired "not found" answer aren't queued.
+        """
+        queued = 0
+        now = timezone.now()
+        for kind, label in SOURCES.items():
+            missing = list(
+                apps.get_model(label).objects
+                .filter(Q(latitude__isnull=True) | Q(longitude__isnull=True), pk__gt=self._swept.get(kind, 0))
+                .only('pk', 'address', 'city', 'latitude', 'longitude')
+                .order_by('pk')[:limit]
+            )
+            self._swept[kind] = missing[-1].pk if len(missing) == limit else 0
+            missing = [obj for obj in missing if needs_geocoding(obj)]
+            keys = {normalize_address(obj.address, obj.city) for obj in missing}
+            not_found = set(
+                GeocodedAddress.objects
+                .filter(key__in=keys, latitude__isnull=True, expires_at__gt=now)
+                .values_list('key', flat=True)
+            )
+            for obj in missing:
+                if normalize_address(obj.address, obj.city) not in not_found:
+                    enqueue(kind, obj, self.queue)
+                    queued += 1
+        return queued
+
+
+class GeocodeWorker(threading.Thread):
+    """Daemon thread draining the geocode queue, with a periodic sweep."""
+
+    def __init__(self, pipeline, sweep_interval=SWEEP_INTERVAL):
+        super().__init__(name='geocoder', daemon=True)
+        self.pipeline = pipeline
+        self.sweep_interval = sweep_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        next_sweep = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                if time.monotonic() >= next_sweep:
+                    self.pipeline.sweep()
+                    next_sweep = time.monotonic() + self.sweep_interval
+                self.pipeline.process_one(timeout=min(max(next_sweep - time.monotonic(), 0.1), 5))
+            except Exception:
+                logger.exception('Geocoding worker step failed')
+                self._stop_event.wait(5)
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def worker_running():
+    """Whether this process's geocoding worker is draining ``geocode_queue``."""
+    return _worker is not None and _worker.is_alive()
+
+
+def start_geocoder():
+    """
+    Start this process's geocoding worker if ``GEOCODER_WORKER`` is set.
+    Safe to call more than once.
+    """
+    global _worker
+    if not getattr(settings, 'GEOCODER_WORKER', False):
+        return None
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = GeocodeWorker(GeocodePipeline())
+            _worker.start()
+    return _worker
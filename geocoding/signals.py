@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from utils.geocoder import address_query, normalize_address
+
+from .pipeline import SOURCES, geocode_queue, needs_geocoding, worker_running
+
+# Saves that can't have changed where a listing is
+LOCATION_FIELDS = {'address', 'city', 'latitude', 'longitude'}
+
+
+def _connect(kind, model):
+    def listing_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+        """
+        Listings saved without coordinates are geocoded in the background.
+        Only the process running the worker queues them; elsewhere nothing
+        would drain the queue, so they wait for the worker's next sweep.
+        """
+        if raw or (update_fields is not None and not LOCATION_FIELDS & set(update_fields)):
+            return
+        if not worker_running() or not needs_geocoding(instance):
+            return
+        key = normalize_address(instance.address, instance.city)
+        query = address_query(instance.address, instance.city)
+        target = (kind, instance.pk)
+        transaction.on_commit(lambda: geocode_queue.put(key, query, [target]))
+
+    post_save.connect(listing_saved, sender=model, weak=False, dispatch_uid=f'geocoding.listing_saved.{kind}')
+
+
+for _kind, _label in SOURCES.items():
+    _connect(_kind, _label)
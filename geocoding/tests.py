@@ -0,0 +1,214 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from food.models import FoodVendor
+from housing.models import HousingListing
+from housing.spatial import nearest
+from utils.geocoder import FakeGeocoder, GeocodingError, NominatimGeocoder, normalize_address
+
+from .models import GeocodedAddress
+from .pipeline import MAX_ATTEMPTS, GeocodePipeline, GeocodeQueue, TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FailingGeocoder(FakeGeocoder):
+
+    def geocode(self, query):
+        self.calls.append(query)
+        raise GeocodingError('timed out')
+
+
+class TokenBucketTests(TestCase):
+
+    def test_spaces_requests_at_the_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1.0, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(clock.now, 2.0)
+
+        # Idle time refills, but never beyond capacity
+        clock.now += 10
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(clock.now, 13.0)
+
+
+class GeocodingPipelineTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='landlord', password='pw')
+        self.queue = GeocodeQueue()
+        for patcher in (
+            mock.patch('geocoding.signals.geocode_queue', self.queue),
+            mock.patch('geocoding.signals.worker_running', return_value=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.clock = FakeClock()
+        self.geocoder = FakeGeocoder()
+        self.pipeline = GeocodePipeline(
+            self.geocoder, TokenBucket(1.0, clock=self.clock, sleep=self.clock.sleep), self.queue
+        )
+
+    def listing(self, address, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return HousingListing.objects.create(
+                user=self.user, title='Room', description='Room', price=5000, address=address, city='Nairobi',
+                bedrooms=1, bathrooms=1, available_from=datetime.date.today(),
+                contact_name='Landlord', contact_phone='0700000000', **kwargs,
+            )
+
+    def vendor(self, address):
+        with self.captureOnCommitCallbacks(execute=True):
+            return FoodVendor.objects.create(
+                user=self.user, name='Kibanda', description='Food', address=address, city='Nairobi',
+                phone='0700000000', opening_time=datetime.time(8), closing_time=datetime.time(20),
+            )
+
+    def test_saves_queue_one_lookup_per_address(self):
+        a = self.listing('Ngong Road, Block B')
+        b = self.listing('ngong road  block b')
+        vendor = self.vendor('Ngong Road, Block B.')
+        self.listing('Somewhere else', latitude=-1.3, longitude=36.8)
+        # Nothing looked up while saving
+        self.assertEqual(self.geocoder.calls, [])
+        self.assertEqual(len(self.queue), 1)
+
+        stats = self.pipeline.drain()
+        self.assertEqual(stats['looked_up'], 1)
+        self.assertEqual(stats['applied'], 3)
+        self.assertEqual(len(self.geocoder.calls), 1)
+        for obj in (a, b, vendor):
+            obj.refresh_from_db()
+        self.assertEqual((a.latitude, a.longitude), (vendor.latitude, vendor.longitude))
+        self.assertIsNotNone(a.latitude)
+        # The spatial index heard about it
+        self.assertIn(a.pk, [pk for pk, _ in nearest(HousingListing.objects.all(), float(a.latitude), float(a.longitude), 0.1)])
+
+        # The next listing at that address comes from the cache
+        c = self.listing('Ngong Road Block B')
+        self.assertEqual(self.pipeline.drain()['cached'], 1)
+        self.assertEqual(len(self.geocoder.calls), 1)
+        c.refresh_from_db()
+        self.assertEqual(c.latitude, a.latitude)
+
+    def test_saves_wait_for_the_sweep_without_a_worker(self):
+        with mock.patch('geocoding.signals.worker_running', return_value=False):
+            listing = self.listing('Ngong Road, Block B')
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.pipeline.sweep(), 1)
+        self.pipeline.drain()
+        listing.refresh_from_db()
+        self.assertIsNotNone(listing.latitude)
+
+    def test_lookups_respect_the_rate_limit(self):
+        for n in range(4):
+            self.listing(f'{n} University Way')
+        self.pipeline.drain()
+        self.assertEqual(len(self.geocoder.calls), 4)
+        self.assertEqual(self.clock.now, 3.0)
+
+    def test_not_found_is_cached_until_it_expires(self):
+        listing = self.listing('Nowhere Lane')
+        self.assertEqual(self.pipeline.drain()['not_found'], 1)
+        cached = GeocodedAddress.objects.get(key=normalize_address('Nowhere Lane', 'Nairobi'))
+        self.assertFalse(cached.found)
+        self.assertGreater(cached.expires_at, timezone.now())
+
+        # Sweeps leave it be while the answer holds
+        self.assertEqual(self.pipeline.sweep(), 0)
+        self.assertEqual(len(self.queue), 0)
+
+        cached.expires_at = timezone.now() - datetime.timedelta(seconds=1)
+        cached.save()
+        self.pipeline.sweep()
+        self.assertEqual(self.pipeline.drain()['looked_up'], 1)
+        listing.refresh_from_db()
+        self.assertIsNone(listing.latitude)
+
+    def test_sweeps_move_past_addresses_never_found(self):
+        with mock.patch('geocoding.signals.transaction.on_commit'):
+            for n in range(3):
+                self.listing(f'Nowhere {n}')
+            located = self.listing('Haile Selassie Avenue')
+        GeocodedAddress.objects.bulk_create([
+            GeocodedAddress(key=normalize_address(f'Nowhere {n}', 'Nairobi'), query=f'Nowhere {n}',
+                            expires_at=timezone.now() + datetime.timedelta(hours=1))
+            for n in range(3)
+        ])
+        self.assertEqual(self.pipeline.sweep(limit=2), 0)
+        self.assertEqual(self.pipeline.sweep(limit=2), 1)
+        self.pipeline.drain()
+        located.refresh_from_db()
+        self.assertIsNotNone(located.latitude)
+        # Exhausted sources start over
+        self.assertEqual(self.pipeline.sweep(limit=2), 0)
+        self.assertEqual(self.pipeline._swept['housing'], 0)
+
+    def test_failures_are_retried_then_dropped_uncached(self):
+        self.pipeline.geocoder = FailingGeocoder()
+        self.listing('Kenyatta Avenue')
+        with self.assertLogs('geocoding.pipeline', 'WARNING'):
+            stats = self.pipeline.drain()
+        self.assertEqual(stats['failed'], MAX_ATTEMPTS)
+        self.assertEqual(len(self.pipeline.geocoder.calls), MAX_ATTEMPTS)
+        self.assertFalse(GeocodedAddress.objects.exists())
+        self.assertEqual(len(self.queue), 0)
+
+    def test_listings_changed_meanwhile_are_left_alone(self):
+        placed = self.listing('Moi Avenue')
+        moved = self.listing('Moi Avenue')
+        placed.latitude, placed.longitude = -1.28, 36.82
+        placed.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.address = 'Tom Mboya Street'
+            moved.save()
+        self.assertEqual(self.pipeline.drain()['applied'], 1)
+        placed.refresh_from_db()
+        self.assertEqual(float(placed.latitude), -1.28)
+        moved.refresh_from_db()
+        self.assertEqual(
+            (float(moved.latitude), float(moved.longitude)),
+            FakeGeocoder().geocode('Tom Mboya Street, Nairobi, Kenya'),
+        )
+
+    def test_unexpected_nominatim_response_is_a_failure(self):
+        for body in ([{'display_name': 'Nairobi'}], {'error': 'Unable to geocode'}, [None]):
+            with self.subTest(body=body), mock.patch('utils.geocoder.requests.get') as get:
+                get.return_value.json.return_value = body
+                with self.assertRaises(GeocodingError):
+                    NominatimGeocoder().geocode('Moi Avenue, Nairobi, Kenya')
+
+    @override_settings(GEOCODER_BACKEND='utils.geocoder.FakeGeocoder')
+    def test_geocode_pending_command(self):
+        with mock.patch('geocoding.signals.worker_running', return_value=False):
+            HousingListing.objects.create(
+                user=self.user, title='Room', description='Room', price=5000, address='Kindaruma Road',
+                bedrooms=1, bathrooms=1, available_from=datetime.date.today(),
+                contact_name='Landlord', contact_phone='0700000000',
+            )
+        out = StringIO()
+        call_command('geocode_pending', '--rate=1000', stdout=out)
+        self.assertIn('1 listings, 1 distinct addresses', out.getvalue())
+        self.assertIn('1 listings located', out.getvalue())
+        self.assertFalse(HousingListing.objects.filter(latitude__isnull=True).exists())
@@ -2,6 +2,7 @@
 from django import forms
 from django.utils import timezone
 from .models import HousingListing, FavoriteListing
+from .spatial import MAX_RADIUS_KM, parse_bbox, parse_point
 
 class HousingListingForm(forms.ModelForm):
     # Custom date input
@@ -241,9 +242,24 @@ class HousingSearchForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'})
     )
     
+    # Spatial search (see housing/spatial.py)
+    near = forms.CharField(required=False, widget=forms.HiddenInput)
+    radius = forms.FloatField(
+        required=False,
+        min_value=0.1,
+        max_value=MAX_RADIUS_KM,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Radius (km)',
+            'step': '0.5',
+        })
+    )
+    bbox = forms.CharField(required=False, widget=forms.HiddenInput)
+
     sort_by = forms.ChoiceField(
         required=False,
         choices=[
+            ('distance', 'Nearest First'),
             ('newest', 'Newest First'),
             ('price_low', 'Price: Low to High'),
             ('price_high', 'Price: High to Low'),
@@ -251,4 +267,24 @@ class HousingSearchForm(forms.Form):
         ],
         widget=forms.Select(attrs={'class': 'form-select'}),
         initial='newest'
-    )
\ No newline at end of file
+    )
+
+    def clean_near(self):
+        """``lat,lng`` -> ``(lat, lng)``"""
+        near = self.cleaned_data.get('near')
+        if not near:
+            return None
+        try:
+            return parse_point(near)
+        except ValueError:
+            raise forms.ValidationError("Use latitude,longitude, e.g. -1.2921,36.8219")
+
+    def clean_bbox(self):
+        """``min_lng,min_lat,max_lng,max_lat`` -> ``BBox``"""
+        bbox = self.cleaned_data.get('bbox')
+        if not bbox:
+            return None
+        try:
+            return parse_bbox(bbox)
+        except ValueError:
+            raise forms.ValidationError("Use min_lng,min_lat,max_lng,max_lat")
@@ -0,0 +1,42 @@
+# Spatial index for radius and bounding-box search (see housing/spatial.py)
+
+from django.conf import settings
+from django.db import migrations, models
+
+RTREE_TABLE = 'housing_listing_rtree'
+
+
+def create_rtree(apps, schema_editor):
+    # R*Tree is SQLite-only; elsewhere housing_latlng_idx serves the bounding box
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) "
+        "SELECT id, latitude, latitude, longitude, longitude FROM housing_housinglisting "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )
+
+
+def drop_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('housing', '0004_alter_housinglisting_latitude_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='housinglisting',
+            index=models.Index(fields=['latitude', 'longitude'], name='housing_latlng_idx'),
+        ),
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -52,12 +52,8 @@ class HousingListing(models.Model):
         blank=True,
         help_text="Longitude coordinate (optional)"
     )
-    def save(self, *args, **kwargs):
-        """Override save to automatically geocode address if coordinates are missing"""
-        if (self.address and self.city) and (not self.latitude or not self.longitude):
-            # We'll implement geocoding later
-            pass
-        super().save(*args, **kwargs)
+    # Listings saved without coordinates are geocoded in the background
+    # from their address and city (geocoding/pipeline.py)
     
     # Pricing
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
@@ -114,6 +110,10 @@ class HousingListing(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Bounding-box fallback where there is no R*Tree (see housing/spatial.py)
+            models.Index(fields=['latitude', 'longitude'], name='housing_latlng_idx'),
+        ]
         verbose_name = "Housing Listing"
         verbose_name_plural = "Housing Listings"
     
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import HousingListing
+from utils.tiles import track_tiles
+
+from .spatial import has_rtree, index_listing, reset_rtree, unindex_listing
+from .tiles import housing_tiles
+
+# Saves that can't have moved the listing
+UNMOVED_UPDATES = {'views_count', 'updated_at'}
+
+
+@receiver(post_save, sender=HousingListing)
+def update_spatial_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the R*Tree in step with the listing's coordinates."""
+    if raw or (update_fields is not None and set(update_fields) <= UNMOVED_UPDATES):
+        return
+    if has_rtree():
+        index_listing(instance)
+
+
+@receiver(post_delete, sender=HousingListing)
+def remove_from_spatial_index(sender, instance, **kwargs):
+    if has_rtree():
+        unindex_listing(instance.pk)
+
+
+@receiver(post_migrate)
+def refresh_spatial_index(sender, **kwargs):
+    """The R*Tree may have just been created or dropped."""
+    reset_rtree()
+
+
+track_tiles(housing_tiles, HousingListing, ignored_updates=UNMOVED_UPDATES)
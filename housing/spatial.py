@@ -0,0 +1,204 @@
+# housing/spatial.py
+"""
+Radius and bounding-box search over housing listings.
+
+Listings with coordinates are kept in an SQLite R*Tree
+(``housing_listing_rtree``, one point per listing) by the signals in
+``housing/signals.py``. A search is two steps:
+
+1. the bounding box is answered by the R*Tree, so only listings inside it
+   are read, however many there are elsewhere;
+2. for ``near`` searches, exact great-circle (haversine) distances are
+   computed for those candidates in one vectorized numpy pass, listings
+   outside the radius dropped and the rest sorted nearest first
+   (``nearest``). ``within_radius`` does the same refinement in SQL, for
+   querysets that are filtered, sorted or counted further.
+
+Without the R*Tree (another database, or SQLite built without it) step 1
+becomes a range filter on the ``(latitude, longitude)`` index. A PostGIS
+backend can replace ``within_bbox`` later without touching the callers.
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from django.db import OperationalError, ProgrammingError, connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+RTREE_TABLE = 'housing_listing_rtree'
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+DEFAULT_RADIUS_KM = 2.0
+MAX_RADIUS_KM = 50.0
+
+
+@dataclass(frozen=True)
+class BBox:
+    min_lat: float
+    min_lng: float
+    max_lat: float
+    max_lng: float
+
+    def __post_init__(self):
+        if not (-90 <= self.min_lat <= self.max_lat <= 90 and -180 <= self.min_lng <= self.max_lng <= 180):
+            raise ValueError(f'Invalid bounding box: {self}')
+
+    @classmethod
+    def around(cls, lat, lng, radius_km):
+        """Smallest box containing every point within ``radius_km`` of ``(lat, lng)``."""
+        dlat = radius_km / KM_PER_DEGREE
+        # Degrees of longitude shrink towards the poles
+        cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+        dlng = 180.0 if cos_lat < 1e-9 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+        return cls(
+            max(lat - dlat, -90.0), max(lng - dlng, -180.0),
+            min(lat + dlat, 90.0), min(lng + dlng, 180.0),
+        )
+
+    def intersection(self, other):
+        """The overlap of two boxes, or None if they don't overlap."""
+        try:
+            return BBox(
+                max(self.min_lat, other.min_lat), max(self.min_lng, other.min_lng),
+                min(self.max_lat, other.max_lat), min(self.max_lng, other.max_lng),
+            )
+        except ValueError:
+            return None
+
+
+def parse_point(value):
+    """``"lat,lng"`` -> ``(lat, lng)``; raises ValueError."""
+    lat, lng = (float(part) for part in value.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(value)
+    return lat, lng
+
+
+def parse_bbox(value):
+    """``"min_lng,min_lat,max_lng,max_lat"`` (GeoJSON order) -> ``BBox``; raises ValueError."""
+    min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    return BBox(min_lat, min_lng, max_lat, max_lng)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Distances in km from ``(lat, lng)`` to every point of the ``lats``/``lngs`` arrays."""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+_has_rtree = None
+
+
+def has_rtree():
+    global _has_rtree
+    if _has_rtree is None:
+        try:
+            _has_rtree = connection.vendor == 'sqlite' and RTREE_TABLE in connection.introspection.table_names()
+        except (OperationalError, ProgrammingError):
+            return False
+    return _has_rtree
+
+
+def reset_rtree():
+    """Forget whether the R*Tree exists (used after migrations)."""
+    global _has_rtree
+    _has_rtree = None
+
+
+def index_listing(listing):
+    """Add, move or drop ``listing``'s point in the R*Tree."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RTREE_TABLE} WHERE id = %s', [listing.pk])
+        point = listing.coordinates()
+        if point is not None:
+            lat, lng = point
+            cursor.execute(
+                f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) VALUES (%s, %s, %s, %s, %s)',
+                [listing.pk, lat, lat, lng, lng],
+            )
+
+
+def unindex_listing(listing_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RTREE_TABLE} WHERE id = %s', [listing_id])
+
+
+def rebuild_rtree():
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RTREE_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) '
+            'SELECT id, latitude, latitude, longitude, longitude FROM housing_housinglisting '
+            'WHERE latitude IS NOT NULL AND longitude IS NOT NULL'
+        )
+
+
+def within_bbox(queryset, bbox):
+    """Narrow a ``HousingListing`` queryset to listings inside ``bbox``."""
+    if has_rtree():
+        # Stored boxes are rounded outwards to 32-bit floats, so nothing on
+        # the edge is lost; callers needing exactness refine afterwards.
+        ids = RawSQL(
+            f'SELECT id FROM {RTREE_TABLE} WHERE max_lat >= %s AND min_lat <= %s AND max_lng >= %s AND min_lng <= %s',
+            [bbox.min_lat, bbox.max_lat, bbox.min_lng, bbox.max_lng],
+        )
+        return queryset.filter(pk__in=ids)
+    return queryset.filter(
+        latitude__range=(bbox.min_lat, bbox.max_lat),
+        longitude__range=(bbox.min_lng, bbox.max_lng),
+    )
+
+
+def distance_km(lat, lng):
+    """Haversine distance in km from ``(lat, lng)`` to a row's coordinates, as a database expression."""
+    lat1 = math.radians(lat)
+    lat2 = Radians(Cast('latitude', FloatField()))
+    lng2 = Radians(Cast('longitude', FloatField()))
+    a = (
+        Power(Sin((lat2 - Value(lat1)) / Value(2.0)), 2)
+        + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin((lng2 - Value(math.radians(lng))) / Value(2.0)), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a))
+
+
+def within_radius(queryset, lat, lng, radius_km, bbox=None):
+    """
+    Narrow a ``HousingListing`` queryset to listings within ``radius_km``
+    of ``(lat, lng)`` (and inside ``bbox``, if given), annotated with
+    ``distance_km``: the box through ``within_bbox``, the circle in SQL.
+    """
+    box = BBox.around(lat, lng, radius_km)
+    if bbox is not None:
+        box = box.intersection(bbox)
+        if box is None:
+            return queryset.none()
+    return within_bbox(queryset, box).annotate(distance_km=distance_km(lat, lng)).filter(distance_km__lte=radius_km)
+
+
+def nearest(queryset, lat, lng, radius_km, bbox=None):
+    """
+    ``[(listing id, distance in km)]`` for listings in ``queryset`` within
+    ``radius_km`` of ``(lat, lng)`` (and inside ``bbox``, if given),
+    nearest first.
+    """
+    box = BBox.around(lat, lng, radius_km)
+    if bbox is not None:
+        box = box.intersection(bbox)
+        if box is None:
+            return []
+    rows = list(within_bbox(queryset, box).order_by().values_list('pk', 'latitude', 'longitude'))
+    if not rows:
+        return []
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    coords = np.array([(float(row[1]), float(row[2])) for row in rows], dtype=np.float64)
+    distances = haversine_km(lat, lng, coords[:, 0], coords[:, 1])
+    inside = distances <= radius_km
+    ids, distances = ids[inside], distances[inside]
+    # Ties broken by id so pages are stable
+    order = np.lexsort((ids, distances))
+    return [(int(ids[i]), float(distances[i])) for i in order]
@@ -1,3 +1,222 @@
+import datetime
+import math
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+
+from utils.tiles import project, tiles_for_point
+
+from .models import HousingListing
+from .spatial import KM_PER_DEGREE, BBox, RTREE_TABLE, has_rtree, haversine_km, nearest, within_bbox, within_radius
+from .tiles import housing_tiles
+
+CAMPUS = (-1.2795, 36.8163)
+
+
+def offset(km_north, km_east):
+    """A point ``km_north``/``km_east`` of campus."""
+    lat = CAMPUS[0] + km_north / KM_PER_DEGREE
+    lng = CAMPUS[1] + km_east / (KM_PER_DEGREE * math.cos(math.radians(CAMPUS[0])))
+    return round(lat, 8), round(lng, 8)
+
+
+class SpatialSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='landlord', password='pw')
+        cls.listings = {}
+        for title, point in [
+            ('Hostel next door', offset(0.5, 0)),
+            ('Bedsitter down the road', offset(0, -1.5)),
+            # Inside the 2 km box, outside the 2 km circle
+            ('Corner flat', offset(1.8, 1.8)),
+            ('Flat in town', offset(5, 0)),
+            ('Unmapped room', None),
+        ]:
+            cls.listings[title] = HousingListing.objects.create(
+                user=cls.user, title=title, description='Student housing', price=8000,
+                bedrooms=1, bathrooms=1, available_from=datetime.date.today(),
+                contact_name='Landlord', contact_phone='0700000000',
+                latitude=point and point[0], longitude=point and point[1],
+            )
+
+    def titles(self, ids):
+        by_id = {listing.pk: title for title, listing in self.listings.items()}
+        return [by_id[pk] for pk, _ in ids]
+
+    def test_nearest_refines_box_to_circle(self):
+        results = nearest(HousingListing.objects.all(), *CAMPUS, 2)
+        self.assertEqual(self.titles(results), ['Hostel next door', 'Bedsitter down the road'])
+        self.assertAlmostEqual(results[0][1], 0.5, places=2)
+        self.assertAlmostEqual(results[1][1], 1.5, places=2)
+
+    def test_within_radius_agrees_with_nearest(self):
+        queryset = within_radius(HousingListing.objects.order_by('pk'), *CAMPUS, 2)
+        self.assertEqual(
+            sorted((listing.pk, round(listing.distance_km, 6)) for listing in queryset),
+            sorted((pk, round(km, 6)) for pk, km in nearest(HousingListing.objects.all(), *CAMPUS, 2)),
+        )
+        # The circle is applied in SQL, not as a list of ids
+        sql, params = queryset.query.sql_with_params()
+        self.assertNotIn(self.listings['Hostel next door'].pk, params)
+
+    def test_haversine(self):
+        # Nairobi to Mombasa
+        distance = haversine_km(-1.2921, 36.8219, [-4.0435], [39.6682])[0]
+        self.assertAlmostEqual(distance, 440, delta=5)
+
+    def test_bbox_around_widens_longitude_away_from_equator(self):
+        box = BBox.around(60.0, 10.0, 10)
+        self.assertAlmostEqual(box.max_lat - 60.0, 10 / KM_PER_DEGREE)
+        self.assertGreater(box.max_lng - 10.0, 1.9 * (box.max_lat - 60.0))
+
+    def test_index_follows_moves_and_deletes(self):
+        listing = self.listings['Flat in town']
+        listing.latitude, listing.longitude = offset(0.2, 0)
+        listing.save()
+        results = nearest(HousingListing.objects.all(), *CAMPUS, 2)
+        self.assertEqual(self.titles(results)[0], 'Flat in town')
+        listing.delete()
+        self.assertNotIn(listing.pk, [pk for pk, _ in nearest(HousingListing.objects.all(), *CAMPUS, 2)])
+
+    def test_housing_home_near_and_bbox(self):
+        response = self.client.get(reverse('housing:home'), {'near': '%s,%s' % CAMPUS, 'radius': '2'})
+        self.assertEqual(
+            [listing.title for listing in response.context['listings']],
+            ['Hostel next door', 'Bedsitter down the road'],
+        )
+        self.assertEqual(response.context['total_listings'], 2)
+        self.assertContains(response, '0.5 km away')
+
+        # Other filters still apply inside the radius
+        self.listings['Hostel next door'].is_available = False
+        self.listings['Hostel next door'].save()
+        response = self.client.get(reverse('housing:home'), {'near': '%s,%s' % CAMPUS, 'radius': '2'})
+        self.assertEqual([listing.title for listing in response.context['listings']], ['Bedsitter down the road'])
+
+        south, west = offset(-1, -2)
+        north, east = offset(3, 2)
+        response = self.client.get(reverse('housing:home'), {'bbox': f'{west},{south},{east},{north}'})
+        self.assertEqual(
+            {listing.title for listing in response.context['listings']},
+            {'Bedsitter down the road', 'Corner flat'},
+        )
+
+        # Other sorts keep the circle and the distances
+        response = self.client.get(reverse('housing:home'), {'near': '%s,%s' % CAMPUS, 'radius': '2', 'sort_by': 'price_low'})
+        self.assertEqual([listing.title for listing in response.context['listings']], ['Bedsitter down the road'])
+        self.assertContains(response, '1.5 km away')
+
+        response = self.client.get(reverse('housing:home'), {'near': 'campus'})
+        self.assertEqual(response.context['total_listings'], 4)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'the R*Tree is SQLite-only')
+    def test_bbox_reads_the_rtree_not_the_table(self):
+        self.assertTrue(has_rtree())
+        queryset = within_bbox(HousingListing.objects.filter(is_available=True), BBox.around(*CAMPUS, 2))
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any(RTREE_TABLE in step and 'VIRTUAL TABLE INDEX' in step for step in plan), plan)
+        self.assertFalse(any(step.startswith('SCAN housing_housinglisting') for step in plan), plan)
+
+
+MOMBASA = (-4.0435, 39.6682)
+
+
+class MapTileTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='landlord', password='pw')
+        cls.listings = [
+            HousingListing.objects.create(
+                user=cls.user, title=title, description='Student housing', price=8000,
+                bedrooms=1, bathrooms=1, available_from=datetime.date.today(),
+                contact_name='Landlord', contact_phone='0700000000',
+                latitude=point[0], longitude=point[1],
+            )
+            for title, point in [
+                ('Hostel A', offset(0, 0)), ('Hostel B', offset(0.02, 0)), ('Hostel C', offset(0, 0.02)),
+                ('Beach flat', MOMBASA),
+            ]
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def tile_url(self, z, point):
+        _, x, y = tiles_for_point(*point)[z]
+        return reverse('housing:map_tile', args=[z, x, y])
+
+    def get_tile(self, z, point, **headers):
+        return self.client.get(self.tile_url(z, point), headers=headers)
+
+    def test_nearby_listings_cluster_until_max_zoom(self):
+        lats, lngs = zip(*[(float(l.latitude), float(l.longitude)) for l in self.listings[:3]])
+        cols, rows = project(lats, lngs, 12 + 3)
+        self.assertEqual(len(set(zip(cols, rows))), 1, 'fixture points should share a cell')
+
+        features = self.get_tile(12, CAMPUS).json()['features']
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]['properties']['count'], 3)
+        west, south, east, north = features[0]['properties']['bbox']
+        self.assertLess(west, east)
+        self.assertLess(south, north)
+
+        features = self.get_tile(18, CAMPUS).json()['features']
+        self.assertEqual(sorted(f['properties']['title'] for f in features), ['Hostel A', 'Hostel B', 'Hostel C'])
+        self.assertEqual(features[0]['properties']['url'], reverse('housing:listing_detail', args=[features[0]['properties']['id']]))
+
+        # A tile never includes a neighbour's points
+        self.assertEqual(self.get_tile(12, MOMBASA).json()['features'][0]['properties']['title'], 'Beach flat')
+
+    def test_etag_revalidation(self):
+        response = self.get_tile(12, CAMPUS)
+        etag = response['ETag']
+        self.assertEqual(self.get_tile(12, CAMPUS, if_none_match=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[0].is_available = False
+            self.listings[0].save()
+        response = self.get_tile(12, CAMPUS, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features'][0]['properties']['count'], 2)
+
+    def test_changes_drop_only_touched_tiles(self):
+        campus_key = housing_tiles._key(*tiles_for_point(*CAMPUS)[12])
+        beach_key = housing_tiles._key(*tiles_for_point(*MOMBASA)[12])
+        self.get_tile(12, CAMPUS)
+        self.get_tile(12, MOMBASA)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[0].increment_views()
+        self.assertIsNotNone(cache.get(campus_key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[1].title = 'Hostel B (renovated)'
+            self.listings[1].save()
+            # A tile rebuilt before the commit is dropped with the rest
+            self.get_tile(12, CAMPUS)
+            self.assertIsNotNone(cache.get(campus_key))
+        self.assertIsNone(cache.get(campus_key))
+        self.assertIsNotNone(cache.get(beach_key))
+
+        # Moving a listing drops the tiles at both ends
+        self.get_tile(12, CAMPUS)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[2].latitude, self.listings[2].longitude = MOMBASA
+            self.listings[2].save()
+        self.assertIsNone(cache.get(campus_key))
+        self.assertIsNone(cache.get(beach_key))
+        self.assertEqual(len(self.get_tile(18, MOMBASA).json()['features']), 2)
 
-# Create your tests here.
+    def test_tile_out_of_range(self):
+        self.assertEqual(self.client.get(reverse('housing:map_tile', args=[2, 4, 0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('housing:map_tile', args=[20, 0, 0])).status_code, 404)
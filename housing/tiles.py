@@ -0,0 +1,27 @@
+# housing/tiles.py
+"""Available housing listings as clustered map tiles (see utils/tiles.py)."""
+from django.urls import reverse
+
+from utils.tiles import TileLayer
+
+from .models import HousingListing
+from .spatial import within_bbox
+
+
+def _describe(row):
+    pk, _, _, title, price = row
+    return {
+        'id': pk,
+        'title': title,
+        'price': str(price),
+        'url': reverse('housing:listing_detail', args=[pk]),
+    }
+
+
+housing_tiles = TileLayer(
+    'housing',
+    get_queryset=lambda: HousingListing.objects.filter(is_available=True),
+    within=within_bbox,
+    fields=['title', 'price'],
+    describe=_describe,
+)
@@ -9,6 +9,7 @@ urlpatterns = [
     path('listing/<int:pk>/', views.listing_detail, name='listing_detail'),
     path('cities/', views.cities_list, name='cities'),
     path('city/<str:city>/', views.city_listings, name='city_listings'),
+    path('tiles/<int:z>/<int:x>/<int:y>.json', views.map_tile, name='map_tile'),
     
     # User views (require login)
     path('create/', views.create_listing, name='create_listing'),
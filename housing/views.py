@@ -5,6 +5,10 @@ from django.db.models import Q, Count
 from django.core.paginator import Paginator
 from .models import HousingListing, FavoriteListing
 from .forms import HousingListingForm, HousingSearchForm
+from .spatial import DEFAULT_RADIUS_KM, nearest, within_bbox, within_radius
+from .tiles import housing_tiles
+from django.views.decorators.http import require_safe
+from utils.tiles import tile_response
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import CreateView, UpdateView
 
@@ -32,6 +36,8 @@ def housing_home(request):
     """Home page showing all housing listings"""
     form = HousingSearchForm(request.GET or None)
     listings = HousingListing.objects.filter(is_available=True)
+    # [(listing id, km)] nearest first, for ?near= searches
+    by_distance = None
     
     if form.is_valid():
         search = form.cleaned_data.get('search')
@@ -44,6 +50,8 @@ def housing_home(request):
         furnished = form.cleaned_data.get('furnished')
         utilities_included = form.cleaned_data.get('utilities_included')
         sort_by = form.cleaned_data.get('sort_by', 'newest')
+        near = form.cleaned_data.get('near')
+        bbox = form.cleaned_data.get('bbox')
         
         # Apply filters
         if search:
@@ -81,6 +89,16 @@ def housing_home(request):
         elif utilities_included == 'no':
             listings = listings.filter(utilities_included=False)
         
+        # Spatial filters: index-backed box, then exact distances
+        if near:
+            radius = form.cleaned_data.get('radius') or DEFAULT_RADIUS_KM
+            if sort_by in ('', 'distance'):
+                by_distance = nearest(listings, *near, radius, bbox=bbox)
+            # Annotated with distance_km, for the other sorts and featured listings
+            listings = within_radius(listings, *near, radius, bbox=bbox)
+        elif bbox:
+            listings = within_bbox(listings, bbox)
+        
         # Apply sorting
         if sort_by == 'newest':
             listings = listings.order_by('-created_at')
@@ -95,9 +113,21 @@ def housing_home(request):
     featured_listings = listings.filter(is_featured=True)[:3]
     
     # Pagination
-    paginator = Paginator(listings, 12)  # 12 listings per page
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if by_distance is not None:
+        # Page through the distance-sorted ids, then load just that page
+        page_obj = Paginator(by_distance, 12).get_page(page_number)
+        found = listings.in_bulk([pk for pk, _ in page_obj.object_list])
+        page_listings = []
+        for pk, distance in page_obj.object_list:
+            if pk in found:
+                found[pk].distance_km = distance
+                page_listings.append(found[pk])
+        page_obj.object_list = page_listings
+        total_listings = len(by_distance)
+    else:
+        page_obj = Paginator(listings, 12).get_page(page_number)  # 12 listings per page
+        total_listings = listings.count()
     
     # Get cities for filter (distinct cities with listings)
     cities = HousingListing.objects.filter(is_available=True).values_list('city', flat=True).distinct()
@@ -107,7 +137,7 @@ def housing_home(request):
         'featured_listings': featured_listings,
         'form': form,
         'cities': sorted(cities),
-        'total_listings': listings.count(),
+        'total_listings': total_listings,
     }
     return render(request, 'housing/home.html', context)
 
@@ -352,4 +382,10 @@ def city_listings(request, city):
         'total_listings': listings.count(),
     }
     
-    return render(request, 'housing/city_listings.html', context)
\ No newline at end of file
+    return render(request, 'housing/city_listings.html', context)
+
+
+@require_safe
+def map_tile(request, z, x, y):
+    """Clustered GeoJSON tile of available listings for the map"""
+    return tile_response(request, housing_tiles, z, x, y)
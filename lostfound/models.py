@@ -5,6 +5,7 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
 import datetime
 from cloudinary.models import CloudinaryField
+from utils.images import image_url
 
 class LostFoundItem(models.Model):
     STATUS_CHOICES = [
@@ -69,7 +70,5 @@ class LostFoundItem(models.Model):
     @property
     def image_url(self):
         """Return image URL with optimized size"""
-        if self.image:
-            # Return optimized version (300x300 cropped)
-            return self.image.build_url(width=300, height=300, crop="fill")
-        return None
\ No newline at end of file
+        # Optimized version (300x300 cropped), built without the SDK
+        return image_url(self.image, 300, 300)
\ No newline at end of file
@@ -1,12 +1,32 @@
 # marketplace/admin.py
 from django.contrib import admin
+from django.urls import reverse
 from django.utils.html import format_html
+from django.utils import timezone
 from django.utils.safestring import mark_safe
-from .models import Product, Category
+from .models import Product, Category, ExpiryRun, SavedSearch
+from utils.images import image_url
+from .counters import touch
+from .signals import products_updated
+
+class PossibleDuplicateFilter(admin.SimpleListFilter):
+    title = 'possible duplicate'
+    parameter_name = 'duplicate'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Yes'), ('no', 'No')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(fingerprint__duplicate_of__isnull=False)
+        if self.value() == 'no':
+            return queryset.exclude(fingerprint__duplicate_of__isnull=False)
+        return queryset
 
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['title', 'seller', 'price', 'is_sold', 'created_at', 'status_badge', 'image_preview']
-    list_filter = ['is_sold', 'category', 'condition', 'created_at']
+    list_display = ['title', 'seller', 'price', 'is_sold', 'created_at', 'views_count', 'status_badge', 'duplicate_flag', 'image_preview']
+    list_filter = ['is_sold', PossibleDuplicateFilter, 'category', 'condition', 'created_at']
+    list_select_related = ['seller', 'fingerprint']
     search_fields = ['title', 'description', 'seller__username']
     list_editable = ['is_sold']
     actions = ['mark_as_sold', 'mark_as_available', 'delete_selected']
@@ -18,38 +38,75 @@ class ProductAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
     
     def image_preview(self, obj):
-        try:
-            if obj.image:
-                # Get the URL – works for both FileField and CloudinaryField
-                if hasattr(obj.image, 'url'):
-                    url = obj.image.url
-                else:
-                    url = obj.image  # assume it's a string URL
-                if url:
-                    # Use mark_safe with an f-string to avoid format_html issues
-                    return mark_safe(f'<img src="{url}" width="50" height="50" style="object-fit: cover;" />')
-        except Exception:
-            pass
+        # Built from the stored public_id; no SDK call per row
+        url = image_url(obj.image, 50, 50)
+        if url:
+            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', url)
         return mark_safe('<span class="text-muted">No image</span>')
     image_preview.short_description = 'Preview'
     
+    def duplicate_flag(self, obj):
+        # Set by marketplace/duplicates.py when the listing was created or edited
+        fingerprint = getattr(obj, 'fingerprint', None)
+        if fingerprint is None or fingerprint.duplicate_of_id is None:
+            return ''
+        url = reverse('admin:marketplace_product_change', args=[fingerprint.duplicate_of_id])
+        return format_html(
+            '<a href="{}" class="badge bg-warning text-dark" title="{} differing bits">Near-duplicate of #{}</a>',
+            url, fingerprint.distance, fingerprint.duplicate_of_id,
+        )
+    duplicate_flag.short_description = 'Duplicate'
+    
     def mark_as_sold(self, request, queryset):
-        queryset.update(is_sold=True)
-        self.message_user(request, f'{queryset.count()} products marked as sold.')
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        seller_ids = set(queryset.values_list('seller_id', flat=True))
+        product_ids = list(queryset.values_list('pk', flat=True))
+        count = queryset.update(is_sold=True, updated_at=timezone.now())
+        # Recounts and drops the dependent caches
+        touch(category_ids, seller_ids)
+        products_updated.send(sender=Product, product_ids=product_ids)
+        self.message_user(request, f'{count} products marked as sold.')
     
     def mark_as_available(self, request, queryset):
-        queryset.update(is_sold=False)
-        self.message_user(request, f'{queryset.count()} products marked as available.')
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        seller_ids = set(queryset.values_list('seller_id', flat=True))
+        product_ids = list(queryset.values_list('pk', flat=True))
+        count = queryset.update(is_sold=False, updated_at=timezone.now())
+        # Recounts and drops the dependent caches
+        touch(category_ids, seller_ids)
+        products_updated.send(sender=Product, product_ids=product_ids)
+        self.message_user(request, f'{count} products marked as available.')
     
     mark_as_sold.short_description = "Mark selected as sold"
     mark_as_available.short_description = "Mark selected as available"
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'product_count']
-    
-    def product_count(self, obj):
-        return obj.product_set.count()
-    product_count.short_description = 'Number of Products'
+    list_display = ['name', 'active_product_count']
+
+admin.site.register(Product, ProductAdmin)
+
+@admin.register(ExpiryRun)
+class ExpiryRunAdmin(admin.ModelAdmin):
+    list_display = ['until', 'full', 'expired_count', 'scanned', 'chunks', 'sellers_affected', 'duration_ms', 'finished_at']
+    list_filter = ['full']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'category', 'term_count', 'created_at']
+    list_select_related = ['user', 'category']
+    search_fields = ['name', 'query', 'user__username']
+
+    # Keywords live in the term index, which only alerts.save_search() writes
+    def has_add_permission(self, request):
+        return False
 
-admin.site.register(Product, ProductAdmin)
\ No newline at end of file
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,234 @@
+# marketplace/alerts.py
+"""
+Saved searches and new-listing alerts.
+
+A saved search is a browse-page filter set (keywords, category, condition,
+price range). Rather than re-running every saved search against each new
+listing, the searches themselves are indexed: each keyword is a
+``SavedSearchTerm`` row, so a new listing is matched by
+
+1. looking up its words in the term index, counting hits per saved search
+   (a search's last keyword is a prefix, as in the browse search, so it is
+   looked up by every leading part of the listing's words);
+2. loading only those searches (plus keyword-less ones) whose category,
+   condition and price range admit the listing;
+3. keeping the ones whose every keyword was hit.
+
+Matches are queued as ``SearchAlert`` rows. ``send_digests()`` (the
+``send_search_digests`` command, run from cron) mails each user one digest
+of everything queued since the last run, so a burst of postings is one
+email, not one per listing.
+"""
+import logging
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .categories import category_registry
+from .facets import normalize_filters
+from .models import Product, SavedSearch, SavedSearchTerm, SearchAlert
+from .search import MIN_TERM_LENGTH
+
+logger = logging.getLogger(__name__)
+
+MAX_SAVED_SEARCHES = 20  # per user
+MAX_PRODUCT_TERMS = 500  # distinct words of a listing looked up in the term index
+MAX_KEYWORD_LENGTH = 30  # characters per saved keyword, so a listing's prefixes stay few
+MAX_DIGEST_ITEMS = 20  # listings shown per digest; the rest are counted
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SavedSearchError(ValueError):
+    pass
+
+
+def _words(text):
+    return {w.lower() for w in _WORD_RE.findall(text or '') if len(w) >= MIN_TERM_LENGTH}
+
+
+def product_terms(product):
+    """Words a listing can be found by: the fields the search backends index."""
+    words = _words(product.title) | _words(product.description) | _words(product.seller.username)
+    return sorted(words)[:MAX_PRODUCT_TERMS]
+
+
+def word_prefixes(words):
+    """
+    Every shorter leading part of ``words`` a saved prefix keyword could
+    be: ``MIN_TERM_LENGTH`` to ``MAX_KEYWORD_LENGTH`` characters long. The
+    words themselves are left out; they are looked up whole anyway.
+    """
+    prefixes = {
+        word[:end]
+        for word in words
+        for end in range(MIN_TERM_LENGTH, min(len(word) - 1, MAX_KEYWORD_LENGTH) + 1)
+    }
+    return sorted(prefixes.difference(words))
+
+
+def search_terms(query):
+    """``(term, prefix)`` pairs for normalized keywords; the last one is a prefix, as in ``match_expression``."""
+    words = query.split()
+    if not words:
+        return []
+    whole = set(words[:-1])
+    # A whole-word occurrence elsewhere is the stricter condition
+    last = [] if words[-1] in whole else [(words[-1], True)]
+    return sorted((term, False) for term in whole) + last
+
+
+def describe(filters):
+    """Human-readable name for a ``normalize_filters`` dict."""
+    parts = []
+    if filters['search']:
+        parts.append(f"“{filters['search']}”")
+    category = category_registry.get(filters['category']) if filters['category'] is not None else None
+    if category:
+        parts.append(f'in {category.name}')
+    if filters['condition']:
+        parts.append(dict(Product.CONDITION_CHOICES)[filters['condition']].lower())
+    if filters['min_price'] is not None:
+        parts.append(f"from KSh {filters['min_price']}")
+    if filters['max_price'] is not None:
+        parts.append(f"up to KSh {filters['max_price']}")
+    return ' '.join(parts)[:100]
+
+
+@transaction.atomic
+def save_search(user, params):
+    """Save the browse filters in ``params`` (request GET/POST) for ``user``."""
+    filters = normalize_filters(params)
+    if not any(value is not None for value in filters.values()):
+        raise SavedSearchError('Choose some keywords or filters before saving a search.')
+    if user.saved_searches.count() >= MAX_SAVED_SEARCHES:
+        raise SavedSearchError(f'You can keep up to {MAX_SAVED_SEARCHES} saved searches.')
+    category = None
+    if filters['category'] is not None:
+        category = category_registry.get(filters['category'])
+        # Saving without it would widen the search to every category
+        if category is None:
+            raise SavedSearchError('That category no longer exists.')
+    terms = search_terms(filters['search'] or '')
+    if any(len(term) > MAX_KEYWORD_LENGTH for term, _ in terms):
+        raise SavedSearchError(f'Keywords can be up to {MAX_KEYWORD_LENGTH} characters long.')
+    saved = SavedSearch.objects.create(
+        user=user,
+        name=describe(filters),
+        query=filters['search'] or '',
+        category=category,
+        condition=filters['condition'] or '',
+        min_price=filters['min_price'],
+        max_price=filters['max_price'],
+        term_count=len(terms),
+    )
+    SavedSearchTerm.objects.bulk_create([
+        SavedSearchTerm(saved_search=saved, term=term, prefix=prefix) for term, prefix in terms
+    ])
+    return saved
+
+
+def match_product(product):
+    """Queue alerts for every saved search ``product`` satisfies; returns how many."""
+    if not product.is_active:
+        return 0
+    words = product_terms(product)
+    hits = Counter(
+        SavedSearchTerm.objects.filter(Q(term__in=words) | Q(term__in=word_prefixes(words), prefix=True))
+        .values_list('saved_search_id', flat=True)
+    )
+    candidates = (
+        SavedSearch.objects.filter(Q(pk__in=list(hits)) | Q(term_count=0))
+        .filter(Q(category__isnull=True) | Q(category_id=product.category_id))
+        .filter(Q(condition='') | Q(condition=product.condition))
+        .filter(Q(min_price__isnull=True) | Q(min_price__lte=product.price))
+        .filter(Q(max_price__isnull=True) | Q(max_price__gte=product.price))
+        .exclude(user_id=product.seller_id)
+        .values_list('pk', 'term_count')
+    )
+    matched = [pk for pk, term_count in candidates if hits[pk] == term_count]
+    SearchAlert.objects.bulk_create(
+        [SearchAlert(saved_search_id=pk, product=product) for pk in matched], ignore_conflicts=True
+    )
+    return len(matched)
+
+
+def queue_alerts(product):
+    """Match ``product`` once the transaction that created it commits."""
+    def match():
+        try:
+            match_product(product)
+        except Exception:
+            # Never fail a listing over its alerts
+            logger.exception('Matching saved searches for product %s failed', product.pk)
+    transaction.on_commit(match)
+
+
+def _digest(user, alerts, domain):
+    base = f'https://{domain}'
+    items = [
+        {
+            'title': alert.product.title,
+            'price': alert.product.price,
+            'search': alert.saved_search.name,
+            'url': base + reverse('marketplace:product_detail', args=[alert.product_id]),
+        }
+        for alert in alerts[:MAX_DIGEST_ITEMS]
+    ]
+    context = {
+        'user': user,
+        'items': items,
+        'more': max(len(alerts) - MAX_DIGEST_ITEMS, 0),
+        'manage_url': base + reverse('marketplace:saved_searches'),
+    }
+    subject = f"{len(alerts)} new listing{'' if len(alerts) == 1 else 's'} match your saved searches"
+    body = render_to_string('marketplace/email/search_digest.txt', context)
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+def send_digests(now=None):
+    """
+    Email each user one digest of their queued alerts. Alerts are claimed
+    before sending, so concurrent runs never send the same one twice.
+    Returns the number of emails sent.
+    """
+    now = now or timezone.now()
+    pending = (
+        SearchAlert.objects.filter(sent_at__isnull=True)
+        .select_related('saved_search__user', 'product')
+        .order_by('saved_search__user_id', 'created_at')
+    )
+    by_user = defaultdict(list)
+    for alert in pending:
+        by_user[alert.saved_search.user].append(alert)
+    if not by_user:
+        return 0
+
+    domain = Site.objects.get_current().domain
+    connection = get_connection()
+    sent = 0
+    for user, alerts in by_user.items():
+        ids = [alert.pk for alert in alerts]
+        # Claim; a concurrent run that got here first wins
+        if SearchAlert.objects.filter(pk__in=ids, sent_at__isnull=True).update(sent_at=now) != len(ids):
+            continue
+        # Listings that sold or expired since they were queued aren't worth a mail
+        alerts = [alert for alert in alerts if alert.product.is_active]
+        if not alerts or not user.email:
+            continue
+        try:
+            connection.send_messages([_digest(user, alerts, domain)])
+        except Exception:
+            logger.exception('Sending search digest to user %s failed', user.pk)
+            SearchAlert.objects.filter(pk__in=ids).update(sent_at=None)
+            continue
+        sent += 1
+    return sent
@@ -0,0 +1,168 @@
+# marketplace/api.py
+"""
+Read-only JSON API over marketplace listings (``/marketplace/api/v1/``).
+
+``GET products/`` takes the same filters as the browse page (category,
+condition, min_price, max_price, q/search) plus:
+
+* ``cursor`` - opaque keyset cursor from the previous page's ``next``
+  (search results, which are ranked, page with ``page`` instead); an
+  unreadable cursor is a 400;
+* ``limit`` - page size, 1 to ``MAX_LIMIT``;
+* ``fields`` - comma separated subset of ``FIELDS`` for sparse payloads.
+
+Responses carry a strong ETag built from the query string and the
+``products``/``categories`` change counters in ``marketplace/versions.py``.
+A matching ``If-None-Match`` gets a 304 straight from those counters,
+without touching the products table.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+from .facets import apply_filters, normalize_filters
+from .models import Product
+from .pagination import PAGE_SIZE, InvalidCursor, decode_cursor, paginate_keyset
+from .search import search_page
+from .versions import get_version
+
+API_VERSION = 1
+MAX_LIMIT = 100
+
+# name -> (columns to load, how to render it)
+FIELDS = {
+    'id': (['id'], lambda product, request: product.pk),
+    'title': (['title'], lambda product, request: product.title),
+    'description': (['description'], lambda product, request: product.description),
+    'price': (['price'], lambda product, request: str(product.price)),
+    'condition': (['condition'], lambda product, request: product.condition),
+    'category': (
+        ['category__id', 'category__name'],
+        lambda product, request: {'id': product.category.pk, 'name': product.category.name},
+    ),
+    'seller': (
+        ['seller__id', 'seller__username'],
+        lambda product, request: {'id': product.seller.pk, 'username': product.seller.username},
+    ),
+    'image': (['image'], lambda product, request: product.image.url if product.image else None),
+    'created_at': (['created_at'], lambda product, request: product.created_at.isoformat()),
+    'expires_at': (
+        ['expires_at'],
+        lambda product, request: product.expires_at.isoformat() if product.expires_at else None,
+    ),
+    'url': (
+        ['id'],
+        lambda product, request: request.build_absolute_uri(
+            reverse('marketplace:product_detail', args=[product.pk])
+        ),
+    ),
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_login_required(view):
+    """Like ``login_required``, but answers 401 instead of redirecting to the login page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error('Authentication required.', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _requested_fields(params):
+    raw = params.get('fields')
+    if not raw:
+        return list(FIELDS)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(FIELDS)}.")
+    return list(dict.fromkeys(names))
+
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit must be an integer.')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _cursor(params):
+    # The browse pages fall back to page one; an API client following
+    # ``next`` must hear about a broken cursor instead of looping
+    cursor = params.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            raise BadRequest('Invalid cursor; follow the previous response\'s "next" URL.')
+    return cursor or None
+
+
+def products_etag(request):
+    versions = [get_version('products'), get_version('categories')]
+    query = sorted((key, sorted(values)) for key, values in request.GET.lists())
+    # Absolute URLs in the body depend on the host
+    payload = json.dumps([API_VERSION, versions, request.get_host(), query], separators=(',', ':'))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+@require_safe
+@api_login_required
+@condition(etag_func=products_etag)
+def products(request):
+    try:
+        fields = _requested_fields(request.GET)
+        limit = _limit(request.GET)
+        cursor = _cursor(request.GET)
+    except BadRequest as error:
+        return _error(str(error), 400)
+
+    filters = normalize_filters(request.GET)
+    columns = {column for name in fields for column in FIELDS[name][0]}
+    # Join only the relations the requested fields read
+    related = [name for name in ('seller', 'category') if any(c.startswith(name + '__') for c in columns)]
+    queryset = apply_filters(
+        Product.objects.filter(is_sold=False).select_related(*related), filters, skip=('search',)
+    )
+    # Ordering and the keyset cursor need these whatever was asked for
+    queryset = queryset.only('id', 'created_at', *columns)
+
+    if filters['search']:
+        page = search_page(queryset, filters['search'], request.GET.get('page'), per_page=limit)
+    else:
+        page = paginate_keyset(queryset, cursor, per_page=limit)
+
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        params.pop('page', None)
+        params.update(page.next_params)
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+    response = JsonResponse({
+        'version': API_VERSION,
+        'results': [
+            {name: FIELDS[name][1](product, request) for name in fields}
+            for product in page.object_list
+        ],
+        'next': next_url,
+    })
+    # Clients must revalidate, which is what the ETag makes cheap
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Cookie'
+    return response
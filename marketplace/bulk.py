@@ -0,0 +1,143 @@
+# marketplace/bulk.py
+"""
+Bulk actions over a seller's own listings.
+
+Each action is one transaction of set-based statements over
+``Product.objects.filter(seller=user, pk__in=ids)``. Ownership is part of
+the ``WHERE`` clause, so ids belonging to someone else simply match
+nothing. ``update()`` skips ``auto_now``, so every statement sets
+``updated_at`` itself; the recommender finds changed listings by it. Counter and cache maintenance runs once per batch
+(``counters.batched()``), not once per row.
+"""
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
+
+from accounts.models import SellerProfile
+
+from . import counters
+from .models import Product
+from .signals import products_updated
+
+MAX_IDS = 200
+MIN_PERCENT = Decimal('-90')
+MAX_PERCENT = Decimal('500')
+MAX_EXTEND_DAYS = 30
+
+
+class BulkActionError(ValueError):
+    pass
+
+
+def _ids(raw_ids):
+    ids = set()
+    for value in raw_ids:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            raise BulkActionError(f'Invalid product id: {value!r}')
+    if not ids:
+        raise BulkActionError('Select at least one listing.')
+    if len(ids) > MAX_IDS:
+        raise BulkActionError(f'At most {MAX_IDS} listings per action.')
+    return ids
+
+
+def _touched(queryset):
+    """Categories whose counts an update of ``queryset`` can move."""
+    return set(queryset.values_list('category_id', flat=True).distinct())
+
+
+def mark_sold(user, queryset, params):
+    queryset = queryset.filter(is_sold=False)
+    counters.touch(_touched(queryset), [user.pk])
+    return queryset.update(is_sold=True, updated_at=timezone.now()), 0
+
+
+def relist(user, queryset, params):
+    """Put sold or expired listings back on sale, as far as the seller's quota allows."""
+    candidates = queryset.filter(Q(is_sold=True) | Q(expired=True))
+    # Hold the profile row so concurrent posts can't race us for the same slots
+    profile, _ = SellerProfile.objects.select_for_update().get_or_create(user=user)
+    counters.recount_sellers([user.pk])
+    profile.refresh_from_db(fields=['active_listing_count', 'max_listings', 'listing_duration_days'])
+    slots = max(profile.max_listings - profile.active_listing_count, 0)
+    wanted = list(candidates.order_by('-created_at', '-id').values_list('pk', 'category_id'))
+    chosen = wanted[:slots]
+    if not chosen:
+        return 0, len(wanted)
+    counters.touch({category_id for _, category_id in chosen}, [user.pk])
+    updated = Product.objects.filter(pk__in=[pk for pk, _ in chosen]).update(
+        is_sold=False, expired=False, updated_at=timezone.now(),
+        expires_at=timezone.now() + timedelta(days=profile.listing_duration_days),
+    )
+    return updated, len(wanted) - updated
+
+
+def change_price(user, queryset, params):
+    try:
+        percent = Decimal(params.get('percent', ''))
+    except InvalidOperation:
+        raise BulkActionError('percent must be a number.')
+    if not percent.is_finite() or not MIN_PERCENT <= percent <= MAX_PERCENT:
+        raise BulkActionError(f'percent must be between {MIN_PERCENT} and {MAX_PERCENT}.')
+    factor = (Decimal(100) + percent) / Decimal(100)
+    counters.touch(_touched(queryset), [user.pk])  # facet price buckets move
+    new_price = ExpressionWrapper(
+        F('price') * Value(factor), output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+    return queryset.update(price=Round(new_price, 2), updated_at=timezone.now()), 0
+
+
+def extend_expiry(user, queryset, params):
+    try:
+        days = int(params.get('days', ''))
+    except ValueError:
+        raise BulkActionError('days must be a whole number.')
+    if not 1 <= days <= MAX_EXTEND_DAYS:
+        raise BulkActionError(f'days must be between 1 and {MAX_EXTEND_DAYS}.')
+    # Expired listings come back through relist, which checks the quota
+    queryset = queryset.filter(is_sold=False, expired=False)
+    now = timezone.now()
+    counters.touch((), [user.pk])
+    return queryset.update(
+        expires_at=Greatest(Coalesce(F('expires_at'), Value(now)), Value(now)) + timedelta(days=days),
+        updated_at=now,
+    ), 0
+
+
+def delete(user, queryset, params):
+    # Goes through the ORM collector so search index rows, favorites and
+    # neighbours are cleaned up; counters are batched.
+    deleted, by_model = queryset.delete()
+    return by_model.get(Product._meta.label, 0), 0
+
+
+ACTIONS = {
+    'sold': mark_sold,
+    'relist': relist,
+    'price': change_price,
+    'extend': extend_expiry,
+    'delete': delete,
+}
+
+
+def run_bulk_action(user, action, ids, params=None):
+    """
+    Apply ``action`` to the listings in ``ids`` that ``user`` owns.
+    Returns ``(changed, skipped)``; raises ``BulkActionError`` for bad input.
+    """
+    if action not in ACTIONS:
+        raise BulkActionError(f"Unknown action {action!r}. Choose one of: {', '.join(ACTIONS)}.")
+    ids = _ids(ids)
+    with transaction.atomic(), counters.batched():
+        queryset = Product.objects.filter(seller=user, pk__in=ids)
+        owned = list(queryset.values_list('pk', flat=True))
+        result = ACTIONS[action](user, queryset, params or {})
+        if action != 'delete':  # deletes send post_delete
+            products_updated.send(sender=Product, product_ids=owned)
+    return result
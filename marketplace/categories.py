@@ -0,0 +1,114 @@
+# marketplace/categories.py
+"""
+Process-local category registry.
+
+Categories are read on almost every marketplace page and change almost
+never, so each worker keeps them in memory and looks them up by id, name or
+slug without touching the database. Edits bump a ``categories`` version
+counter in the shared cache backend (``marketplace/versions.py``) once
+they commit; each worker compares its copy against that counter at most
+once per ``CHECK_INTERVAL`` and reloads when it has moved, so an admin edit
+reaches every worker within about a second.
+
+``active_product_count`` moves with every listing, so it is left out of
+the registry; pages showing it read the live counts with ``with_counts()``.
+"""
+import copy
+import threading
+import time
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import Category
+from .versions import bump_version, get_version
+
+VERSION_NAME = 'categories'
+
+
+class CategoryRegistry:
+    CHECK_INTERVAL = 1.0  # seconds between version checks
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+        self._categories = []
+        self._by_id = {}
+        self._by_key = {}
+
+    def _load(self, version):
+        categories = list(Category.objects.defer('active_product_count').order_by('pk'))
+        by_key = {}
+        for category in categories:
+            by_key.setdefault(category.name.casefold(), category)
+            by_key.setdefault(slugify(category.name), category)
+        # Swap everything in at once so readers never see a half-built registry
+        self._categories = categories
+        self._by_id = {category.pk: category for category in categories}
+        self._by_key = by_key
+        self._version = version
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.CHECK_INTERVAL:
+            return
+        version = get_version(VERSION_NAME)
+        # A None version means there is no usable cache backend; reload every interval
+        if version != self._version or version is None:
+            with self._lock:
+                self._load(version)
+        self._checked_at = now
+
+    def all(self):
+        """All categories, in creation order."""
+        self._refresh()
+        return self._categories
+
+    def get(self, pk):
+        """Category with primary key ``pk``, or None."""
+        self._refresh()
+        try:
+            return self._by_id.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_name(self, name):
+        """Category whose name (case-insensitive) or slug is ``name``, or None."""
+        self._refresh()
+        name = (name or '').strip()
+        return self._by_key.get(name.casefold()) or self._by_key.get(slugify(name))
+
+    def with_counts(self, categories=None):
+        """
+        Copies of ``categories`` (all by default) carrying their current
+        ``active_product_count``, read in one query.
+        """
+        if categories is None:
+            categories = self.all()
+            counts = Category.objects.all()
+        else:
+            counts = Category.objects.filter(pk__in=[category.pk for category in categories])
+        counts = dict(counts.values_list('pk', 'active_product_count'))
+        copies = []
+        for category in categories:
+            category = copy.copy(category)
+            category.active_product_count = counts.get(category.pk, 0)
+            copies.append(category)
+        return copies
+
+    def clear(self):
+        """Drop this process's copy; the next lookup reloads."""
+        self._checked_at = None
+        self._version = None
+
+
+category_registry = CategoryRegistry()
+
+
+def invalidate_categories():
+    """Tell every worker its categories are stale, once the current transaction commits."""
+    def invalidate():
+        bump_version(VERSION_NAME)
+        category_registry.clear()
+    transaction.on_commit(invalidate)
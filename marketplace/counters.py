@@ -0,0 +1,292 @@
+# marketplace/counters.py
+"""
+Denormalized listing counters.
+
+``Category.active_product_count`` and ``SellerProfile.active_listing_count``
+are kept correct incrementally: every product save/delete works out how the
+product moved between "active in category X / for seller Y" states and
+applies the difference with a single ``F()`` update, so concurrent writers
+never overwrite each other's counts. The "before" state is read from the
+row, locked, as the save starts (``lock_tracked_state()``), so stale
+instances can't apply the same transition twice. Bulk ``QuerySet.update()`` calls bypass
+signals; code that does them calls ``recount_categories()`` and
+``recount_sellers()`` for the rows it touched, and the
+``reconcile_category_counts`` command repairs any drift that slips through.
+
+The seller count is also the listing quota: ``reserve_listing_slot()``
+takes a slot with one conditional ``UPDATE`` before a new listing is saved.
+
+Inside a ``batched()`` block none of that happens per row: affected
+categories and sellers are collected and recounted once when the block
+ends, and the dependent caches dropped once the transaction commits.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import SellerProfile
+
+from .models import Category, Product
+from .policy import invalidate_seller_policies
+from .storefront import invalidate_storefronts
+from .facets import invalidate_facets
+from .suggest import invalidate_suggestions
+
+_batch = threading.local()
+
+
+def _state(category_id, is_sold, expired):
+    """The category a product counts towards, or None if it isn't active."""
+    if category_id is None or is_sold or expired:
+        return None
+    return category_id
+
+
+def _seller_state(seller_id, is_sold, expired):
+    """The seller whose quota a product uses, or None if it isn't active."""
+    if seller_id is None or is_sold or expired:
+        return None
+    return seller_id
+
+
+def snapshot(product):
+    """Remember the saved values of the tracked fields for the next save."""
+    product._loaded_state = {name: getattr(product, name) for name in Product.TRACKED_FIELDS}
+
+
+def _saved_state(product, update_fields=None):
+    state = {name: getattr(product, name) for name in Product.TRACKED_FIELDS}
+    if update_fields is not None:
+        # Fields left out of update_fields still hold their old values in the database
+        old = getattr(product, '_loaded_state', {})
+        for name in Product.TRACKED_FIELDS:
+            if name.removesuffix('_id') not in update_fields and name not in update_fields and name in old:
+                state[name] = old[name]
+    return state
+
+
+def lock_tracked_state(product):
+    """
+    Lock ``product``'s row for the rest of the transaction and take its
+    tracked fields from it as the state the coming save replaces. Two
+    stale copies saved at once then move the counters once, not twice.
+    Returns whether the row exists.
+    """
+    row = (
+        Product._base_manager.select_for_update()
+        .filter(pk=product.pk)
+        .values(*Product.TRACKED_FIELDS)
+        .order_by('pk')
+        .first()
+    )
+    if row is not None:
+        product._loaded_state = row
+    return row is not None
+
+
+def in_batch():
+    return getattr(_batch, 'touched', None) is not None
+
+
+@contextmanager
+def batched():
+    """
+    Defer counter and cache maintenance for product changes made inside the
+    block to one recount per table at the end. Nested blocks join the
+    outer one. Code doing ``QuerySet.update()`` inside reports the rows it
+    touched with ``touch()``.
+    """
+    if in_batch():
+        yield
+        return
+    _batch.touched = {'categories': set(), 'sellers': set()}
+    try:
+        yield
+        touched = _batch.touched
+    finally:
+        _batch.touched = None
+    _flush(touched['categories'], touched['sellers'])
+
+
+def touch(category_ids=(), seller_ids=()):
+    """Record categories/sellers whose counts a bulk change may have moved."""
+    if in_batch():
+        _batch.touched['categories'].update(i for i in category_ids if i is not None)
+        _batch.touched['sellers'].update(i for i in seller_ids if i is not None)
+    else:
+        _flush(set(category_ids), set(seller_ids))
+
+
+def _flush(category_ids, seller_ids):
+    if category_ids:
+        recount_categories(category_ids)
+    if seller_ids:
+        recount_sellers(seller_ids)
+        invalidate_seller_policies(seller_ids)
+        invalidate_storefronts(seller_ids)
+    if category_ids or seller_ids:
+        invalidate_facets()
+        invalidate_suggestions()
+
+
+def apply_category_deltas(deltas):
+    """Apply ``{category_id: delta}`` with one F() update per category that changed."""
+    for category_id, delta in deltas.items():
+        if delta:
+            Category.objects.filter(pk=category_id).update(
+                active_product_count=F('active_product_count') + delta
+            )
+
+
+def apply_seller_deltas(deltas):
+    """Apply ``{seller_id: delta}`` to the sellers' active listing counts."""
+    for seller_id, delta in deltas.items():
+        if delta:
+            SellerProfile.objects.filter(user_id=seller_id).update(
+                active_listing_count=F('active_listing_count') + delta
+            )
+
+
+def reserve_listing_slot(product):
+    """
+    Take one of the seller's listing slots for the not yet saved ``product``.
+
+    One conditional UPDATE (``active_listing_count < max_listings``), so two
+    concurrent submissions can't both squeeze into the last slot. Returns
+    False when the seller is at their limit. Call it in the same transaction
+    as ``product.save()`` so a failed save gives the slot back.
+    """
+    def take():
+        return SellerProfile.objects.filter(
+            user_id=product.seller_id, active_listing_count__lt=F('max_listings')
+        ).update(active_listing_count=F('active_listing_count') + 1)
+
+    reserved = take()
+    if not reserved and not SellerProfile.objects.filter(user_id=product.seller_id).exists():
+        # Accounts created before profiles were added to the signup flow
+        SellerProfile.objects.get_or_create(user_id=product.seller_id)
+        recount_sellers([product.seller_id])
+        reserved = take()
+    # product_saved() must not count the listing a second time
+    product._quota_reserved = bool(reserved)
+    return bool(reserved)
+
+
+def product_saved(product, created, update_fields=None):
+    """post_save hook: move the product's contribution between categories."""
+    old = getattr(product, '_loaded_state', None)
+    new = _saved_state(product, update_fields)
+    reserved = getattr(product, '_quota_reserved', False)
+    product._quota_reserved = False
+    if in_batch() and not reserved:
+        states = [new] + ([old] if old else [])
+        touch([state.get('category_id') for state in states], [state.get('seller_id') for state in states])
+        product._loaded_state = new
+        return
+    if not created and old is None:
+        # Instance didn't come from the database, so we don't know what it replaced
+        recount_categories([product.category_id])
+        recount_sellers([product.seller_id])
+        invalidate_seller_policies([product.seller_id])
+        invalidate_storefronts([product.seller_id])
+        snapshot(product)
+        return
+
+    deltas = Counter()
+    seller_deltas = Counter()
+    if not created:
+        before = _state(old.get('category_id'), old.get('is_sold'), old.get('expired'))
+        if before is not None:
+            deltas[before] -= 1
+        before = _seller_state(old.get('seller_id'), old.get('is_sold'), old.get('expired'))
+        if before is not None:
+            seller_deltas[before] -= 1
+    after = _state(new['category_id'], new['is_sold'], new['expired'])
+    if after is not None:
+        deltas[after] += 1
+    after = _seller_state(new['seller_id'], new['is_sold'], new['expired'])
+    if after is not None and not (created and reserved):
+        seller_deltas[after] += 1
+    apply_category_deltas(deltas)
+    apply_seller_deltas(seller_deltas)
+    # The seller's active listing count (quota) and storefront may have moved too
+    sellers = {old.get('seller_id'), new['seller_id']} if old else {new['seller_id']}
+    invalidate_seller_policies(sellers)
+    invalidate_storefronts(sellers)
+    product._loaded_state = new
+
+
+def product_deleted(product):
+    """post_delete hook: an active product leaving takes its count with it."""
+    old = getattr(product, '_loaded_state', None) or {
+        name: getattr(product, name) for name in Product.TRACKED_FIELDS
+    }
+    if in_batch():
+        touch([old.get('category_id')], [old.get('seller_id')])
+        return
+    category_id = _state(old.get('category_id'), old.get('is_sold'), old.get('expired'))
+    if category_id is not None:
+        apply_category_deltas({category_id: -1})
+    seller_id = _seller_state(old.get('seller_id'), old.get('is_sold'), old.get('expired'))
+    if seller_id is not None:
+        apply_seller_deltas({seller_id: -1})
+    invalidate_seller_policies([old.get('seller_id')])
+    invalidate_storefronts([old.get('seller_id')])
+
+
+def _active_count_subquery(field='category', ref='pk'):
+    return Subquery(
+        Product.objects.filter(**{field: OuterRef(ref)}, is_sold=False, expired=False)
+        .order_by()
+        .values(field)
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+
+
+def recount_categories(category_ids=None):
+    """
+    Recompute counts from the product table for ``category_ids`` (all if None)
+    and return how many categories had drifted. One UPDATE, however many categories.
+    """
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=set(category_ids))
+    drifted = (
+        categories.annotate(actual=Coalesce(_active_count_subquery(), Value(0)))
+        .exclude(active_product_count=F('actual'))
+        .values_list('pk', flat=True)
+    )
+    drifted = list(drifted)
+    if drifted:
+        Category.objects.filter(pk__in=drifted).update(
+            active_product_count=Coalesce(_active_count_subquery(), Value(0))
+        )
+    return len(drifted)
+
+
+def recount_sellers(user_ids=None):
+    """
+    Recompute ``SellerProfile.active_listing_count`` for ``user_ids`` (all if
+    None) and return how many profiles had drifted.
+    """
+    profiles = SellerProfile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=set(user_ids))
+    actual = Coalesce(_active_count_subquery('seller', 'user_id'), Value(0))
+    drifted = list(
+        profiles.annotate(actual=actual)
+        .exclude(active_listing_count=F('actual'))
+        .values_list('pk', flat=True)
+    )
+    if drifted:
+        SellerProfile.objects.filter(pk__in=drifted).update(
+            active_listing_count=Coalesce(_active_count_subquery('seller', 'user_id'), Value(0))
+        )
+        invalidate_seller_policies(
+            SellerProfile.objects.filter(pk__in=drifted).values_list('user_id', flat=True)
+        )
+    return len(drifted)
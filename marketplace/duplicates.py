@@ -0,0 +1,193 @@
+# marketplace/duplicates.py
+"""
+Near-duplicate listing detection.
+
+Every listing created or edited through the site gets two 64-bit
+similarity hashes:
+
+* a SimHash of its title and description (word and word-pair features),
+  which changes in only a few bits when a few words change;
+* a difference hash (dHash) of its uploaded image, computed locally with
+  Pillow before the upload goes to Cloudinary, which survives re-encoding,
+  resizing and small crops.
+
+Two listings are near-duplicates when either hash differs in at most
+``MAX_DISTANCE`` bits. Each hash is split into ``len(BAND_WIDTHS)`` bands
+(locality-sensitive hashing): by pigeonhole, hashes that close share at
+least one band exactly, so candidates come from one indexed lookup of
+``FingerprintBucket`` keys, limited to active listings of the same seller
+or category, and only those few are compared bit by bit. The catalogue
+size never enters the lookup.
+
+Matches are recorded on ``ProductFingerprint.duplicate_of`` and flagged in
+the product admin; the listing itself is not blocked.
+"""
+import hashlib
+import logging
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image, UnidentifiedImageError
+
+from .models import FingerprintBucket, ProductFingerprint
+from .suggest import normalize
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# LSH bands, in bits, covering the hash; one bucket key per band
+BAND_WIDTHS = (11, 11, 11, 11, 10, 10)
+MAX_DISTANCE = len(BAND_WIDTHS) - 1  # the most differing bits banding is guaranteed to catch
+MIN_TEXT_FEATURES = 6  # below this a SimHash says too little to flag on
+
+TEXT, IMAGE = 0, 1
+
+_MASK = (1 << HASH_BITS) - 1
+
+
+def to_db(value):
+    """Unsigned 64-bit hash -> signed value for a BigIntegerField."""
+    if value is None:
+        return None
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+def from_db(value):
+    return None if value is None else value & _MASK
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _features(text):
+    words = normalize(text).split()
+    return Counter(words + [f'{a} {b}' for a, b in zip(words, words[1:])])
+
+
+def text_fingerprint(text):
+    """``(simhash, feature count)`` of ``text``."""
+    features = _features(text)
+    if not features:
+        return 0, 0
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), 'big') for f in features],
+        dtype='>u8',
+    )
+    bits = np.unpackbits(hashes.view(np.uint8)).reshape(-1, HASH_BITS).astype(np.int64)
+    weights = np.fromiter(features.values(), dtype=np.int64, count=len(features))
+    votes = weights @ (bits * 2 - 1)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), 'big'), len(features)
+
+
+def image_fingerprint(file):
+    """dHash of an uploaded image file, or None if it isn't a readable image."""
+    if not file:
+        return None
+    position = file.tell()
+    try:
+        with Image.open(file) as image:
+            # Let JPEG decode at reduced size; the hash only needs 9x8 pixels
+            image.draft('L', (64, 64))
+            pixels = list(image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        file.seek(position)
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] < pixels[row * 9 + col + 1])
+    return value
+
+
+def bucket_keys(text_hash, image_hash=None):
+    """LSH bucket keys of a fingerprint: (kind, band, band bits) packed into one int."""
+    keys = []
+    for kind, value in ((TEXT, text_hash), (IMAGE, image_hash)):
+        if value is None:
+            continue
+        for band, width in enumerate(BAND_WIDTHS):
+            keys.append((kind << 16) | (band << 12) | (value & ((1 << width) - 1)))
+            value >>= width
+    return keys
+
+
+def find_duplicate(product, text_hash, image_hash=None):
+    """
+    Closest active listing of the same seller or category within
+    ``MAX_DISTANCE`` bits of either hash, as ``(product id, distance)``;
+    ``(None, None)`` if there is none. ``text_hash`` may be None.
+    """
+    keys = bucket_keys(text_hash, image_hash)
+    if not keys:
+        return None, None
+    candidates = (
+        FingerprintBucket.objects.filter(key__in=keys, product__is_sold=False, product__expired=False)
+        .filter(Q(product__seller_id=product.seller_id) | Q(product__category_id=product.category_id))
+        .exclude(product_id=product.pk)
+        .values_list(
+            'product_id', 'product__seller_id', 'product__fingerprint__text_hash', 'product__fingerprint__image_hash'
+        )
+        .distinct()
+    )
+    best = None
+    for pk, seller_id, other_text, other_image in candidates:
+        distances = []
+        if text_hash is not None and other_text is not None:
+            distances.append(hamming(text_hash, from_db(other_text)))
+        if image_hash is not None and other_image is not None:
+            distances.append(hamming(image_hash, from_db(other_image)))
+        distance = min(distances, default=HASH_BITS)
+        if distance > MAX_DISTANCE:
+            continue
+        # Closest first, then the seller's own listings, then the oldest
+        rank = (distance, seller_id != product.seller_id, pk)
+        if best is None or rank < best[0]:
+            best = rank, pk
+    if best is None:
+        return None, None
+    return best[1], best[0][0]
+
+
+KEEP = object()
+
+
+@transaction.atomic
+def fingerprint_listing(product, image_hash=KEEP):
+    """
+    (Re)compute ``product``'s fingerprint, flag its closest near-duplicate and
+    index it for later listings. ``image_hash`` is the new upload's
+    ``image_fingerprint()``; by default the stored one is kept while the
+    listing still has an image. Returns the duplicate's id or None.
+    """
+    text_hash, feature_count = text_fingerprint(f'{product.title}\n{product.description}')
+    if image_hash is KEEP:
+        stored = ProductFingerprint.objects.filter(product=product).values_list('image_hash', flat=True).first()
+        image_hash = from_db(stored) if product.image else None
+    # Too little text to tell listings apart; only the image counts
+    match_text = text_hash if feature_count >= MIN_TEXT_FEATURES else None
+    duplicate_id, distance = find_duplicate(product, match_text, image_hash)
+
+    ProductFingerprint.objects.update_or_create(product=product, defaults={
+        'text_hash': to_db(match_text),
+        'image_hash': to_db(image_hash),
+        'duplicate_of_id': duplicate_id,
+        'distance': distance,
+    })
+    FingerprintBucket.objects.filter(product=product).delete()
+    FingerprintBucket.objects.bulk_create([
+        FingerprintBucket(product=product, key=key) for key in bucket_keys(match_text, image_hash)
+    ])
+    return duplicate_id
+
+
+def check_listing(product, image_hash=KEEP):
+    """``fingerprint_listing`` for the request path: a failure is logged, never raised."""
+    try:
+        return fingerprint_listing(product, image_hash)
+    except Exception:
+        logger.exception('Fingerprinting product %s failed', product.pk)
+        return None
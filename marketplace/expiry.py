@@ -0,0 +1,204 @@
+# marketplace/expiry.py
+"""
+Listing expiry engine.
+
+Listings whose ``expires_at`` has passed are flipped to ``expired=True`` in
+bounded chunks, each in its own short transaction, instead of one big
+``UPDATE`` that holds the write lock for the whole table. Chunks walk the
+partial ``product_expiry_idx`` in ``(expires_at, id)`` order.
+
+Each run records the previous run's watermark as its ``since`` (the
+``ExpiryRun`` table doubles as the run log and the metrics history; each
+run prunes it to the newest ``KEEP_RUNS`` rows, never dropping the
+watermark run), but still walks every live listing with ``expires_at``
+up to now, not just those past the watermark. The partial index holds
+only live listings, so what lies behind the watermark is exactly what an
+earlier run could not have caught - a listing marked available or
+unsold after its expiry, or an ``expires_at`` edited into the past - and
+costs nothing when there is none. A ``full`` run is logged without a
+``since``.
+
+The engine runs from ``manage.py expire_products`` or from
+``ExpiryScheduler``, a daemon thread a long-running worker can start with
+``start_scheduler()``.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .counters import recount_categories, recount_sellers
+from .facets import invalidate_facets
+from .models import ExpiryRun, Product
+from .policy import invalidate_seller_policies
+from .signals import products_updated
+from .storefront import invalidate_storefronts
+from .suggest import invalidate_suggestions
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+LOCK_KEY = 'marketplace:expiry:lock'
+LOCK_TIMEOUT = 15 * 60  # seconds; a crashed run can't block expiry for longer than this
+KEEP_RUNS = 500  # ExpiryRun rows kept as history
+
+
+def _watermark_run():
+    return ExpiryRun.objects.filter(finished_at__isnull=False).order_by('-until').first()
+
+
+def _watermark():
+    last = _watermark_run()
+    return last.until if last else None
+
+
+def prune_runs(keep=None):
+    """Delete all but the newest ``keep`` (``KEEP_RUNS``) runs, keeping the watermark run; returns how many went."""
+    keep = KEEP_RUNS if keep is None else keep
+    oldest_kept = ExpiryRun.objects.order_by('-until', '-pk').values_list('until', flat=True)[keep - 1:keep]
+    oldest_kept = list(oldest_kept)
+    if not oldest_kept:
+        return 0
+    stale = ExpiryRun.objects.filter(until__lt=oldest_kept[0])
+    watermark = _watermark_run()
+    if watermark is not None:
+        stale = stale.exclude(pk=watermark.pk)
+    deleted, _ = stale.delete()
+    return deleted
+
+
+def _live_expired(now):
+    return Product.objects.filter(expired=False, is_sold=False, expires_at__lte=now)
+
+
+def _expire_chunk(now, after, chunk_size):
+    """Expire the next chunk after the ``(expires_at, id)`` cursor ``after``; return (rows, count)."""
+    queryset = _live_expired(now)
+    if after is not None:
+        expires_at, pk = after
+        queryset = queryset.filter(Q(expires_at__gt=expires_at) | Q(id__gt=pk), expires_at__gte=expires_at)
+    with transaction.atomic():
+        rows = list(
+            queryset.order_by('expires_at', 'id')
+            .values_list('id', 'expires_at', 'category_id', 'seller_id')[:chunk_size]
+        )
+        if not rows:
+            return rows, 0
+        # Re-check the state: a listing may have sold since it was read
+        count = Product.objects.filter(
+            pk__in=[row[0] for row in rows], expired=False, is_sold=False
+        ).update(expired=True, updated_at=timezone.now())
+        # update() skips the save signals, so fix the counters ourselves
+        recount_categories({row[2] for row in rows})
+        recount_sellers({row[3] for row in rows})
+        products_updated.send(sender=Product, product_ids=[row[0] for row in rows])
+    return rows, count
+
+
+def run_expiry(full=False, chunk_size=CHUNK_SIZE, now=None):
+    """
+    Expire every live listing whose ``expires_at`` has passed and return the
+    finished ``ExpiryRun``, logged as incremental from the previous run's
+    watermark unless ``full`` or there is no previous run.
+    """
+    now = now or timezone.now()
+    since = None if full else _watermark()
+    run = ExpiryRun.objects.create(since=since, until=now, full=since is None)
+    started = time.monotonic()
+
+    after = None
+    sellers = set()
+    while True:
+        rows, count = _expire_chunk(now, after, chunk_size)
+        if not rows:
+            break
+        run.chunks += 1
+        run.scanned += len(rows)
+        run.expired_count += count
+        sellers.update(row[3] for row in rows)
+        after = rows[-1][1], rows[-1][0]
+        if len(rows) < chunk_size:
+            break
+
+    if run.expired_count:
+        invalidate_facets()
+        invalidate_seller_policies(sellers)
+        invalidate_storefronts(sellers)
+        invalidate_suggestions()
+    run.sellers_affected = len(sellers)
+    run.duration_ms = int((time.monotonic() - started) * 1000)
+    run.finished_at = timezone.now()
+    run.save()
+    prune_runs()
+    logger.info(
+        'Expired %d listings in %d chunks (%d scanned, %d sellers) in %d ms',
+        run.expired_count, run.chunks, run.scanned, run.sellers_affected, run.duration_ms,
+        extra={
+            'expired': run.expired_count, 'chunks': run.chunks, 'scanned': run.scanned,
+            'sellers': run.sellers_affected, 'duration_ms': run.duration_ms, 'full': run.full,
+        },
+    )
+    return run
+
+
+def run_expiry_locked(**kwargs):
+    """``run_expiry`` unless another worker holds the expiry lock; returns None if skipped."""
+    if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        return None
+    try:
+        return run_expiry(**kwargs)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+class ExpiryScheduler(threading.Thread):
+    """
+    Daemon thread that runs expiry every ``interval`` seconds. The first run
+    is a full sweep, later ones are incremental.
+    """
+
+    def __init__(self, interval, chunk_size=CHUNK_SIZE):
+        super().__init__(name='marketplace-expiry', daemon=True)
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self._stop_event = threading.Event()
+
+    def run(self):
+        full = True
+        while not self._stop_event.is_set():
+            try:
+                if run_expiry_locked(full=full, chunk_size=self.chunk_size) is not None:
+                    full = False
+            except Exception:
+                logger.exception('Listing expiry run failed')
+            finally:
+                close_old_connections()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler():
+    """
+    Start this process's expiry thread if ``MARKETPLACE_EXPIRY_INTERVAL``
+    (seconds) is set. Safe to call more than once.
+    """
+    global _scheduler
+    interval = getattr(settings, 'MARKETPLACE_EXPIRY_INTERVAL', None)
+    if not interval:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = ExpiryScheduler(interval)
+            _scheduler.start()
+    return _scheduler
@@ -0,0 +1,189 @@
+# marketplace/facets.py
+"""
+Facet counts for the marketplace browse page.
+
+All facets (category, condition, price bucket) come out of ONE grouped
+aggregate query: the current filter set, minus the category and condition
+filters, grouped by ``(category, condition, price bucket)``. The category and
+condition facets are then summed in Python so each one ignores its own
+filter - picking "Books" still shows how many items the other categories have.
+
+Results are cached per normalized filter set for a short time and dropped
+whenever a product saved or deleted is committed (see ``marketplace/signals.py``).
+"""
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import Product
+from .search import search_products, tokenize
+from .versions import bump_version, get_version
+
+FACET_CACHE_TIMEOUT = 60  # seconds
+
+# (lower, upper) in KSh; upper is exclusive, None means "and above"
+PRICE_BUCKETS = [
+    (0, 500),
+    (500, 1000),
+    (1000, 2500),
+    (2500, 5000),
+    (5000, 10000),
+    (10000, None),
+]
+
+
+def _clean_price(value):
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return str(price) if price.is_finite() and price >= 0 else None
+
+
+def normalize_filters(params):
+    """Reduce request GET params to the canonical filter dict used for both queries and cache keys."""
+    category = params.get('category') or ''
+    condition = params.get('condition') or ''
+    valid_conditions = dict(Product.CONDITION_CHOICES)
+    return {
+        # isdigit() alone accepts '²' and other digits int() rejects
+        'category': int(category) if category.isascii() and category.isdigit() else None,
+        'condition': condition if condition in valid_conditions else None,
+        'min_price': _clean_price(params.get('min_price')),
+        'max_price': _clean_price(params.get('max_price')),
+        # The navbar search box submits ?q=, the filter bar ?search=
+        'search': ' '.join(tokenize(params.get('search') or params.get('q'))) or None,
+    }
+
+
+def apply_filters(queryset, filters, skip=()):
+    """Apply a ``normalize_filters`` dict to a product queryset, leaving out ``skip`` keys."""
+    if filters['category'] is not None and 'category' not in skip:
+        queryset = queryset.filter(category_id=filters['category'])
+    if filters['condition'] and 'condition' not in skip:
+        queryset = queryset.filter(condition=filters['condition'])
+    if filters['min_price'] is not None and 'price' not in skip:
+        queryset = queryset.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None and 'price' not in skip:
+        queryset = queryset.filter(price__lte=filters['max_price'])
+    if filters['search'] and 'search' not in skip:
+        queryset = search_products(queryset, filters['search']).order_by()
+    return queryset
+
+
+def _price_bucket_expression():
+    whens = []
+    for index, (lower, upper) in enumerate(PRICE_BUCKETS):
+        if upper is None:
+            whens.append(When(price__gte=lower, then=Value(index)))
+        else:
+            whens.append(When(price__gte=lower, price__lt=upper, then=Value(index)))
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def compute_facets(filters):
+    """Run the grouped aggregate and fold it into per-facet counts."""
+    base = apply_filters(Product.objects.filter(is_sold=False), filters, skip=('category', 'condition'))
+    rows = (
+        base.order_by()
+        .annotate(price_bucket=_price_bucket_expression())
+        .values('category_id', 'condition', 'price_bucket')
+        .annotate(n=Count('id'))
+    )
+
+    categories = defaultdict(int)
+    conditions = defaultdict(int)
+    prices = defaultdict(int)
+    total = 0
+    for row in rows:
+        in_category = filters['category'] is None or row['category_id'] == filters['category']
+        in_condition = not filters['condition'] or row['condition'] == filters['condition']
+        if in_condition:
+            categories[row['category_id']] += row['n']
+        if in_category:
+            conditions[row['condition']] += row['n']
+        if in_category and in_condition:
+            prices[row['price_bucket']] += row['n']
+            total += row['n']
+    return {
+        'total': total,
+        'categories': dict(categories),
+        'conditions': dict(conditions),
+        'prices': dict(prices),
+    }
+
+
+def facet_cache_key(filters):
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return f'marketplace:facets:{get_version("products")}:{digest}'
+
+
+def get_facets(filters):
+    """Facet counts for ``filters``, from the cache when possible."""
+    key = facet_cache_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    """Drop every cached facet count once the current transaction commits."""
+    transaction.on_commit(lambda: bump_version('products'))
+
+
+def _toggle_url(params, **changes):
+    query = params.copy()
+    for name in ('cursor', 'page'):
+        query.pop(name, None)
+    for name, value in changes.items():
+        if value is None:
+            query.pop(name, None)
+        else:
+            query[name] = value
+    return '?' + query.urlencode()
+
+
+def facet_links(params, filters, facets, categories):
+    """Template-ready facet entries: label, count, whether selected, and the URL that toggles it."""
+    category_links = [
+        {
+            'value': category.pk,
+            'label': category.name,
+            'count': facets['categories'].get(category.pk, 0),
+            'selected': filters['category'] == category.pk,
+            'url': _toggle_url(params, category=None if filters['category'] == category.pk else category.pk),
+        }
+        for category in categories
+    ]
+    condition_links = [
+        {
+            'value': value,
+            'label': label,
+            'count': facets['conditions'].get(value, 0),
+            'selected': filters['condition'] == value,
+            'url': _toggle_url(params, condition=None if filters['condition'] == value else value),
+        }
+        for value, label in Product.CONDITION_CHOICES
+    ]
+    price_links = []
+    for index, (lower, upper) in enumerate(PRICE_BUCKETS):
+        label = f'KSh {lower:,}+' if upper is None else f'KSh {lower:,} - {upper:,}'
+        price_links.append({
+            'label': label,
+            'count': facets['prices'].get(index, 0),
+            # max_price is inclusive, bucket upper bounds are not
+            'url': _toggle_url(params, min_price=lower, max_price=None if upper is None else upper - Decimal('0.01')),
+        })
+    return {
+        'total': facets['total'],
+        'categories': category_links,
+        'conditions': condition_links,
+        'prices': price_links,
+    }
@@ -0,0 +1,59 @@
+# marketplace/favorites.py
+"""
+Favorite flags for product grids.
+
+``with_favorites()`` adds an ``is_favorited`` column to a product queryset so
+a grid never asks per card. If the user's favorite id set is in the cache
+(it is warmed whenever they toggle a favorite or open their favorites page)
+the flag is a plain ``CASE pk IN (...)`` on those ids; otherwise it is one
+correlated ``EXISTS`` subquery. The cached set is dropped on every
+``ProductFavorite`` save/delete (``marketplace/signals.py``).
+"""
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Exists, OuterRef, Value, When
+
+from .models import ProductFavorite
+
+FAVORITES_TIMEOUT = 60 * 60  # seconds
+
+
+def _key(user_id):
+    return f'marketplace:favorites:{user_id}'
+
+
+def favorite_ids(user):
+    """The ids of ``user``'s favorite products, cached."""
+    ids = cache.get(_key(user.pk))
+    if ids is None:
+        ids = frozenset(ProductFavorite.objects.filter(user=user).values_list('product_id', flat=True))
+        cache.set(_key(user.pk), ids, FAVORITES_TIMEOUT)
+    return ids
+
+
+def with_favorites(queryset, user):
+    """Annotate ``queryset`` with ``is_favorited`` for ``user`` (always False when logged out)."""
+    if not user.is_authenticated:
+        return queryset.annotate(is_favorited=Value(False, output_field=BooleanField()))
+    ids = cache.get(_key(user.pk))
+    if ids is None:
+        return queryset.annotate(is_favorited=Exists(
+            ProductFavorite.objects.filter(user=user, product=OuterRef('pk'))
+        ))
+    if not ids:
+        return queryset.annotate(is_favorited=Value(False, output_field=BooleanField()))
+    return queryset.annotate(is_favorited=Case(
+        When(pk__in=ids, then=Value(True)), default=Value(False), output_field=BooleanField(),
+    ))
+
+
+def toggle_favorite(user, product):
+    """Flip ``product`` in ``user``'s favorites; return True if it is now a favorite."""
+    deleted, _ = ProductFavorite.objects.filter(user=user, product=product).delete()
+    if not deleted:
+        ProductFavorite.objects.get_or_create(user=user, product=product)
+    # The signals dropped the cached set; warm it so the next grid skips the subquery
+    return product.pk in favorite_ids(user)
+
+
+def invalidate_favorites(user_id):
+    cache.delete(_key(user_id))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from marketplace.recommender import TOP_K, build_recommendations
+
+class Command(BaseCommand):
+    help = 'Refresh the precomputed "related products" neighbours (incremental unless --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute neighbours for every live listing')
+        parser.add_argument('-k', type=int, default=TOP_K, help=f'Neighbours to keep per listing (default {TOP_K})')
+
+    def handle(self, *args, **options):
+        count = build_recommendations(full=options['full'], k=max(options['k'], 1))
+        self.stdout.write(f"Recomputed related products for {count} listings.")
@@ -1,15 +1,19 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from marketplace.models import Product
+from marketplace.expiry import CHUNK_SIZE, run_expiry_locked
 
 class Command(BaseCommand):
     help = 'Mark products as expired if past expiry date'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the watermark and sweep every live listing')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help=f'Listings per transaction (default {CHUNK_SIZE})')
+
     def handle(self, *args, **options):
-        expired_products = Product.objects.filter(
-            expires_at__lte=timezone.now(),
-            expired=False,
-            is_sold=False
+        run = run_expiry_locked(full=options['full'], chunk_size=max(options['chunk_size'], 1))
+        if run is None:
+            self.stdout.write("Another expiry run is in progress; skipped.")
+            return
+        self.stdout.write(
+            f"{run.expired_count} products marked as expired "
+            f"({run.chunks} chunks, {run.sellers_affected} sellers, {run.duration_ms} ms)."
         )
-        count = expired_products.update(expired=True)
-        self.stdout.write(f"{count} products marked as expired.")
\ No newline at end of file
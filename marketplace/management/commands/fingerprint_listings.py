@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from marketplace.duplicates import fingerprint_listing
+from marketplace.models import Product
+
+class Command(BaseCommand):
+    help = 'Fingerprint active listings for near-duplicate detection (text only; image hashes come from uploads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute listings that already have a fingerprint')
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(is_sold=False, expired=False).order_by('created_at', 'id')
+        if not options['all']:
+            products = products.filter(fingerprint__isnull=True)
+        flagged = total = 0
+        for product in products.iterator():
+            total += 1
+            if fingerprint_listing(product) is not None:
+                flagged += 1
+        self.stdout.write(f"{total} listings fingerprinted, {flagged} flagged as near-duplicates.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from marketplace.models import Product
+from marketplace.search import get_backend
+
+class Command(BaseCommand):
+    help = 'Rebuild the marketplace full-text search index from the product table'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(f"Search index rebuilt with {backend.__class__.__name__} ({Product.objects.count()} products).")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from marketplace.counters import recount_categories, recount_sellers
+
+class Command(BaseCommand):
+    help = 'Recompute Category.active_product_count and SellerProfile.active_listing_count from the product table and fix any drift'
+
+    def handle(self, *args, **options):
+        fixed = recount_categories()
+        self.stdout.write(f"{fixed} categories had drifted and were corrected.")
+        fixed = recount_sellers()
+        self.stdout.write(f"{fixed} seller listing counts had drifted and were corrected.")
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from marketplace.alerts import send_digests
+
+class Command(BaseCommand):
+    help = 'Email each user one digest of new listings matching their saved searches (run from cron)'
+
+    def handle(self, *args, **options):
+        sent = send_digests()
+        self.stdout.write(f"{sent} search digest{'' if sent == 1 else 's'} sent.")
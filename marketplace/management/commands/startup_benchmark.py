@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported or connected.
+# Reports setup wall time and every SQL statement issued during setup.
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import django
+from django.db import connections
+queries = []
+def record(execute, sql, params, many, context):
+    queries.append(sql)
+    return execute(sql, params, many, context)
+for alias in connections:
+    connections[alias].execute_wrappers.append(record)
+django.setup()
+print(json.dumps({'seconds': time.perf_counter() - start, 'queries': queries}))
+"""
+
+
+def parse_importtime(stderr):
+    """``-X importtime`` lines -> {module: (self_us, cumulative_us)} for top-level imports."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start cost of django.setup(): wall time, slowest imports and any startup queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Number of fresh interpreters to time (default 5)')
+        parser.add_argument('--top', type=int, default=20, help='How many of the slowest imports to list (default 20)')
+        parser.add_argument('--max-seconds', type=float, help='Exit with an error if the median setup time exceeds this')
+
+    def probe(self):
+        # manage.py has already set DJANGO_SETTINGS_MODULE; the child inherits it
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            capture_output=True, text=True, env=dict(os.environ), cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'django.setup() failed in a fresh interpreter:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        runs = max(options['runs'], 1)
+        timings = []
+        imports = {}
+        queries = []
+        for _ in range(runs):
+            report, modules = self.probe()
+            timings.append(report['seconds'])
+            queries = report['queries']
+            for name, (self_us, cumulative_us) in modules.items():
+                best = imports.get(name)
+                # Keep the fastest sighting; the slow ones are mostly disk cache noise
+                if best is None or cumulative_us < best[1]:
+                    imports[name] = (self_us, cumulative_us)
+
+        self.stdout.write(
+            f"django.setup() over {runs} runs: median {median(timings) * 1000:.1f} ms, "
+            f"min {min(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms"
+        )
+
+        self.stdout.write(f"\nSlowest imports (cumulative, best of {runs}):")
+        slowest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)[:options['top']]
+        for name, (self_us, cumulative_us) in slowest:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}")
+
+        if queries:
+            self.stdout.write(self.style.WARNING(f"\n{len(queries)} SQL queries ran during startup:"))
+            for sql in queries:
+                self.stdout.write(f"  {sql}")
+        else:
+            self.stdout.write("\nNo SQL queries ran during startup.")
+
+        if options['max_seconds'] is not None and median(timings) > options['max_seconds']:
+            raise CommandError(
+                f"Median startup {median(timings):.3f}s exceeds the {options['max_seconds']:.3f}s budget"
+            )
@@ -0,0 +1,39 @@
+# Full-text index for marketplace search (see marketplace/search.py)
+
+from django.db import migrations
+
+FTS_TABLE = 'marketplace_product_fts'
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases use their own search backend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, description, seller_name, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, description, seller_name) "
+        "SELECT p.id, p.title, p.description, u.username "
+        "FROM marketplace_product p JOIN accounts_customuser u ON u.id = p.seller_id"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_sellerprofile'),
+        ('marketplace', '0002_product_expired_product_expires_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_product_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['category', 'condition', 'price', 'is_sold'], name='product_facet_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_active_products(apps, schema_editor):
+    Category = apps.get_model('marketplace', 'Category')
+    Product = apps.get_model('marketplace', 'Product')
+    counts = (
+        Product.objects.filter(is_sold=False, expired=False)
+        .order_by()
+        .values('category_id')
+        .annotate(n=Count('id'))
+    )
+    for row in counts:
+        Category.objects.filter(pk=row['category_id']).update(active_product_count=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0005_product_facet_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Active listings'),
+        ),
+        migrations.RunPython(count_active_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Seeds the default categories once, at migrate time. This used to run in
+# MarketplaceConfig.ready(), i.e. on every process start.
+
+from django.db import migrations
+
+# Frozen copy of the list at the time of writing; later edits to the
+# defaults belong in a new migration.
+DEFAULT_CATEGORIES = [
+    'Electronics & Gadgets',
+    'Books & Textbooks',
+    'Clothing & Fashion',
+    'Furniture & Home',
+    'Sports & Fitness',
+    'Beauty & Cosmetics',
+    'Jewelry & Accessories',
+    'Stationery & Supplies',
+    'Kitchen & Appliances',
+    'ID Cards & Documents',
+    'Wallets & Bags',
+    'Lab Equipment',
+    'Musical Instruments',
+    'Art & Craft Supplies',
+    'Other',
+]
+
+
+def seed_categories(apps, schema_editor):
+    Category = apps.get_model('marketplace', 'Category')
+    db_alias = schema_editor.connection.alias
+    # Same rule as before: only seed a marketplace that has no categories yet
+    if Category.objects.using(db_alias).exists():
+        return
+    Category.objects.using(db_alias).bulk_create([Category(name=name) for name in DEFAULT_CATEGORIES])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0006_category_active_product_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0011_savedsearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FingerprintBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='marketplace.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'product'), name='fingerprintbucket_key_product_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductFingerprint',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='marketplace.product')),
+                ('text_hash', models.BigIntegerField(blank=True, null=True)),
+                ('image_hash', models.BigIntegerField(blank=True, null=True)),
+                ('distance', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='marketplace.product')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('duplicate_of__isnull', False)), fields=['duplicate_of'], name='fingerprint_flagged_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:08
+
+from django.db import migrations, models
+
+
+def mark_last_terms(apps, schema_editor):
+    SavedSearch = apps.get_model('marketplace', 'SavedSearch')
+    SavedSearchTerm = apps.get_model('marketplace', 'SavedSearchTerm')
+    for pk, query in SavedSearch.objects.exclude(query='').values_list('pk', 'query'):
+        words = query.split()
+        if words[-1] not in words[:-1]:
+            SavedSearchTerm.objects.filter(saved_search_id=pk, term=words[-1]).update(prefix=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0013_product_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedsearchterm',
+            name='prefix',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_last_terms, migrations.RunPython.noop),
+    ]
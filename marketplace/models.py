@@ -1,5 +1,5 @@
 # marketplace/models.py
-from django.db import models
+from django.db import models, transaction
 from cloudinary.models import CloudinaryField
 from accounts.models import CustomUser
 from django.utils.text import slugify
@@ -36,6 +36,9 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     icon = models.CharField(max_length=50, blank=True)
+    # Denormalized count of unsold, unexpired products; maintained by
+    # marketplace/counters.py, repaired by `manage.py reconcile_category_counts`
+    active_product_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Active listings')
     
     # Add the custom manager
     objects = CategoryManager()
@@ -68,23 +71,261 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     expires_at = models.DateTimeField(null=True, blank=True)
     expired = models.BooleanField(default=False)
+    # Written only by marketplace/popularity.py's buffered flush
+    views_count = models.PositiveIntegerField(default=0, editable=False)
+    popularity = models.FloatField(default=0, editable=False)
+
+    # Fields whose changes move denormalized counters; snapshotted on load
+    TRACKED_FIELDS = ('category_id', 'seller_id', 'is_sold', 'expired')
+    # Written by the view buffer flush only
+    BUFFERED_FIELDS = ('views_count', 'popularity')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = {
+            name: instance.__dict__[name] for name in cls.TRACKED_FIELDS if name in instance.__dict__
+        }
+        return instance
+
+    @property
+    def is_active(self):
+        """Listed and still for sale: not sold and not expired."""
+        return not self.is_sold and not self.expired
 
     def save(self, *args, **kwargs):
         # If expires_at not set, set it based on seller's duration
-        if not self.expires_at and self.seller:
-            # Get seller profile
-            seller_profile = self.seller.seller_profile
-            self.expires_at = timezone.now() + timedelta(days=seller_profile.listing_duration_days)
-        super().save(*args, **kwargs)
+        if not self.expires_at and self.seller_id:
+            # Cached seller policy: no profile query per save
+            from .policy import get_seller_policy
+            self.expires_at = get_seller_policy(self.seller_id).get_listing_expiry_date()
+        with transaction.atomic():
+            if not self._state.adding and self.pk is not None:
+                # Counter deltas start from the row as committed, locked until
+                # the save is done, not from this instance's possibly stale copy
+                from .counters import lock_tracked_state
+                exists = lock_tracked_state(self)
+                # The view counters only move through F() updates; a full save
+                # of an instance loaded earlier must not write its stale copy
+                # back. A row deleted meanwhile is re-inserted whole, as usual.
+                if exists and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+                    deferred = self.get_deferred_fields()
+                    kwargs['update_fields'] = [
+                        field.name for field in self._meta.concrete_fields
+                        if not field.primary_key and field.name not in self.BUFFERED_FIELDS
+                        and field.attname not in deferred
+                    ]
+            super().save(*args, **kwargs)
+
+    def related_products(self, limit=4, queryset=None):
+        """
+        Live neighbours precomputed by ``manage.py build_recommendations``,
+        best first: one lookup on the (product, rank) index. ``queryset``
+        lets callers add annotations first.
+        """
+        queryset = Product.objects.all() if queryset is None else queryset
+        return queryset.filter(
+            neighbour_of__product=self, is_sold=False, expired=False
+        ).order_by('neighbour_of__rank')[:limit]
 
     def check_expired(self):
-        if self.expires_at and self.expires_at < timezone.now():
+        if not self.expired and self.expires_at and self.expires_at < timezone.now():
             self.expired = True
-            self.save()
+            self.save(update_fields=['expired'])
     
     def __str__(self):
         return self.title
     
     class Meta:
         ordering = ['-created_at']
-        
\ No newline at end of file
+        indexes = [
+            # Browse paths only show unsold listings. Django renders is_sold=False
+            # as "NOT is_sold", which SQLite can't seek on, so these are partial
+            # indexes over the unsold rows rather than is_sold-prefixed ones.
+            # Browse: newest first (marketplace_home)
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='product_browse_idx',
+                condition=models.Q(is_sold=False),
+            ),
+            # Category pages and the home page category filter
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                name='product_category_idx',
+                condition=models.Q(is_sold=False),
+            ),
+            # Facet counts read only these columns, so this covers the whole aggregate
+            # (is_sold is included because SQLite re-checks the partial condition)
+            models.Index(
+                fields=['category', 'condition', 'price', 'is_sold'],
+                name='product_facet_idx',
+                condition=models.Q(is_sold=False),
+            ),
+            # sort=popular (marketplace/popularity.py)
+            models.Index(
+                fields=['-popularity', '-id'],
+                name='product_popular_idx',
+                condition=models.Q(is_sold=False),
+            ),
+            # Seller store, my_products and my_listings
+            models.Index(fields=['seller', '-created_at', '-id'], name='product_seller_idx'),
+            # expire_products only ever looks at live listings
+            models.Index(
+                fields=['expires_at'],
+                name='product_expiry_idx',
+                condition=models.Q(expired=False, is_sold=False),
+            ),
+        ]
+        
+
+class ExpiryRun(models.Model):
+    """One pass of the listing expiry engine (marketplace/expiry.py)."""
+    # Listings with since < expires_at <= until were covered; since is null for a full sweep
+    since = models.DateTimeField(null=True, blank=True)
+    until = models.DateTimeField()
+    full = models.BooleanField(default=False)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    chunks = models.PositiveIntegerField(default=0)
+    scanned = models.PositiveIntegerField(default=0)
+    expired_count = models.PositiveIntegerField(default=0)
+    sellers_affected = models.PositiveIntegerField(default=0)
+    duration_ms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['-until'], name='expiryrun_until_idx')]
+
+    def __str__(self):
+        return f"Expiry run {self.until:%Y-%m-%d %H:%M}: {self.expired_count} expired"
+
+
+class RelatedProduct(models.Model):
+    """Top-k nearest neighbour of a product, written by marketplace/recommender.py."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbours')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbour_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    # Build start time; products updated after it are recomputed by the next incremental build
+    computed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='relatedproduct_product_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class ProductFavorite(models.Model):
+    """A product a user saved for later"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='product_favorites')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='favorited_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'product']
+        verbose_name = "Favorite Product"
+        verbose_name_plural = "Favorite Products"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.product.title}"
+
+
+class SavedSearch(models.Model):
+    """Browse-page filters a user is alerted about when a matching listing is posted (marketplace/alerts.py)."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='saved_searches')
+    name = models.CharField(max_length=100)
+    # Normalized keywords, as facets.normalize_filters() produces them
+    query = models.CharField(max_length=200, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    condition = models.CharField(max_length=20, choices=Product.CONDITION_CHOICES, blank=True)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Number of SavedSearchTerm rows; a listing matches when it hits all of them
+    term_count = models.PositiveSmallIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Saved searches'
+        indexes = [
+            # Keyword-less searches are candidates for every listing
+            models.Index(fields=['category'], condition=models.Q(term_count=0), name='savedsearch_termless_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.name}"
+
+
+class SavedSearchTerm(models.Model):
+    """One keyword of a saved search: the inverted index new listings are matched through."""
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=100)
+    # The last keyword matches any word starting with it, as on the browse page
+    prefix = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'saved_search'], name='savedsearchterm_term_uniq'),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class SearchAlert(models.Model):
+    """A listing that matched a saved search, waiting for (or sent in) the user's next digest."""
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='alerts')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_alerts')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['saved_search', 'product'], name='searchalert_search_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(sent_at__isnull=True), name='searchalert_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.saved_search} <- {self.product_id}"
+
+
+class ProductFingerprint(models.Model):
+    """Similarity hashes of a listing and the closest earlier listing they matched (marketplace/duplicates.py)."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    # 64-bit hashes stored signed (duplicates.to_db); text_hash is null when the text is too short to judge
+    text_hash = models.BigIntegerField(null=True, blank=True)
+    image_hash = models.BigIntegerField(null=True, blank=True)
+    duplicate_of = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Differing bits to duplicate_of, text or image, whichever was closer
+    distance = models.PositiveSmallIntegerField(null=True, blank=True)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['duplicate_of'], condition=models.Q(duplicate_of__isnull=False), name='fingerprint_flagged_idx'),
+        ]
+
+    def __str__(self):
+        return f"Fingerprint of {self.product_id}"
+
+
+class FingerprintBucket(models.Model):
+    """One LSH band of a listing's fingerprint; listings sharing a bucket are duplicate candidates."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # (hash kind, band number, band bits) packed by duplicates.bucket_keys()
+    key = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'product'], name='fingerprintbucket_key_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.key:#x} <- {self.product_id}"
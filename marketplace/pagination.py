@@ -0,0 +1,151 @@
+# marketplace/pagination.py
+"""
+Keyset ("cursor") pagination for product listings.
+
+Django's ``Paginator`` runs a ``COUNT(*)`` and an ``OFFSET`` scan, so page 500
+costs 500 times page 1. Here every listing is ordered by ``(-created_at, -id)``
+and a page is simply "the next N rows after the last one you saw", which the
+database answers with a single index range scan no matter how deep you go.
+
+The position is handed to the client as an opaque cursor token; clients must
+not build or parse it themselves.
+"""
+import base64
+import binascii
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+PAGE_SIZE = 24
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """Pack a ``(created_at, id)`` position into a URL-safe token."""
+    # Integer arithmetic; float timestamps can drift by a microsecond
+    micros = (created_at - _EPOCH) // timedelta(microseconds=1)
+    raw = f'{micros}:{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Unpack a token from ``encode_cursor``; raises ``InvalidCursor`` on garbage."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        micros, pk = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        created_at = _EPOCH + timedelta(microseconds=int(micros))
+        return created_at, int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError, OverflowError) as e:
+        raise InvalidCursor(token) from e
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing."""
+
+    def __init__(self, object_list, next_cursor, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+    @property
+    def next_params(self):
+        return {'cursor': self.next_cursor}
+
+
+def paginate_keyset(queryset, cursor=None, per_page=PAGE_SIZE):
+    """
+    Return the page of ``queryset`` that starts after ``cursor``.
+
+    ``queryset`` is re-ordered by ``(-created_at, -id)``. A missing or
+    unreadable cursor gives the first page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    position = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
+    if position:
+        created_at, pk = position
+        # The redundant created_at__lte gives the planner a plain index range;
+        # the OR alone would make SQLite fall back to a sort.
+        queryset = queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(id__lt=pk)
+        )
+    # One extra row tells us whether there is a next page
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.pk)
+    return KeysetPage(rows, next_cursor, cursor)
+
+
+def encode_score_cursor(score, pk):
+    """Pack a ``(score, id)`` position into a URL-safe token."""
+    raw = f'{score!r}:{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_score_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        score, pk = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        score = float(score)
+        if not math.isfinite(score):
+            raise ValueError(score)
+        return score, int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError) as e:
+        raise InvalidCursor(token) from e
+
+
+def paginate_by_score(queryset, field, cursor=None, per_page=PAGE_SIZE):
+    """
+    ``paginate_keyset`` for listings ranked by a float column, highest first:
+    ``queryset`` is re-ordered by ``(-field, -id)``. Scores that change
+    between requests can move a listing across the page boundary.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    position = None
+    if cursor:
+        try:
+            position = decode_score_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
+    if position:
+        score, pk = position
+        queryset = queryset.filter(**{f'{field}__lte': score}).filter(
+            Q(**{f'{field}__lt': score}) | Q(id__lt=pk)
+        )
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_score_cursor(getattr(last, field), last.pk)
+    return KeysetPage(rows, next_cursor, cursor)
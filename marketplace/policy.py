@@ -0,0 +1,96 @@
+# marketplace/policy.py
+"""
+Cached seller listing policy.
+
+Creating a listing needs the seller's limits (``SellerProfile``) and how
+many listings they already have live. ``get_seller_policy()`` bundles both
+into a ``SellerPolicy`` loaded with one query and kept in the cache backend
+(per process with the default LocMem cache, shared with Redis/Memcached);
+``request_seller_policy()`` additionally memoizes it on the request.
+
+Entries are dropped whenever the seller's profile or one of their listings
+changes (``marketplace/signals.py``, ``marketplace/counters.py``); bulk
+updates that skip signals call ``invalidate_seller_policies()`` themselves.
+The policy only decides what to show; the quota itself is enforced by
+``counters.reserve_listing_slot()`` when the listing is saved.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import SellerProfile
+
+POLICY_TIMEOUT = 300  # seconds
+
+
+def _key(user_id):
+    return f'marketplace:seller_policy:{user_id}'
+
+
+class SellerPolicy:
+    """What a seller may list right now. A snapshot; don't keep it past the request."""
+
+    def __init__(self, user_id, is_verified, verified_until, max_listings, listing_duration_days, active_count):
+        self.user_id = user_id
+        self.is_verified = is_verified
+        self.verified_until = verified_until
+        self.max_listings = max_listings
+        self.listing_duration_days = listing_duration_days
+        self.active_count = active_count
+
+    def can_post_more_listings(self):
+        return self.active_count < self.max_listings
+
+    def get_listing_expiry_date(self):
+        return timezone.now() + timedelta(days=self.listing_duration_days)
+
+    def __repr__(self):
+        return f'<SellerPolicy user={self.user_id} {self.active_count}/{self.max_listings}>'
+
+
+def _load(user_id):
+    profile, _ = SellerProfile.objects.get_or_create(user_id=user_id)
+    return SellerPolicy(
+        user_id=user_id,
+        is_verified=profile.is_verified,
+        verified_until=profile.verified_until,
+        max_listings=profile.max_listings,
+        listing_duration_days=profile.listing_duration_days,
+        active_count=profile.active_listing_count,
+    )
+
+
+def _timeout(policy):
+    # A verified policy must not outlive the verification itself
+    if policy.is_verified and policy.verified_until:
+        remaining = (policy.verified_until - timezone.now()).total_seconds()
+        return max(0, min(POLICY_TIMEOUT, int(remaining)))
+    return POLICY_TIMEOUT
+
+
+def get_seller_policy(user_id):
+    """The ``SellerPolicy`` for ``user_id``, from the cache when possible."""
+    policy = cache.get(_key(user_id))
+    if policy is None:
+        policy = _load(user_id)
+        timeout = _timeout(policy)
+        if timeout:
+            cache.set(_key(user_id), policy, timeout)
+    return policy
+
+
+def request_seller_policy(request):
+    """``get_seller_policy`` for the logged-in user, memoized for the rest of the request."""
+    policy = getattr(request, '_seller_policy', None)
+    if policy is None or policy.user_id != request.user.pk:
+        policy = request._seller_policy = get_seller_policy(request.user.pk)
+    return policy
+
+
+def invalidate_seller_policies(user_ids):
+    """Drop the sellers' cached policies once the current transaction commits."""
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,160 @@
+# marketplace/popularity.py
+"""
+Buffered product view counts and the popularity score behind ``sort=popular``.
+
+A product page view only bumps a counter in this process's ``ViewBuffer``;
+nothing is written on the request path. A ``ViewFlusher`` thread drains the
+buffer every ``MARKETPLACE_VIEW_FLUSH_INTERVAL`` seconds (and once more at
+exit) with one ``UPDATE ... SET views_count = views_count + n`` per distinct
+``n``, so a busy minute costs a handful of statements, not one per view.
+
+``popularity`` is an exponentially decayed view count kept in log space:
+
+    popularity = log2(sum over views of 2 ** ((viewed_at - EPOCH) / HALF_LIFE))
+
+A view is worth half as much every ``HALF_LIFE``, relative to newer ones.
+Because every score is anchored to the same ``EPOCH``, old scores never
+need rewriting as time passes: ordering by the stored column is ordering by
+the decayed score at any moment, and the partial ``product_popular_idx``
+index serves ``sort=popular`` directly. Adding ``n`` views is
+``log2(2**score + n * 2**t)``, computed inside the ``UPDATE``.
+"""
+import atexit
+import logging
+import math
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(days=7)
+FLUSH_INTERVAL = 30  # seconds, unless MARKETPLACE_VIEW_FLUSH_INTERVAL says otherwise
+
+
+class ViewBuffer:
+    """Per-process ``{product_id: views}`` waiting to be flushed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, product_id, n=1):
+        with self._lock:
+            self._counts[product_id] += n
+
+    def drain(self):
+        """Take everything buffered so far."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def restore(self, counts):
+        """Put back counts whose flush failed."""
+        with self._lock:
+            self._counts.update(counts)
+
+    def __len__(self):
+        return len(self._counts)
+
+
+view_buffer = ViewBuffer()
+
+
+def record_view(product_id):
+    view_buffer.add(product_id)
+
+
+def view_weight(n, now):
+    """log2 of ``n`` views made at ``now``, in ``popularity`` units."""
+    return math.log2(n) + (now - EPOCH) / HALF_LIFE
+
+
+def _add_views(weight):
+    # log2(2**popularity + 2**weight), arranged so neither power overflows
+    weight = Value(weight)
+    return Greatest(F('popularity'), weight) + Log(
+        Value(2.0), Value(1.0) + Power(Value(2.0), -Abs(F('popularity') - weight))
+    )
+
+
+def flush_views(now=None):
+    """Write buffered views to the database; returns how many were written."""
+    counts = view_buffer.drain()
+    if not counts:
+        return 0
+    now = now or timezone.now()
+    by_count = defaultdict(list)
+    for product_id, n in counts.items():
+        by_count[n].append(product_id)
+    try:
+        with transaction.atomic():
+            for n, product_ids in by_count.items():
+                Product.objects.filter(pk__in=product_ids).update(
+                    views_count=F('views_count') + n,
+                    popularity=_add_views(view_weight(n, now)),
+                )
+    except Exception:
+        view_buffer.restore(counts)
+        raise
+    return sum(counts.values())
+
+
+class ViewFlusher(threading.Thread):
+    """Daemon thread that flushes the view buffer every ``interval`` seconds."""
+
+    def __init__(self, interval):
+        super().__init__(name='marketplace-views', daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                flush_views()
+            except Exception:
+                logger.exception('Flushing product views failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _flush_at_exit():
+    try:
+        flush_views()
+    except Exception:
+        logger.exception('Flushing product views at exit failed')
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_view_flusher():
+    """
+    Start this process's view flush thread, every
+    ``MARKETPLACE_VIEW_FLUSH_INTERVAL`` seconds (``FLUSH_INTERVAL`` by
+    default; 0 disables it). Safe to call more than once.
+    """
+    global _flusher
+    interval = getattr(settings, 'MARKETPLACE_VIEW_FLUSH_INTERVAL', FLUSH_INTERVAL)
+    if not interval:
+        return None
+    with _flusher_lock:
+        if _flusher is None:
+            atexit.register(_flush_at_exit)
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = ViewFlusher(interval)
+            _flusher.start()
+    return _flusher
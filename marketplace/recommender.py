@@ -0,0 +1,297 @@
+# marketplace/recommender.py
+"""
+Offline "related products" recommender.
+
+Every live listing becomes one sparse row vector made of blocks:
+
+* TF-IDF over the title (counted twice) and description, with sublinear
+  term frequency;
+* the listing's category, condition and price band (``facets.PRICE_BUCKETS``)
+  as weighted one-hot features.
+
+Each block is L2-normalized before weighting and the full row is
+normalized again, so a dot product between two rows is their cosine
+similarity. Neighbours come from sparse matrix products over chunks of
+rows. The top ``k`` for each listing are written to ``RelatedProduct``,
+which ``Product.related_products()`` reads with a single indexed lookup.
+
+Incremental builds only recompute listings updated since the last build,
+listings without neighbours yet, and listings whose neighbour lists point
+at a changed listing. The vocabulary and IDF are always rebuilt from the
+whole live corpus; that part is cheap next to the similarity products.
+
+Bulk ``QuerySet.update()``\\ s (bulk actions, expiry, admin actions) set
+``updated_at`` themselves, since ``auto_now`` only applies to ``save()``.
+``RecommenderScheduler``, a daemon thread started with
+``start_recommender()`` when ``MARKETPLACE_RECOMMENDER_INTERVAL`` is set,
+runs an incremental build whenever a listing changed since the last one;
+``manage.py build_recommendations`` (``--full`` to recompute everything)
+does the same from cron.
+"""
+import logging
+import re
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .facets import PRICE_BUCKETS
+from .models import Product, RelatedProduct
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 8
+MIN_SCORE = 0.05
+# Relative weight of each feature block; text carries the most signal
+TEXT_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.5
+CONDITION_WEIGHT = 0.25
+PRICE_WEIGHT = 0.35
+# Dense similarity cells per chunk (rows x corpus), bounds memory at ~32 MB
+CHUNK_CELLS = 4_000_000
+
+LOCK_KEY = 'marketplace:recommender:lock'
+LOCK_TIMEOUT = 30 * 60  # seconds; a crashed build can't block refreshes for longer than this
+
+TOKEN_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or that the this to was were '
+    'will with very good new used item sale selling sell price ksh'.split()
+)
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def _price_band(price):
+    price = float(price)
+    for index, (lower, upper) in enumerate(PRICE_BUCKETS):
+        if upper is None or price < upper:
+            return index
+    return len(PRICE_BUCKETS) - 1
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+def _one_hot(values, size):
+    rows = np.arange(len(values))
+    return sparse.csr_matrix((np.ones(len(values)), (rows, np.asarray(values))), shape=(len(values), size))
+
+
+def _text_block(documents):
+    vocabulary = {}
+    indptr, indices, counts = [0], [], []
+    for tokens in documents:
+        row = {}
+        for token in tokens:
+            column = vocabulary.setdefault(token, len(vocabulary))
+            row[column] = row.get(column, 0) + 1
+        indices.extend(row.keys())
+        counts.extend(row.values())
+        indptr.append(len(indices))
+    tf = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+        shape=(len(documents), max(len(vocabulary), 1)),
+    )
+    tf.data = 1.0 + np.log(tf.data)
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    idf = np.log((1.0 + tf.shape[0]) / (1.0 + df)) + 1.0
+    return _normalize_rows(tf @ sparse.diags(idf))
+
+
+def vectorize(rows):
+    """
+    ``rows`` of ``(title, description, price, condition, category_id)`` ->
+    CSR matrix with unit-length rows.
+    """
+    documents = [tokenize(title) * 2 + tokenize(description) for title, description, *_ in rows]
+    categories = {}
+    category_index = [categories.setdefault(row[4], len(categories)) for row in rows]
+    conditions = {value: index for index, (value, _) in enumerate(Product.CONDITION_CHOICES)}
+    condition_index = [conditions.get(row[3], 0) for row in rows]
+    price_index = [_price_band(row[2]) for row in rows]
+
+    blocks = [
+        TEXT_WEIGHT * _text_block(documents),
+        CATEGORY_WEIGHT * _one_hot(category_index, max(len(categories), 1)),
+        CONDITION_WEIGHT * _one_hot(condition_index, len(conditions)),
+        PRICE_WEIGHT * _one_hot(price_index, len(PRICE_BUCKETS)),
+    ]
+    return _normalize_rows(sparse.hstack(blocks, format='csr')).tocsr()
+
+
+def top_neighbours(matrix, targets, k=TOP_K):
+    """
+    Yield ``(target_row, [(row, score), ...])`` with the ``k`` most similar
+    rows for each row index in ``targets``, best first.
+    """
+    n = matrix.shape[0]
+    if n < 2:
+        for target in targets:
+            yield target, []
+        return
+    k = min(k, n - 1)
+    transposed = matrix.T.tocsc()
+    chunk_size = max(1, CHUNK_CELLS // n)
+    targets = np.asarray(targets, dtype=np.int64)
+    for start in range(0, len(targets), chunk_size):
+        chunk = targets[start:start + chunk_size]
+        scores = (matrix[chunk] @ transposed).toarray()
+        scores[np.arange(len(chunk)), chunk] = -1.0  # never your own neighbour
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for target, columns, values in zip(chunk, best, best_scores):
+            keep = values >= MIN_SCORE
+            yield int(target), list(zip(columns[keep].tolist(), values[keep].tolist()))
+
+
+def _write(neighbours, ids, computed_at):
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=[ids[target] for target, _ in neighbours]).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(
+                product_id=ids[target], related_id=ids[column], rank=rank,
+                score=round(score, 4), computed_at=computed_at,
+            )
+            for target, found in neighbours
+            for rank, (column, score) in enumerate(found)
+        ])
+
+
+def _watermark():
+    return RelatedProduct.objects.aggregate(latest=Max('computed_at'))['latest']
+
+
+def build_recommendations(full=False, k=TOP_K):
+    """Refresh the neighbour table and return how many products were recomputed."""
+    started = timezone.now()
+    rows = list(
+        Product.objects.filter(is_sold=False, expired=False)
+        .order_by('id')
+        .values_list('id', 'title', 'description', 'price', 'condition', 'category_id', 'updated_at')
+    )
+    # Neighbour lists of listings that are no longer live are never shown
+    RelatedProduct.objects.filter(Q(product__is_sold=True) | Q(product__expired=True)).delete()
+    if not rows:
+        return 0
+
+    ids = [row[0] for row in rows]
+    position = {pk: index for index, pk in enumerate(ids)}
+    matrix = vectorize([row[1:6] for row in rows])
+
+    if full:
+        targets = list(range(len(ids)))
+    else:
+        watermark = _watermark()
+        have_neighbours = set(RelatedProduct.objects.values_list('product_id', flat=True).distinct())
+        changed = {
+            position[row[0]] for row in rows
+            if row[0] not in have_neighbours or watermark is None or row[6] > watermark
+        }
+        # Lists that point at a changed listing may no longer be right either
+        changed_ids = [ids[index] for index in changed]
+        pointing = RelatedProduct.objects.filter(related_id__in=changed_ids).values_list('product_id', flat=True)
+        targets = sorted(changed | {position[pk] for pk in pointing if pk in position})
+
+    recomputed = 0
+    batch = []
+    for target, found in top_neighbours(matrix, targets, k):
+        batch.append((target, found))
+        if len(batch) >= 500:
+            _write(batch, ids, started)
+            recomputed += len(batch)
+            batch = []
+    if batch:
+        _write(batch, ids, started)
+        recomputed += len(batch)
+
+    if not full and targets:
+        # A changed listing may now belong in the lists of its own new
+        # neighbours; refresh those once (not transitively)
+        second = {
+            position[pk] for pk in RelatedProduct.objects.filter(
+                product_id__in=[ids[index] for index in changed]
+            ).values_list('related_id', flat=True)
+            if pk in position
+        } - set(targets)
+        if second:
+            _write(list(top_neighbours(matrix, sorted(second), k)), ids, started)
+            recomputed += len(second)
+    return recomputed
+
+
+def refresh_recommendations():
+    """
+    Incremental ``build_recommendations`` if a listing changed since the
+    last build and no other worker is building; returns how many products
+    were recomputed, or None if it skipped.
+    """
+    watermark = _watermark()
+    if watermark is not None and not Product.objects.filter(updated_at__gt=watermark).exists():
+        return None
+    if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+        return None
+    try:
+        return build_recommendations()
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+class RecommenderScheduler(threading.Thread):
+    """Daemon thread that refreshes related products every ``interval`` seconds."""
+
+    def __init__(self, interval):
+        super().__init__(name='marketplace-recommender', daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                refresh_recommendations()
+            except Exception:
+                logger.exception('Refreshing related products failed')
+            finally:
+                close_old_connections()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_recommender():
+    """
+    Start this process's related-products thread if
+    ``MARKETPLACE_RECOMMENDER_INTERVAL`` (seconds) is set. Safe to call
+    more than once.
+    """
+    global _scheduler
+    interval = getattr(settings, 'MARKETPLACE_RECOMMENDER_INTERVAL', None)
+    if not interval:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = RecommenderScheduler(interval)
+            _scheduler.start()
+    return _scheduler
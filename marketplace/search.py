@@ -0,0 +1,253 @@
+# marketplace/search.py
+"""
+Full-text search over marketplace products.
+
+The views never talk to a search engine directly; they call
+``search_products(queryset, query)`` and get back the same queryset,
+narrowed to the matches and ordered by relevance. Which engine does the
+work is decided by ``get_backend()``:
+
+* ``SQLiteFTSBackend`` - an FTS5 virtual table (``marketplace_product_fts``)
+  kept in sync by the signals in ``marketplace/signals.py``, ranked with BM25.
+* ``PostgresSearchBackend`` - ``tsvector`` ranking via ``django.contrib.postgres``.
+* ``SimpleSearchBackend`` - the old ``icontains`` chain, used when no index exists.
+
+Set ``MARKETPLACE_SEARCH_BACKEND`` to a dotted path to force a backend.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, OperationalError, ProgrammingError
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'marketplace_product_fts'
+
+# Words shorter than this are dropped from the query; they match too much
+MIN_TERM_LENGTH = 2
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split a raw search box value into lowercase terms."""
+    terms = [t.lower() for t in _TERM_RE.findall(query or '') if len(t) >= MIN_TERM_LENGTH]
+    return terms[:MAX_TERMS]
+
+
+def match_expression(query):
+    """
+    FTS5 ``MATCH`` expression for ``query``, or None if it has no terms.
+
+    Every term is quoted so user input can never inject FTS5 syntax, and the
+    last one is a prefix match for search-as-you-type.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return None
+    quoted = ['"%s"' % t.replace('"', '""') for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+class SearchBackend:
+    """Base class for product search backends."""
+
+    def index(self, product):
+        """Add or refresh a product in the index."""
+
+    def remove(self, product_id):
+        """Drop a product from the index."""
+
+    def rename_seller(self, seller_id, username):
+        """Refresh the indexed seller name for all of a seller's products."""
+
+    def rebuild(self):
+        """Re-index every product from scratch."""
+
+    def search(self, queryset, query):
+        """Return ``queryset`` narrowed to ``query`` and ordered by relevance."""
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(SearchBackend):
+    """Unindexed ``icontains`` search; slow, but works on any database."""
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) |
+                Q(description__icontains=term) |
+                Q(seller__username__icontains=term)
+            )
+        return queryset
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index ranked with BM25 (title weighted over description)."""
+
+    # bm25() column weights: title, description, seller_name
+    WEIGHTS = (10.0, 2.0, 1.0)
+
+    def index(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, seller_name) VALUES (%s, %s, %s, %s)',
+                [product.pk, product.title, product.description, product.seller.username],
+            )
+
+    def remove(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+    def rename_seller(self, seller_id, username):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {FTS_TABLE} SET seller_name = %s '
+                f'WHERE rowid IN (SELECT id FROM marketplace_product WHERE seller_id = %s)',
+                [username, seller_id],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, seller_name) '
+                f'SELECT p.id, p.title, p.description, u.username '
+                f'FROM marketplace_product p JOIN accounts_customuser u ON u.id = p.seller_id'
+            )
+
+    def search(self, queryset, query):
+        match = match_expression(query)
+        if match is None:
+            return queryset.none()
+        weights = ', '.join(str(w) for w in self.WEIGHTS)
+        table = queryset.model._meta.db_table
+        # The index is joined once, so MATCH runs once and bm25() reads the row
+        # it found; the ORM can't join a table that has no model, hence extra().
+        # bm25() is negative, more negative = better match, so sort ascending
+        return queryset.extra(
+            select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = "{table}"."id"'],
+            params=[match],
+        ).order_by('search_rank', '-id')
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    ``tsvector`` search for PostgreSQL.
+
+    Vectors are computed per query for now; add a stored ``SearchVectorField``
+    with a GIN index once the catalogue is large enough to need it.
+    """
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        vector = (
+            SearchVector('title', weight='A') +
+            SearchVector('description', weight='B') +
+            SearchVector('seller__username', weight='C')
+        )
+        search_query = SearchQuery(' '.join(terms), search_type='plain')
+        return (
+            queryset.annotate(search_rank=SearchRank(vector, search_query))
+            .filter(search_rank__gt=0)
+            .order_by(F('search_rank').desc(), '-id')
+        )
+
+
+_backend = None
+
+
+def _fts_table_exists():
+    try:
+        return FTS_TABLE in connection.introspection.table_names()
+    except (OperationalError, ProgrammingError):
+        return False
+
+
+def get_backend():
+    """Return the configured search backend, picking one from the database if unset."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'MARKETPLACE_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite' and _fts_table_exists():
+            _backend = SQLiteFTSBackend()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = SimpleSearchBackend()
+    return _backend
+
+
+def reset_backend():
+    """Forget the cached backend (used after migrations and in tests)."""
+    global _backend
+    _backend = None
+
+
+def search_products(queryset, query):
+    """Narrow a ``Product`` queryset to ``query``, best matches first."""
+    return get_backend().search(queryset, query)
+
+
+SEARCH_PAGE_SIZE = 24
+
+
+class SearchPage:
+    """One page of ranked search results, without a ``COUNT(*)`` over the matches."""
+
+    def __init__(self, object_list, number, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def is_first(self):
+        return self.number == 1
+
+    @property
+    def next_params(self):
+        return {'page': self.number + 1}
+
+    @property
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def search_page(queryset, query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """Run ``search_products`` and return page ``page`` of the ranked results."""
+    try:
+        number = max(int(page), 1)
+    except (TypeError, ValueError):
+        number = 1
+    offset = (number - 1) * per_page
+    # Fetch one extra row to learn whether there is a next page
+    rows = list(search_products(queryset, query)[offset:offset + per_page + 1])
+    return SearchPage(rows[:per_page], number, len(rows) > per_page)
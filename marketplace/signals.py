@@ -0,0 +1,124 @@
+# marketplace/signals.py
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import Signal, receiver
+
+from .models import Category, Product, ProductFavorite
+from .search import get_backend, reset_backend
+from .facets import invalidate_facets
+from . import counters
+from .categories import invalidate_categories
+from .policy import invalidate_seller_policies
+from .favorites import invalidate_favorites
+from .storefront import invalidate_storefronts
+from . import suggest
+from .alerts import queue_alerts
+from accounts.models import SellerProfile
+
+# Sent with ``product_ids`` after QuerySet.update()s that changed products
+# without post_save (bulk actions, expiry, admin actions), for copies of
+# product data kept outside this app.
+products_updated = Signal()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """Keep the search index in step with the product table."""
+    if raw:
+        return
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def count_saved_product(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    counters.product_saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    counters.product_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def suggest_product(sender, instance, raw=False, **kwargs):
+    # A batch reloads the suggestions once at the end
+    if raw or counters.in_batch():
+        return
+    suggest.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unsuggest_product(sender, instance, **kwargs):
+    if not counters.in_batch():
+        suggest.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def alert_saved_searches(sender, instance, created, raw=False, **kwargs):
+    """New listings are matched against saved searches; alerts go out in digests."""
+    if created and not raw:
+        queue_alerts(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def drop_cached_facets(sender, **kwargs):
+    # A batch invalidates once at the end
+    if not counters.in_batch():
+        invalidate_facets()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reindex_seller_name(sender, instance, created, raw=False, **kwargs):
+    """Sellers are searchable by username, so a rename has to reach the index."""
+    if created or raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    get_backend().rename_seller(instance.pk, instance.username)
+    # Seller names are part of cached listings and API payloads
+    invalidate_facets()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def drop_cached_categories(sender, **kwargs):
+    invalidate_categories()
+
+
+@receiver(post_save, sender=SellerProfile)
+@receiver(post_delete, sender=SellerProfile)
+def drop_cached_seller_policy(sender, instance, **kwargs):
+    invalidate_seller_policies([instance.user_id])
+    invalidate_storefronts([instance.user_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def drop_cached_storefront(sender, instance, created, raw=False, **kwargs):
+    """The storefront header shows the seller's account details."""
+    if created or raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and set(update_fields) <= {'last_login', 'password'}:
+        return
+    invalidate_storefronts([instance.pk])
+
+
+@receiver(post_save, sender=ProductFavorite)
+@receiver(post_delete, sender=ProductFavorite)
+def drop_cached_favorites(sender, instance, **kwargs):
+    invalidate_favorites(instance.user_id)
+
+
+@receiver(post_migrate)
+def refresh_search_backend(sender, **kwargs):
+    """The FTS table may have just been created or dropped; pick the backend again."""
+    reset_backend()
@@ -0,0 +1,83 @@
+# marketplace/storefront.py
+"""
+Cached seller storefronts.
+
+A storefront (profile header plus a page of listing cards) is the same for
+every visitor, so it is rendered once and stored as HTML under the seller's
+content version (``marketplace/versions.py``). Anything that changes what the
+page shows - one of the seller's products, their ``SellerProfile`` or their
+account - bumps that version through ``invalidate_storefronts()``, and the
+next hit renders afresh. A burst of visitors to a shared store link costs
+one render and no product queries.
+
+Because the HTML is shared, nothing viewer-specific goes in it: favorite
+hearts are rendered empty and filled in client-side from the viewer's cached
+favorite ids (see ``seller_store`` and ``templates/marketplace/base.html``).
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from .models import Product
+from .pagination import paginate_keyset
+from .versions import bump_version, get_version
+
+STOREFRONT_TIMEOUT = 10 * 60  # seconds; versions do the real invalidation
+
+
+def _version_name(seller_id):
+    return f'storefront:{seller_id}'
+
+
+def _key(seller_id, cursor, fragment):
+    digest = hashlib.md5((cursor or '').encode()).hexdigest()
+    version = get_version(_version_name(seller_id))
+    return f'marketplace:storefront:{seller_id}:{version}:{int(fragment)}:{digest}'
+
+
+def _render(seller, cursor, fragment):
+    products = Product.objects.filter(seller=seller, is_sold=False, expired=False)
+    page = paginate_keyset(products, cursor)
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('marketplace:seller_store_more', args=[seller.username])}?cursor={page.next_cursor}"
+    context = {
+        'seller': seller,
+        'products': page,
+        'page': page,
+        'next_url': next_url,
+        'column_class': 'col-md-4 col-sm-6',
+        'empty_message': 'No active listings at the moment.',
+        # Cards render hearts without per-viewer state or CSRF tokens
+        'shared_fragment': True,
+    }
+    if fragment:
+        return render_to_string('marketplace/product_page.html', context)
+    context['seller_profile'] = seller.seller_profile
+    return render_to_string('marketplace/storefront.html', context)
+
+
+def render_storefront(seller, cursor=None, fragment=False):
+    """Storefront HTML for ``seller`` (or just a "load more" page of cards), cached."""
+    key = _key(seller.pk, cursor, fragment)
+    html = cache.get(key)
+    if html is None:
+        html = _render(seller, cursor, fragment)
+        cache.set(key, html, STOREFRONT_TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate_storefronts(seller_ids):
+    """Bump the sellers' storefront versions once the current transaction commits."""
+    names = [_version_name(seller_id) for seller_id in set(seller_ids) if seller_id is not None]
+
+    def invalidate():
+        for name in names:
+            bump_version(name)
+
+    if names:
+        transaction.on_commit(invalidate)
@@ -0,0 +1,241 @@
+# marketplace/suggest.py
+"""
+As-you-type suggestions over active product titles and category names.
+
+Each worker keeps a sorted array of ``(key, id)`` product entries, where
+the keys are every word-suffix of the normalized title ("desk lamp",
+"lamp"), so the products matching a prefix are one ``bisect`` range - no
+database and well under a millisecond. Products rank newest first;
+categories, kept in a small array of their own, by how many active
+listings they hold. Short prefixes match too many titles to rank the
+whole range on every keystroke, so for each prefix of up to
+``SHORT_PREFIX`` characters the matching products are also kept in a list
+already in recency order, and a lookup just reads its head.
+
+Product saves and deletes patch this worker's arrays in place after the
+transaction commits, a ``bisect`` and an insert or delete per key, and
+bump a ``suggest`` version counter (``marketplace/versions.py``). Other
+workers see the counter move at their next check, at most once per
+``CHECK_INTERVAL``, and reload from the database. Bulk ``UPDATE``\\ s,
+which send no signals, call ``invalidate_suggestions()``.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import transaction
+
+from .categories import category_registry
+from .models import Product
+from .versions import bump_version, get_version
+
+VERSION_NAME = 'suggest'
+
+MIN_PREFIX = 1
+MAX_WORDS = 8  # word-suffixes indexed per title
+SHORT_PREFIX = 3  # prefixes up to this long read a recency-ordered list instead of a range
+
+PRODUCT = 'p'
+CATEGORY = 'c'
+
+Suggestion = namedtuple('Suggestion', 'kind id label')
+
+
+def normalize(text):
+    """Casefolded, accent-free, punctuation-free, single-spaced ``text``."""
+    text = unicodedata.normalize('NFKD', (text or '').casefold())
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.split())
+
+
+def _keys(text):
+    words = normalize(text).split()[:MAX_WORDS]
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def _short_prefixes(keys):
+    return {key[:n] for key in keys for n in range(MIN_PREFIX, SHORT_PREFIX + 1)}
+
+
+def _recency(pk, created):
+    """Sort key putting the newest product first."""
+    return (-created, -pk)
+
+
+class SuggestIndex:
+    CHECK_INTERVAL = 1.0  # seconds between version checks
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+        self._loaded = False
+        self._entries = []  # sorted (key, product id)
+        self._recent = {}  # short prefix -> sorted _recency() of the products matching it
+        self._products = {}  # id -> (title, created timestamp, category id)
+        self._category_counts = Counter()
+        self._category_entries = []  # sorted (key, category id)
+        self._categories = {}  # id -> name
+        self._category_source = None
+
+    # Building
+
+    def _load(self, version):
+        rows = Product.objects.filter(is_sold=False, expired=False).values_list(
+            'pk', 'title', 'created_at', 'category_id'
+        )
+        products = {pk: (title, created_at.timestamp(), category_id) for pk, title, created_at, category_id in rows}
+        entries = []
+        recent = defaultdict(list)
+        for pk, (title, created, _) in products.items():
+            keys = _keys(title)
+            entries += [(key, pk) for key in keys]
+            for prefix in _short_prefixes(keys):
+                recent[prefix].append(_recency(pk, created))
+        entries.sort()
+        for ranked in recent.values():
+            ranked.sort()
+        self._products = products
+        self._category_counts = Counter(category_id for _, _, category_id in products.values())
+        self._entries = entries
+        self._recent = dict(recent)
+        self._swap_categories(category_registry.all())
+        self._version = version
+        self._loaded = True
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded and self._checked_at is not None and now - self._checked_at < self.CHECK_INTERVAL:
+            return
+        version = get_version(VERSION_NAME)
+        # A None version means there is no usable cache backend; reload every interval
+        if not self._loaded or version != self._version or version is None:
+            with self._lock:
+                self._load(version)
+        else:
+            categories = category_registry.all()
+            if categories is not self._category_source:
+                with self._lock:
+                    self._swap_categories(categories)
+        self._checked_at = now
+
+    def _swap_categories(self, categories):
+        self._category_entries = sorted(
+            (key, category.pk) for category in categories for key in _keys(category.name)
+        )
+        self._categories = {category.pk: category.name for category in categories}
+        self._category_source = categories
+
+    # Incremental updates
+
+    def _apply(self, remove_id, add=None):
+        """Replace product ``remove_id``'s entries with those of ``add`` (a Product), in place."""
+        with self._lock:
+            if not self._loaded:
+                return
+            entries, recent, products = self._entries, self._recent, self._products
+            old = products.get(remove_id)
+            if old is not None:
+                keys = _keys(old[0])
+                for key in keys:
+                    i = bisect_left(entries, (key, remove_id))
+                    if i < len(entries) and entries[i] == (key, remove_id):
+                        del entries[i]
+                rank = _recency(remove_id, old[1])
+                for prefix in _short_prefixes(keys):
+                    ranked = recent.get(prefix, [])
+                    i = bisect_left(ranked, rank)
+                    if i < len(ranked) and ranked[i] == rank:
+                        del ranked[i]
+                del products[remove_id]
+                self._category_counts[old[2]] -= 1
+            if add is not None:
+                created = add.created_at.timestamp()
+                keys = _keys(add.title)
+                for key in keys:
+                    insort(entries, (key, add.pk))
+                for prefix in _short_prefixes(keys):
+                    insort(recent.setdefault(prefix, []), _recency(add.pk, created))
+                products[add.pk] = (add.title, created, add.category_id)
+                self._category_counts[add.category_id] += 1
+            # Stay current only if nobody else changed anything since our last look
+            version = bump_version(VERSION_NAME)
+            if self._version is not None and version == self._version + 1:
+                self._version = version
+
+    def product_changed(self, product):
+        if product.is_active and product.created_at:
+            self._apply(product.pk, product)
+        else:
+            self._apply(product.pk)
+
+    def product_removed(self, product_id):
+        self._apply(product_id)
+
+    # Lookups
+
+    def suggest(self, query, limit=8, category_limit=3):
+        """Up to ``category_limit`` categories, then up to ``limit`` products, matching ``query``."""
+        prefix = normalize(query)
+        if len(prefix) < MIN_PREFIX:
+            return []
+        self._refresh()
+        products = self._products
+
+        category_entries = self._category_entries
+        lo = bisect_left(category_entries, (prefix,))
+        hi = bisect_left(category_entries, (prefix + '\U0010ffff',), lo)
+        counts = self._category_counts
+        categories = heapq.nlargest(
+            category_limit, {pk for _, pk in category_entries[lo:hi]}, key=lambda pk: (counts[pk], -pk)
+        )
+
+        if len(prefix) <= SHORT_PREFIX:
+            # Already newest first; the slice is taken in one step, so a concurrent patch can't tear it
+            newest = [-negative_pk for _, negative_pk in self._recent.get(prefix, [])[:limit]]
+        else:
+            entries = self._entries
+            lo = bisect_left(entries, (prefix,))
+            hi = bisect_left(entries, (prefix + '\U0010ffff',), lo)
+            newest = heapq.nlargest(
+                limit, {pk for _, pk in entries[lo:hi] if pk in products},
+                key=lambda pk: (products.get(pk, ('', 0.0))[1], pk),
+            )
+        labels = [(pk, products.get(pk)) for pk in newest]
+        return (
+            [Suggestion(CATEGORY, pk, self._categories[pk]) for pk in categories if pk in self._categories] +
+            [Suggestion(PRODUCT, pk, product[0]) for pk, product in labels if product is not None]
+        )
+
+    def clear(self):
+        """Drop this process's copy; the next lookup reloads."""
+        with self._lock:
+            self._loaded = False
+            self._checked_at = None
+            self._version = None
+            self._entries = []
+            self._recent = {}
+            self._products = {}
+
+
+suggest_index = SuggestIndex()
+
+
+def index_product(product):
+    """Patch the suggestions for ``product`` once the current transaction commits."""
+    transaction.on_commit(lambda: suggest_index.product_changed(product))
+
+
+def unindex_product(product_id):
+    transaction.on_commit(lambda: suggest_index.product_removed(product_id))
+
+
+def invalidate_suggestions():
+    """Tell every worker to reload, after changes that sent no signals."""
+    def invalidate():
+        bump_version(VERSION_NAME)
+        suggest_index.clear()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,28 @@
+# marketplace/templatetags/responsive_images.py
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from utils.images import srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_img(image, variant='card', **attrs):
+    """
+    ``<img>`` with a srcset for a CloudinaryField value, e.g.
+    ``{% responsive_img product.image 'card' alt=product.title class="card-img-top" %}``.
+    Extra keyword arguments become attributes; images load lazily unless
+    ``loading`` says otherwise.
+    """
+    src, candidates, sizes = srcset(image, variant)
+    if not src:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    attrs.setdefault('alt', '')
+    if candidates:
+        attrs['srcset'] = candidates
+        attrs['sizes'] = sizes
+    return format_html('<img src="{}"{}>', src, flatatt(attrs))
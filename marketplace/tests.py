@@ -1,3 +1,1359 @@
+import time
+import unittest
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from cloudinary.models import CloudinaryField
+from PIL import Image, ImageDraw
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import SellerProfile
+from utils import images
+
+from .alerts import MAX_KEYWORD_LENGTH, SavedSearchError, match_product, save_search, send_digests, word_prefixes
+from .bulk import BulkActionError, run_bulk_action
+from .categories import VERSION_NAME as CATEGORIES_VERSION, CategoryRegistry, category_registry, invalidate_categories
+from .duplicates import hamming, image_fingerprint
+from .counters import recount_categories, recount_sellers, reserve_listing_slot
+from .expiry import prune_runs, run_expiry
+from .facets import PRICE_BUCKETS, apply_filters, compute_facets, get_facets, normalize_filters
+from .models import Category, ExpiryRun, Product, ProductFingerprint, SearchAlert
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, paginate_keyset
+from .policy import get_seller_policy
+from .recommender import build_recommendations, refresh_recommendations
+from .search import SQLiteFTSBackend, SimpleSearchBackend, get_backend, match_expression, search_page, search_products
+from .versions import get_version
+from .popularity import flush_views, view_buffer
+from .suggest import PRODUCT, suggest_index
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+class ProductQueryPlanTests(TestCase):
+    """
+    Every hot path over marketplace_product must be answered from an index:
+    no full table scan and no temp B-tree sort for ORDER BY. Ranked search
+    results are left out on purpose; they sort a bounded set of FTS matches. The views are
+    run for real and each product query they issue is fed to EXPLAIN QUERY PLAN,
+    so a new filter or ordering that misses the indexes fails here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.category, _ = Category.objects.get_or_create(name='Books & Textbooks')
+        Product.objects.bulk_create([
+            Product(
+                seller=cls.seller, category=cls.category, title=f'Item {i}',
+                description='Used item', price=100 + i, condition='good',
+            )
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        # Cached pages would hide the queries under test
+        cache.clear()
+        self.client.force_login(self.seller)
+
+    def product_queries(self, queries):
+        return [
+            q['sql'] for q in queries
+            if 'marketplace_product' in q['sql'] and q['sql'].lstrip().upper().startswith(('SELECT', 'UPDATE'))
+        ]
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlan(self, sql):
+        plan = self.query_plan(sql)
+        for step in plan:
+            # "SCAN ... USING INDEX" is an ordered index walk cut short by LIMIT;
+            # only a scan of the table itself is a regression.
+            self.assertFalse(
+                step.startswith('SCAN marketplace_product') and 'INDEX' not in step,
+                f'Full scan of marketplace_product:\n{sql}\n{plan}',
+            )
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', step, f'Sort without an index:\n{sql}\n{plan}')
+
+    def assertViewIsIndexed(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 500)
+        queries = self.product_queries(ctx.captured_queries)
+        self.assertTrue(queries, f'{url} issued no product queries')
+        for sql in queries:
+            self.assertIndexedPlan(sql)
+        return response
+
+    def next_page_url(self, response):
+        return response.context['next_url']
+
+    def test_marketplace_home(self):
+        response = self.assertViewIsIndexed(reverse('marketplace:home'))
+        self.assertViewIsIndexed(self.next_page_url(response))
+
+    def test_marketplace_home_popular(self):
+        response = self.assertViewIsIndexed(reverse('marketplace:home') + '?sort=popular')
+        self.assertViewIsIndexed(self.next_page_url(response))
+
+    def test_marketplace_home_filters(self):
+        url = reverse('marketplace:home')
+        self.assertViewIsIndexed(f'{url}?category={self.category.pk}')
+        self.assertViewIsIndexed(f'{url}?condition=good&min_price=105&max_price=120')
+
+    def test_category_view(self):
+        response = self.assertViewIsIndexed(reverse('marketplace:category_more', args=[self.category.name]))
+        self.assertViewIsIndexed(self.next_page_url(response))
+
+    def test_seller_views(self):
+        for name in ('my_listings_more', 'my_products_more'):
+            response = self.assertViewIsIndexed(reverse(f'marketplace:{name}'))
+            self.assertViewIsIndexed(self.next_page_url(response))
+        self.assertViewIsIndexed(reverse('marketplace:my_products_more') + '?filter=unsold')
+        self.assertViewIsIndexed(reverse('marketplace:seller_store', args=[self.seller.username]))
+
+    def test_expire_products(self):
+        Product.objects.filter(title__in=['Item 1', 'Item 2', 'Item 3']).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('expire_products', '--chunk-size=2', stdout=StringIO())
+        for sql in self.product_queries(ctx.captured_queries):
+            self.assertIndexedPlan(sql)
+
+
+class ProductSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='sparky', password='pw')
+        cls.other = get_user_model().objects.create_user(username='bookworm', password='pw')
+        cls.category = Category.objects.create(name='Search Test')
+        cls.products = {}
+        for seller, title, description in [
+            (cls.other, 'Study table', 'Sturdy table, a desk lamp fits on it'),
+            (cls.other, 'Desk lamp', 'LED lamp with a flexible neck'),
+            (cls.other, 'Calculus textbook', 'Barely used'),
+            (cls.seller, 'Extension cable', 'Four sockets'),
+        ]:
+            cls.products[title] = Product.objects.create(
+                seller=seller, category=cls.category, title=title, description=description,
+                price=100, condition='good',
+            )
+
+    def titles(self, query, backend=None):
+        queryset = Product.objects.all()
+        results = backend.search(queryset, query) if backend else search_products(queryset, query)
+        return [product.title for product in results]
+
+    def test_match_expression_quotes_every_term(self):
+        self.assertEqual(match_expression('desk "lamp'), '"desk" "lamp"*')
+        self.assertEqual(match_expression('NEAR(a b) OR title:x*'), '"near" "or" "title"*')
+        self.assertIsNone(match_expression('" * -'))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'the FTS5 index is SQLite-only')
+    def test_title_matches_outrank_description_matches(self):
+        self.assertIsInstance(get_backend(), SQLiteFTSBackend)
+        self.assertEqual(self.titles('lamp'), ['Desk lamp', 'Study table'])
+        # The last term is a prefix, FTS5 syntax is just text
+        self.assertEqual(self.titles('calc'), ['Calculus textbook'])
+        self.assertEqual(self.titles('lamp" OR "table'), [])
+        self.assertEqual(self.titles('*'), [])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'the FTS5 index is SQLite-only')
+    def test_ranking_joins_the_index_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.titles('lamp'), ['Desk lamp', 'Study table'])
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertEqual(sql.count('MATCH'), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse([step for step in plan if 'CORRELATED' in step], plan)
+        self.assertTrue([step for step in plan if 'VIRTUAL TABLE INDEX' in step], plan)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'the FTS5 index is SQLite-only')
+    def test_index_follows_saves_deletes_and_seller_renames(self):
+        cable = self.products['Extension cable']
+        cable.title = 'Extension cord'
+        cable.save()
+        self.assertEqual(self.titles('cord'), ['Extension cord'])
+        self.assertEqual(self.titles('cable'), [])
+
+        self.assertEqual(self.titles('sparky'), ['Extension cord'])
+        self.seller.username = 'powerhouse'
+        self.seller.save()
+        self.assertEqual(self.titles('sparky'), [])
+        self.assertEqual(self.titles('powerhouse'), ['Extension cord'])
+
+        cable.delete()
+        self.assertEqual(self.titles('cord'), [])
+
+    def test_simple_backend(self):
+        backend = SimpleSearchBackend()
+        self.assertEqual(set(self.titles('lamp', backend)), {'Desk lamp', 'Study table'})
+        self.assertEqual(self.titles('desk flexible', backend), ['Desk lamp'])
+        self.assertEqual(self.titles('bookworm textbook', backend), ['Calculus textbook'])
+        self.assertEqual(self.titles('!', backend), [])
+
+    def test_search_page(self):
+        first = search_page(Product.objects.all(), 'lamp', per_page=1)
+        self.assertEqual((len(first), first.number, first.has_next, first.has_previous), (1, 1, True, False))
+        second = search_page(Product.objects.all(), 'lamp', page='2', per_page=1)
+        self.assertEqual((second.number, second.has_next, second.has_previous), (2, False, True))
+        self.assertNotEqual(list(first), list(second))
+        self.assertEqual(search_page(Product.objects.all(), 'lamp', page='x').number, 1)
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.category = Category.objects.create(name='Paging Test')
+        Product.objects.bulk_create([
+            Product(
+                seller=cls.seller, category=cls.category, title=f'Item {i}',
+                description='Used item', price=100, condition='good',
+            )
+            for i in range(7)
+        ])
+        # Several listings sharing one timestamp must still page without gaps or repeats
+        same_time = timezone.now() - timedelta(hours=1)
+        Product.objects.filter(title__in=['Item 2', 'Item 3', 'Item 4', 'Item 5']).update(created_at=same_time)
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now().replace(microsecond=123456)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+        for token in ('', 'garbage', encode_cursor(created_at, 42)[:-3] + '!!', 'MTIzOmFiYw'):
+            with self.subTest(token=token), self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+
+    def test_pages_walk_everything_once_in_order(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        seen = []
+        cursor = None
+        while True:
+            page = paginate_keyset(Product.objects.all(), cursor, per_page=2)
+            seen += [product.pk for product in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+        # The last page has no cursor onwards
+        self.assertEqual(len(page), 1)
+        self.assertIsNone(page.next_cursor)
+
+        exact = paginate_keyset(Product.objects.all(), per_page=7)
+        self.assertEqual((len(exact), exact.has_next), (7, False))
+
+    def test_tampered_cursor_gives_first_page(self):
+        page = paginate_keyset(Product.objects.all(), 'not-a-cursor', per_page=3)
+        self.assertTrue(page.is_first)
+        self.assertEqual(list(page), list(paginate_keyset(Product.objects.all(), per_page=3)))
+
+    def test_load_more_fragment(self):
+        Product.objects.bulk_create([
+            Product(
+                seller=self.seller, category=self.category, title=f'Extra {i}',
+                description='Used item', price=100, condition='good',
+            )
+            for i in range(20)
+        ])
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('marketplace:home_more'))
+        self.assertTemplateUsed(response, 'marketplace/product_page.html')
+        self.assertTemplateNotUsed(response, 'marketplace/home.html')
+        self.assertEqual(len(response.context['products']), 24)
+
+        response = self.client.get(response.context['next_url'])
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertIsNone(response.context['next_url'])
+
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.books = Category.objects.create(name='Facet Books')
+        cls.phones = Category.objects.create(name='Facet Phones')
+        for title, category, condition, price in [
+            ('Calculus textbook', cls.books, 'good', 300),
+            ('Physics textbook', cls.books, 'new', 1200),
+            ('Old novel', cls.books, 'poor', 50),
+            ('Android phone', cls.phones, 'good', 8000),
+            ('Phone charger', cls.phones, 'new', 700),
+        ]:
+            Product.objects.create(
+                seller=cls.seller, category=category, title=title, description='Used item',
+                price=price, condition=condition,
+            )
+        Product.objects.create(
+            seller=cls.seller, category=cls.books, title='Sold textbook', description='Used item',
+            price=400, condition='good', is_sold=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_normalize_filters_drops_bad_values(self):
+        filters = normalize_filters({
+            'category': '²', 'condition': 'broken', 'min_price': '-5', 'max_price': 'nan', 'q': 'Used  TEXTBOOK',
+        })
+        self.assertEqual(filters, {
+            'category': None, 'condition': None, 'min_price': None, 'max_price': None, 'search': 'used textbook',
+        })
+        self.assertEqual(normalize_filters({'category': ' 7', 'min_price': '10.50'})['min_price'], '10.50')
+        self.assertIsNone(normalize_filters({'category': ' 7'})['category'])
+        self.assertEqual(normalize_filters({'category': str(self.books.pk)})['category'], self.books.pk)
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('marketplace:home'), {'category': '٣²'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_apply_filters(self):
+        filters = normalize_filters({'category': str(self.books.pk), 'min_price': '100', 'search': 'textbook'})
+        titles = set(apply_filters(Product.objects.filter(is_sold=False), filters).values_list('title', flat=True))
+        self.assertEqual(titles, {'Calculus textbook', 'Physics textbook'})
+        titles = apply_filters(Product.objects.filter(is_sold=False), filters, skip=('category', 'price', 'search'))
+        self.assertEqual(titles.count(), 5)
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = compute_facets(normalize_filters({'category': str(self.books.pk), 'condition': 'good'}))
+        self.assertEqual(facets['total'], 1)
+        # Other categories still counted under the condition filter...
+        self.assertEqual(facets['categories'], {self.books.pk: 1, self.phones.pk: 1})
+        # ...and other conditions under the category filter
+        self.assertEqual(facets['conditions'], {'good': 1, 'new': 1, 'poor': 1})
+        self.assertEqual(facets['prices'], {0: 1})
+
+        facets = compute_facets(normalize_filters({}))
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual(sum(facets['prices'].values()), 5)
+        self.assertEqual(facets['prices'][len(PRICE_BUCKETS) - 2], 1)
+
+    def test_cached_until_products_change(self):
+        filters = normalize_filters({})
+        self.assertEqual(get_facets(filters)['total'], 5)
+        with self.assertNumQueries(0):
+            get_facets(filters)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            phone = Product.objects.create(
+                seller=self.seller, category=self.phones, title='Feature phone', description='Used item',
+                price=1500, condition='fair',
+            )
+        self.assertEqual(get_facets(filters)['total'], 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            phone.delete()
+        self.assertEqual(get_facets(filters)['total'], 5)
+
+
+class CategoryRegistryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.books = Category.objects.create(name='Registry Books & Notes')
+
+    def setUp(self):
+        cache.clear()
+        self.registry = CategoryRegistry()
+
+    def test_lookups_without_queries(self):
+        self.registry.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.registry.get(self.books.pk), self.books)
+            self.assertEqual(self.registry.get(str(self.books.pk)), self.books)
+            self.assertIsNone(self.registry.get('books'))
+            self.assertEqual(self.registry.get_by_name('registry books & NOTES'), self.books)
+            self.assertEqual(self.registry.get_by_name('registry-books-notes'), self.books)
+            self.assertIsNone(self.registry.get_by_name('Furniture'))
+
+    def test_reloads_when_the_version_moves(self):
+        self.registry.CHECK_INTERVAL = 0
+        self.assertEqual(self.registry.get(self.books.pk).name, 'Registry Books & Notes')
+        with self.captureOnCommitCallbacks(execute=True):
+            # Another worker's edit, seen here only through the shared version
+            Category.objects.filter(pk=self.books.pk).update(name='Registry Textbooks')
+            invalidate_categories()
+        self.assertEqual(self.registry.get(self.books.pk).name, 'Registry Textbooks')
+        with self.assertNumQueries(0):
+            self.registry.get(self.books.pk)
+
+    def test_version_moves_only_on_commit(self):
+        before = get_version(CATEGORIES_VERSION)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Category.objects.create(name='Registry Lamps')
+            self.assertEqual(get_version(CATEGORIES_VERSION), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(CATEGORIES_VERSION), before)
+
+    def test_listing_changes_leave_the_registry_alone(self):
+        before = get_version(CATEGORIES_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                seller=self.seller, category=self.books, title='Notes', description='Used item',
+                price=100, condition='good',
+            )
+            product.is_sold = True
+            product.save()
+            product.delete()
+        self.assertEqual(get_version(CATEGORIES_VERSION), before)
+
+    def test_counts_are_read_live(self):
+        self.client.force_login(self.seller)
+        category_registry.clear()
+        category_registry.all()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                seller=self.seller, category=self.books, title='Notes', description='Used item',
+                price=100, condition='good',
+            )
+        counts = {category.pk: category.active_product_count for category in category_registry.with_counts()}
+        self.assertEqual(counts[self.books.pk], 1)
+        response = self.client.get(reverse('marketplace:category', args=[self.books.name]))
+        self.assertEqual(response.context['category'].active_product_count, 1)
+
+    def test_admin_edit_reaches_the_registry(self):
+        admin = get_user_model().objects.create_superuser(username='admin', password='pw', email='a@example.com')
+        self.client.force_login(admin)
+        category_registry.get(self.books.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:marketplace_category_change', args=[self.books.pk]),
+                {'name': 'Registry Course Books', 'description': '', 'icon': ''},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(category_registry.get(self.books.pk).name, 'Registry Course Books')
+        self.assertEqual(category_registry.get_by_name('registry-course-books'), self.books)
+
+
+class ExpiryEngineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.category = Category.objects.create(name='Expiry Test')
+
+    def make_product(self, title, expires_in_days, **kwargs):
+        return Product.objects.create(
+            seller=self.seller, category=self.category, title=title, description='Used item',
+            price=100, condition='good', expires_at=timezone.now() + timedelta(days=expires_in_days), **kwargs
+        )
+
+    def test_expires_in_chunks_and_keeps_counters(self):
+        for i in range(5):
+            self.make_product(f'Old {i}', -1)
+        self.make_product('Sold', -1, is_sold=True)
+        fresh = self.make_product('Fresh', 3)
+
+        run = run_expiry(chunk_size=2)
+
+        self.assertEqual((run.expired_count, run.chunks, run.scanned), (5, 3, 5))
+        self.assertEqual(Product.objects.filter(expired=True).count(), 5)
+        self.assertFalse(Product.objects.get(pk=fresh.pk).expired)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.active_product_count, 1)
+
+    def test_incremental_run_catches_listings_behind_the_watermark(self):
+        sold = self.make_product('Sold', -3, is_sold=True)
+        first = run_expiry()
+        self.assertEqual(first.expired_count, 0)
+        # Edited into the past, and marked available after expiring: both behind the watermark
+        stale = self.make_product('Edited', 3)
+        Product.objects.filter(pk=stale.pk).update(expires_at=timezone.now() - timedelta(days=2))
+        self.client.force_login(get_user_model().objects.create_superuser(username='admin', password='pw'))
+        self.client.post(reverse('admin:marketplace_product_changelist'), {
+            'action': 'mark_as_available', '_selected_action': [sold.pk],
+        })
+        self.make_product('New', -1)
+
+        run = run_expiry()
+        self.assertEqual(run.since, first.until)
+        self.assertEqual(run.expired_count, 3)
+        self.assertEqual(Product.objects.filter(expired=False).count(), 0)
+
+    def test_run_log_is_pruned_but_keeps_the_watermark(self):
+        now = timezone.now()
+        for days in range(5, 0, -1):
+            run_expiry(now=now - timedelta(days=days))
+        with mock.patch('marketplace.expiry.KEEP_RUNS', 3):
+            run_expiry(now=now)
+        self.assertEqual(ExpiryRun.objects.count(), 3)
+        self.assertEqual(ExpiryRun.objects.order_by('-until').first().until, now)
+
+        # A crashed, unfinished run can push the watermark run out of the window; it stays
+        self.assertEqual(prune_runs(keep=1), 2)
+        ExpiryRun.objects.create(until=now + timedelta(hours=1))
+        self.assertEqual(prune_runs(keep=1), 0)
+        self.assertEqual(ExpiryRun.objects.count(), 2)
+        self.assertTrue(ExpiryRun.objects.filter(until=now).exists())
+
+
+class SellerPolicyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.category = Category.objects.create(name='Policy Test')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.seller)
+
+    def post_listing(self, title):
+        return self.client.post(reverse('marketplace:create_product'), {
+            'title': title, 'description': 'Used item', 'category': self.category.pk,
+            'price': '100', 'condition': 'good',
+        })
+
+    def test_listing_creation_skips_profile_and_count_queries(self):
+        self.assertEqual(get_seller_policy(self.seller.pk).active_count, 0)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_listing('Desk lamp')
+        self.assertEqual(response.status_code, 302)
+        product = Product.objects.get(title='Desk lamp')
+        self.assertIsNotNone(product.expires_at)
+        for query in ctx.captured_queries:
+            # The quota is taken with one conditional UPDATE, never a read
+            if query['sql'].startswith('SELECT'):
+                self.assertNotIn('accounts_sellerprofile', query['sql'])
+                self.assertNotIn('COUNT(', query['sql'])
+        self.assertEqual(
+            sum(q['sql'].startswith('INSERT INTO "marketplace_product"') for q in ctx.captured_queries), 1
+        )
+
+    def test_policy_follows_listing_and_profile_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_listing('Desk lamp')
+        # Default limit is one active listing
+        self.assertFalse(get_seller_policy(self.seller.pk).can_post_more_listings())
+        self.post_listing('Second lamp')
+        self.assertEqual(Product.objects.filter(seller=self.seller).count(), 1)
+
+        profile = self.seller.seller_profile
+        profile.max_listings = 5
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertTrue(get_seller_policy(self.seller.pk).can_post_more_listings())
+
+        product = Product.objects.get(title='Desk lamp')
+        product.is_sold = True
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(get_seller_policy(self.seller.pk).active_count, 0)
+
+
+class ListingQuotaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.category = Category.objects.create(name='Quota Test')
+
+    def make_product(self, title):
+        product = Product(
+            seller=self.seller, category=self.category, title=title, description='Used item',
+            price=100, condition='good',
+        )
+        if reserve_listing_slot(product):
+            product.save()
+            return product
+        return None
+
+    def active_count(self):
+        return SellerProfile.objects.get(user=self.seller).active_listing_count
+
+    def test_quota_is_enforced_by_the_counter(self):
+        first = self.make_product('Lamp')
+        self.assertIsNotNone(first)
+        self.assertEqual(self.active_count(), 1)
+        # Default limit is one active listing
+        self.assertIsNone(self.make_product('Chair'))
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_profile_saves_keep_the_counter_and_survive_deletes(self):
+        self.make_product('Lamp')
+        profile = SellerProfile.objects.get(user=self.seller)
+        SellerProfile.objects.filter(pk=profile.pk).update(active_listing_count=1)
+        profile.active_listing_count = 0
+        profile.store_name = 'Lamp Corner'
+        profile.save()
+        self.assertEqual(self.active_count(), 1)
+        self.assertEqual(SellerProfile.objects.get(pk=profile.pk).store_name, 'Lamp Corner')
+
+        SellerProfile.objects.filter(pk=profile.pk).delete()
+        profile.save()
+        self.assertEqual(SellerProfile.objects.get(pk=profile.pk).store_name, 'Lamp Corner')
+
+    def test_counter_follows_sold_relist_expiry_and_delete(self):
+        SellerProfile.objects.filter(user=self.seller).update(max_listings=5)
+        lamp = self.make_product('Lamp')
+        chair = self.make_product('Chair')
+        self.assertEqual(self.active_count(), 2)
+
+        lamp.is_sold = True
+        lamp.save()
+        self.assertEqual(self.active_count(), 1)
+        lamp.is_sold = False
+        lamp.save()
+        self.assertEqual(self.active_count(), 2)
+
+        Product.objects.filter(pk=chair.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        run_expiry()
+        self.assertEqual(self.active_count(), 1)
+
+        lamp.delete()
+        self.assertEqual(self.active_count(), 0)
+        self.assertEqual(recount_sellers(), 0)
+
+
+class CategoryCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.books = Category.objects.create(name='Counter Books')
+        cls.phones = Category.objects.create(name='Counter Phones')
+
+    def make_product(self, title, category=None):
+        return Product.objects.create(
+            seller=self.seller, category=category or self.books, title=title, description='Used item',
+            price=100, condition='good',
+        )
+
+    def counts(self):
+        return tuple(
+            Category.objects.get(pk=category.pk).active_product_count for category in (self.books, self.phones)
+        )
+
+    def test_counts_follow_each_transition(self):
+        lamp = self.make_product('Lamp')
+        chair = self.make_product('Chair')
+        self.assertEqual(self.counts(), (2, 0))
+
+        lamp.is_sold = True
+        lamp.save()
+        self.assertEqual(self.counts(), (1, 0))
+        lamp.is_sold = False
+        lamp.save()
+        self.assertEqual(self.counts(), (2, 0))
+
+        chair.category = self.phones
+        chair.save()
+        self.assertEqual(self.counts(), (1, 1))
+        # Fields left out of update_fields keep their saved values
+        chair.category = self.books
+        chair.save(update_fields=['title'])
+        self.assertEqual(self.counts(), (1, 1))
+
+        Product.objects.filter(pk=lamp.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        run_expiry()
+        self.assertEqual(self.counts(), (0, 1))
+
+        Product.objects.get(pk=chair.pk).delete()
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertEqual(recount_categories(), 0)
+
+    def test_stale_copies_move_the_count_once(self):
+        self.make_product('Lamp')
+        first, second = Product.objects.get(title='Lamp'), Product.objects.get(title='Lamp')
+        for copy in (first, second):
+            copy.is_sold = True
+            copy.save()
+        self.assertEqual(self.counts(), (0, 0))
+        second.is_sold = False
+        second.save()
+        first.save()
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertEqual(recount_categories(), 0)
+
+    def test_reconcile_command_repairs_drift(self):
+        self.make_product('Lamp')
+        self.make_product('Phone', self.phones)
+        Category.objects.filter(pk=self.books.pk).update(active_product_count=7)
+        SellerProfile.objects.filter(user=self.seller).update(active_listing_count=0)
+        out = StringIO()
+        call_command('reconcile_category_counts', stdout=out)
+        self.assertIn('1 categories had drifted', out.getvalue())
+        self.assertIn('1 seller listing counts had drifted', out.getvalue())
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(SellerProfile.objects.get(user=self.seller).active_listing_count, 2)
+
+        out = StringIO()
+        call_command('reconcile_category_counts', stdout=out)
+        self.assertIn('0 categories had drifted', out.getvalue())
+
+
+class RecommenderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.books, _ = Category.objects.get_or_create(name='Books & Textbooks')
+        cls.electronics, _ = Category.objects.get_or_create(name='Electronics & Gadgets')
+        items = [
+            ('Calculus textbook 8th edition', 'Stewart calculus, barely highlighted', cls.books, 800),
+            ('Calculus early transcendentals', 'Stewart textbook for MAT 101', cls.books, 900),
+            ('Organic chemistry textbook', 'Clayden, good for CHEM 201', cls.books, 1200),
+            ('Scientific calculator', 'Casio fx-991 for calculus exams', cls.electronics, 1500),
+            ('Bluetooth speaker', 'Loud JBL speaker with charger', cls.electronics, 3000),
+        ]
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, category=category, title=title, description=description,
+                    price=price, condition='good')
+            for title, description, category, price in items
+        ])
+
+    def test_neighbours_are_ranked_by_similarity(self):
+        self.assertEqual(build_recommendations(), 5)
+        calculus = Product.objects.get(title='Calculus textbook 8th edition')
+        related = [p.title for p in calculus.related_products()]
+        self.assertEqual(related[0], 'Calculus early transcendentals')
+        self.assertIn('Organic chemistry textbook', related)
+        if 'Bluetooth speaker' in related:
+            self.assertLess(related.index('Organic chemistry textbook'), related.index('Bluetooth speaker'))
+
+    def test_incremental_build_and_single_lookup(self):
+        build_recommendations()
+        self.assertEqual(build_recommendations(), 0)
+        speaker = Product.objects.get(title='Bluetooth speaker')
+        speaker.title = 'Calculus study guide'
+        speaker.save()
+        self.assertGreater(build_recommendations(), 0)
+
+        self.client.force_login(self.seller)
+        calculus = Product.objects.get(title='Calculus textbook 8th edition')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('marketplace:product_detail', args=[calculus.pk]))
+        self.assertIn(speaker, response.context['related_products'])
+        lookups = [q['sql'] for q in ctx.captured_queries if 'marketplace_relatedproduct' in q['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertIndexedLookup(lookups[0])
+
+    def test_refresh_follows_bulk_updates(self):
+        self.assertEqual(refresh_recommendations(), 5)
+        self.assertIsNone(refresh_recommendations())  # nothing changed
+        speaker = Product.objects.get(title='Bluetooth speaker')
+        with self.captureOnCommitCallbacks(execute=True):
+            run_bulk_action(self.seller, 'price', [speaker.pk], {'percent': '-50'})
+        # update() sends no post_save, but the listing is still seen as changed
+        self.assertGreater(refresh_recommendations(), 0)
+        self.assertIsNone(refresh_recommendations())
+
+    def assertIndexedLookup(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertNotIn('SCAN marketplace_relatedproduct', plan.replace('USING INDEX', ''), plan)
+
+
+class ProductsApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.category = Category.objects.create(name='API Test')
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, category=cls.category, title=f'Item {i}', description='Used item',
+                    price=100 + i, condition='good')
+            for i in range(5)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.seller)
+        self.url = reverse('marketplace:api_products')
+
+    def test_sparse_fields_and_cursor(self):
+        response = self.client.get(self.url, {'fields': 'id,title,seller', 'limit': 3})
+        data = response.json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(set(data['results'][0]), {'id', 'title', 'seller'})
+        self.assertEqual(data['results'][0]['seller']['username'], 'seller')
+        rest = self.client.get(data['next']).json()
+        self.assertEqual(len(rest['results']), 2)
+        self.assertIsNone(rest['next'])
+        self.assertEqual(self.client.get(self.url, {'fields': 'nope'}).status_code, 400)
+
+    def test_tampered_cursor_is_a_bad_request(self):
+        response = self.client.get(self.url, {'limit': 3})
+        cursor = response.json()['next'].split('cursor=')[1]
+        for bad in ('garbage', cursor[:-2] + '!!'):
+            with self.subTest(cursor=bad):
+                response = self.client.get(self.url, {'cursor': bad})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json()['error'])
+
+    def test_unchanged_collection_returns_304_without_product_queries(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in ctx.captured_queries if 'marketplace_product' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(title='Item 0').save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class ResponsiveImageTests(TestCase):
+
+    def setUp(self):
+        images.clear_cache()
+        self.addCleanup(images.clear_cache)
+        self.image = CloudinaryField().to_python('image/upload/v1712345/product_images/abc123.jpg')
+
+    def test_urls_are_built_from_public_id_and_memoized(self):
+        with self.settings(CLOUDINARY_STORAGE={'CLOUD_NAME': 'campus'}), \
+                mock.patch.object(images.cloudinary, 'config', return_value=mock.Mock(cloud_name=None)):
+            src, candidates, sizes = images.srcset(self.image, 'card')
+            images.srcset(self.image, 'card')
+        self.assertEqual(
+            src,
+            'https://res.cloudinary.com/campus/image/upload/c_fill,w_480,ar_4:3,g_auto/f_auto,q_auto/v1712345/product_images/abc123',
+        )
+        self.assertEqual(candidates.count('w,'), 3)
+        self.assertEqual(images._variant.cache_info().hits, 1)
+
+    def test_template_tag(self):
+        with self.settings(CLOUDINARY_STORAGE={'CLOUD_NAME': 'campus'}), \
+                mock.patch.object(images.cloudinary, 'config', return_value=mock.Mock(cloud_name=None)):
+            html = Template(
+                "{% load responsive_images %}{% responsive_img image 'thumbnail' alt=title %}"
+            ).render(Context({'image': self.image, 'title': 'Desk & lamp'}))
+        self.assertIn('srcset="https://res.cloudinary.com/campus/image/upload/c_fill,w_64,', html)
+        self.assertIn('alt="Desk &amp; lamp"', html)
+        self.assertIn('loading="lazy"', html)
+
+
+class FavoriteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.buyer = get_user_model().objects.create_user(username='buyer', password='pw')
+        cls.category = Category.objects.create(name='Favorites Test')
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, category=cls.category, title=f'Item {i}', description='Used item',
+                    price=100 + i, condition='good')
+            for i in range(6)
+        ])
+        cls.liked = Product.objects.get(title='Item 2')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.buyer)
+
+    def grid_flags(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('marketplace:home'))
+        flags = {product.title: product.is_favorited for product in response.context['products']}
+        favorite_queries = [q['sql'] for q in ctx.captured_queries if 'marketplace_productfavorite' in q['sql']]
+        return flags, favorite_queries
+
+    def test_toggle_and_grid_flags(self):
+        url = reverse('marketplace:toggle_favorite', args=[self.liked.pk])
+        response = self.client.post(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {'product': self.liked.pk, 'favorited': True})
+
+        # Warm cache: the flag comes from the cached ids, no favorites query at all
+        flags, queries = self.grid_flags()
+        self.assertEqual([title for title, flag in flags.items() if flag], ['Item 2'])
+        self.assertEqual(queries, [])
+
+        # Cold cache: one EXISTS subquery inside the product query
+        cache.clear()
+        flags, queries = self.grid_flags()
+        self.assertEqual([title for title, flag in flags.items() if flag], ['Item 2'])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('EXISTS', queries[0])
+
+        self.client.post(url)
+        flags, _ = self.grid_flags()
+        self.assertFalse(any(flags.values()))
+
+    def test_favorites_page_lists_favorites(self):
+        self.client.post(reverse('marketplace:toggle_favorite', args=[self.liked.pk]))
+        response = self.client.get(reverse('marketplace:favorites'))
+        self.assertEqual([p.pk for p in response.context['products']], [self.liked.pk])
+        self.assertContains(response, 'fas fa-heart')
+
+
+class StorefrontCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.buyer = get_user_model().objects.create_user(username='buyer', password='pw')
+        cls.category = Category.objects.create(name='Storefront Test')
+        cls.lamp = Product.objects.create(
+            seller=cls.seller, category=cls.category, title='Desk lamp', description='Used item',
+            price=100, condition='good',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.buyer)
+        self.url = reverse('marketplace:seller_store', args=[self.seller.username])
+
+    def product_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q for q in ctx.captured_queries if 'marketplace_product' in q['sql']]
+
+    def test_burst_renders_once_and_follows_changes(self):
+        response, queries = self.product_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, 'Desk lamp')
+        # Hearts in the shared HTML carry no CSRF token
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+        response, queries = self.product_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Desk lamp')
+
+        self.lamp.title = 'Reading lamp'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lamp.save()
+        response, _ = self.product_queries()
+        self.assertContains(response, 'Reading lamp')
+
+        profile = SellerProfile.objects.get(user=self.seller)
+        profile.store_name = 'Lamp Corner'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        response, _ = self.product_queries()
+        self.assertContains(response, 'Lamp Corner')
+
+
+class BulkActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.other = get_user_model().objects.create_user(username='other', password='pw')
+        cls.category = Category.objects.create(name='Bulk Test')
+        SellerProfile.objects.filter(user=cls.seller).update(max_listings=3)
+        cls.mine = [
+            Product.objects.create(
+                seller=cls.seller, category=cls.category, title=f'Item {i}', description='Used item',
+                price=100, condition='good',
+            )
+            for i in range(3)
+        ]
+        cls.theirs = Product.objects.create(
+            seller=cls.other, category=cls.category, title='Not mine', description='Used item',
+            price=100, condition='good',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self):
+        return [p.pk for p in self.mine] + [self.theirs.pk]
+
+    def assertCountersExact(self):
+        self.assertEqual(recount_categories(), 0)
+        self.assertEqual(recount_sellers(), 0)
+
+    def test_ownership_is_part_of_the_update(self):
+        changed, _ = run_bulk_action(self.seller, 'price', self.ids(), {'percent': '-10'})
+        self.assertEqual(changed, 3)
+        self.assertEqual(Product.objects.get(pk=self.theirs.pk).price, 100)
+        self.assertEqual(Product.objects.get(pk=self.mine[0].pk).price, 90)
+
+        changed, _ = run_bulk_action(self.seller, 'delete', self.ids(), {})
+        self.assertEqual(changed, 3)
+        self.assertTrue(Product.objects.filter(pk=self.theirs.pk).exists())
+        self.assertCountersExact()
+
+    def test_counters_recounted_once_per_batch(self):
+        with CaptureQueriesContext(connection) as ctx:
+            run_bulk_action(self.seller, 'sold', self.ids(), {})
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "marketplace_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(SellerProfile.objects.get(user=self.seller).active_listing_count, 0)
+        self.assertEqual(Category.objects.get(pk=self.category.pk).active_product_count, 1)
+        self.assertCountersExact()
+
+    def test_caches_are_dropped_only_after_commit(self):
+        facets, storefront = get_version('products'), get_version(f'storefront:{self.seller.pk}')
+        with self.captureOnCommitCallbacks() as callbacks:
+            run_bulk_action(self.seller, 'sold', self.ids(), {})
+        # Nothing bumped while the batch's transaction was still open
+        self.assertEqual(get_version('products'), facets)
+        self.assertEqual(get_version(f'storefront:{self.seller.pk}'), storefront)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version('products'), facets)
+        self.assertNotEqual(get_version(f'storefront:{self.seller.pk}'), storefront)
+
+    def test_relist_respects_quota(self):
+        run_bulk_action(self.seller, 'sold', self.ids(), {})
+        SellerProfile.objects.filter(user=self.seller).update(max_listings=2)
+        changed, skipped = run_bulk_action(self.seller, 'relist', self.ids(), {})
+        self.assertEqual((changed, skipped), (2, 1))
+        self.assertEqual(SellerProfile.objects.get(user=self.seller).active_listing_count, 2)
+        self.assertCountersExact()
+
+    def test_extend_and_bad_input(self):
+        before = Product.objects.get(pk=self.mine[0].pk).expires_at
+        run_bulk_action(self.seller, 'extend', self.ids(), {'days': '7'})
+        self.assertEqual(Product.objects.get(pk=self.mine[0].pk).expires_at, before + timedelta(days=7))
+        self.assertEqual(Product.objects.get(pk=self.theirs.pk).expires_at, self.theirs.expires_at)
+        with self.assertRaises(BulkActionError):
+            run_bulk_action(self.seller, 'extend', self.ids(), {'days': '90'})
+        with self.assertRaises(BulkActionError):
+            run_bulk_action(self.seller, 'price', self.ids(), {'percent': 'nan'})
+        with self.assertRaises(BulkActionError):
+            run_bulk_action(self.seller, 'explode', self.ids(), {})
+
+    def test_endpoint(self):
+        self.client.force_login(self.seller)
+        self.assertContains(self.client.get(reverse('marketplace:my_listings')), 'form="bulk-form"', count=3)
+        response = self.client.post(
+            reverse('marketplace:bulk_listings'), {'action': 'sold', 'ids': self.ids()},
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.json(), {'action': 'sold', 'changed': 3, 'skipped': 0})
+        response = self.client.post(reverse('marketplace:bulk_listings'), {'action': 'sold'})
+        self.assertRedirects(response, reverse('marketplace:my_listings'))
+
+
+class SuggestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.furniture = Category.objects.create(name='Dorm Furniture')
+        cls.lamp = Product.objects.create(
+            seller=cls.seller, category=cls.furniture, title='Desk lamp', description='Used item',
+            price=100, condition='good',
+        )
+        Product.objects.create(
+            seller=cls.seller, category=cls.furniture, title='Old sofa', description='Used item',
+            price=100, condition='good', is_sold=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+        suggest_index.clear()
+
+    def labels(self, query):
+        return [item.label for item in suggest_index.suggest(query)]
+
+    def products(self, query):
+        return [item.label for item in suggest_index.suggest(query) if item.kind == PRODUCT]
+
+    def test_prefix_lookup_without_queries(self):
+        self.assertEqual(self.labels('lam'), ['Desk lamp'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('DESK  L'), ['Desk lamp'])
+            self.assertEqual(self.labels('furn')[0], 'Dorm Furniture')  # most active listings first
+            self.assertEqual(self.labels('sofa'), [])  # sold
+            started = time.perf_counter()
+            for _ in range(200):
+                suggest_index.suggest('d')
+            self.assertLess((time.perf_counter() - started) / 200, 0.005)
+
+    def test_follows_saves_and_bulk_updates(self):
+        self.labels('desk')
+        with self.captureOnCommitCallbacks(execute=True):
+            chair = Product.objects.create(
+                seller=self.seller, category=self.furniture, title='Desk chair', description='Used item',
+                price=50, condition='good',
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('desk'), ['Desk chair', 'Desk lamp'])
+
+        chair.is_sold = True
+        with self.captureOnCommitCallbacks(execute=True):
+            chair.save()
+        self.assertEqual(self.labels('desk'), ['Desk lamp'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_bulk_action(self.seller, 'sold', [self.lamp.pk])
+        self.assertEqual(self.labels('desk'), [])
+
+    def test_short_prefixes_rank_by_recency_not_spelling(self):
+        self.labels('d')
+        with self.captureOnCommitCallbacks(execute=True):
+            for title in ['Dumbbells', 'Drawer unit', 'Dartboard', 'Desk fan']:
+                Product.objects.create(
+                    seller=self.seller, category=self.furniture, title=title, description='Used item',
+                    price=50, condition='good',
+                )
+        expected = ['Desk fan', 'Dartboard', 'Drawer unit', 'Dumbbells', 'Desk lamp']
+        self.assertEqual(self.products('d'), expected)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(title='Dartboard').delete()
+        patched = {query: self.products(query) for query in ['d', 'de', 'des', 'desk', 'dr']}
+        self.assertEqual(patched['d'], ['Desk fan', 'Drawer unit', 'Dumbbells', 'Desk lamp'])
+        # Patching in place leaves the same index a reload builds
+        suggest_index.clear()
+        self.assertEqual({query: self.products(query) for query in patched}, patched)
+
+    def test_endpoint(self):
+        self.assertEqual(self.client.get(reverse('marketplace:suggest'), {'q': 'de'}).status_code, 401)
+        self.client.force_login(self.seller)
+        data = self.client.get(reverse('marketplace:suggest'), {'q': 'de'}).json()
+        self.assertEqual(data['suggestions'], [{
+            'type': 'product', 'id': self.lamp.pk, 'label': 'Desk lamp',
+            'url': reverse('marketplace:product_detail', args=[self.lamp.pk]),
+        }])
+
+
+class SavedSearchAlertTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', email='seller@example.com', password='pw')
+        cls.buyer = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        cls.books = Category.objects.create(name='Alert Books')
+        cls.lamps = Category.objects.create(name='Alert Lamps')
+        SellerProfile.objects.filter(user=cls.seller).update(max_listings=10)
+        cls.calculus = save_search(cls.buyer, {'search': 'calculus textbook', 'category': str(cls.books.pk), 'max_price': '500'})
+        cls.any_lamp = save_search(cls.buyer, {'category': str(cls.lamps.pk)})
+
+    def post(self, title, category, price=300):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                seller=self.seller, category=category, title=title, description='Barely used',
+                price=price, condition='good',
+            )
+
+    def alerted(self):
+        return set(SearchAlert.objects.values_list('saved_search__name', 'product__title'))
+
+    def test_matches_only_candidate_searches(self):
+        self.post('Calculus textbook, 9th edition', self.books)
+        self.post('Calculus workbook', self.books)  # misses a keyword
+        self.post('Calculus textbook', self.books, price=900)  # over budget
+        self.post('Desk lamp', self.lamps)
+        self.assertEqual(self.alerted(), {
+            (self.calculus.name, 'Calculus textbook, 9th edition'),
+            (self.any_lamp.name, 'Desk lamp'),
+        })
+        # Term lookup, candidate searches, alert insert
+        product = Product.objects.select_related('seller').get(title='Desk lamp')
+        with self.assertNumQueries(3):
+            match_product(product)
+
+    def test_last_keyword_is_a_prefix_like_the_browse_search(self):
+        lam = save_search(self.buyer, {'search': 'desk lam'})
+        self.assertEqual(
+            sorted(lam.terms.values_list('term', 'prefix')), [('desk', False), ('lam', True)]
+        )
+        self.post('Desk lamp', self.lamps)
+        self.post('Lamp for a desktop', self.lamps)  # "desk" is a whole word, not a prefix
+        self.assertIn((lam.name, 'Desk lamp'), self.alerted())
+        self.assertNotIn((lam.name, 'Lamp for a desktop'), self.alerted())
+        # The browse page finds the same listing
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('marketplace:home'), {'search': 'desk lam'})
+        self.assertEqual([product.title for product in response.context['products']], ['Desk lamp'])
+
+    def test_prefix_lookups_stay_bounded(self):
+        words = ['lamp', 'lampshade', 'x' * 200]
+        prefixes = word_prefixes(words)
+        self.assertEqual(len(prefixes), len(set(prefixes)))
+        self.assertNotIn('lamp', prefixes)
+        self.assertIn('lampshad', prefixes)
+        self.assertEqual(max(map(len, prefixes)), MAX_KEYWORD_LENGTH)
+        with self.assertRaisesMessage(SavedSearchError, 'Keywords'):
+            save_search(self.buyer, {'search': 'y' * (MAX_KEYWORD_LENGTH + 1)})
+
+        # A long last keyword still matches by prefix
+        shade = save_search(self.buyer, {'search': 'z' * MAX_KEYWORD_LENGTH})
+        self.post('Lamp ' + 'z' * 50, self.lamps)
+        self.assertIn((shade.name, 'Lamp ' + 'z' * 50), self.alerted())
+
+    def test_unknown_category_is_rejected(self):
+        with self.assertRaisesMessage(SavedSearchError, 'category'):
+            save_search(self.buyer, {'search': 'lamp', 'category': '999999'})
+        self.assertFalse(self.buyer.saved_searches.filter(query='lamp').exists())
+
+    def test_burst_is_one_digest(self):
+        for n in range(3):
+            self.post(f'Reading lamp {n}', self.lamps)
+        self.assertEqual(send_digests(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+        self.assertIn('Reading lamp 2', mail.outbox[0].body)
+        self.assertEqual(send_digests(), 0)
+
+    def test_views(self):
+        self.client.force_login(self.buyer)
+        self.assertContains(self.client.get(reverse('marketplace:home'), {'search': 'fridge'}), 'Alert me about new matches')
+        response = self.client.post(reverse('marketplace:save_search'), {'search': 'Mini fridge'})
+        self.assertRedirects(response, reverse('marketplace:saved_searches'))
+        self.assertContains(self.client.get(reverse('marketplace:saved_searches')), 'mini fridge')
+        saved = self.buyer.saved_searches.get(query='mini fridge')
+        self.assertEqual(sorted(saved.terms.values_list('term', 'prefix')), [('fridge', True), ('mini', False)])
+        self.client.post(reverse('marketplace:delete_saved_search', args=[saved.pk]))
+        self.assertFalse(self.buyer.saved_searches.filter(pk=saved.pk).exists())
+
+
+class DuplicateDetectionTests(TestCase):
+    DESCRIPTION = (
+        'Lightly used HP laptop with charger, 8GB RAM, 256GB SSD, battery holds about four hours. '
+        'Pick up near the library.'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.other = get_user_model().objects.create_user(username='other', password='pw')
+        cls.electronics = Category.objects.create(name='Dup Electronics')
+        cls.books = Category.objects.create(name='Dup Books')
+        SellerProfile.objects.filter(user__in=[cls.seller, cls.other]).update(max_listings=10)
+
+    def post(self, user, title, category, description=DESCRIPTION):
+        self.client.force_login(user)
+        self.client.post(reverse('marketplace:create_product'), {
+            'title': title, 'description': description, 'category': category.pk,
+            'price': '15000', 'condition': 'good',
+        })
+        return Product.objects.get(title=title)
+
+    def flagged(self, product):
+        return ProductFingerprint.objects.get(product=product).duplicate_of_id
+
+    def test_reposts_are_flagged(self):
+        original = self.post(self.seller, 'Used HP laptop 8GB RAM', self.electronics)
+        self.assertIsNone(self.flagged(original))
+        repost = self.post(self.seller, 'HP laptop 8GB RAM - used', self.electronics)
+        self.assertEqual(self.flagged(repost), original.pk)
+        admin_user = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        self.client.force_login(admin_user)
+        changelist = self.client.get(reverse('admin:marketplace_product_changelist'), {'duplicate': 'yes'})
+        self.assertContains(changelist, f'Near-duplicate of #{original.pk}')
+        # Same seller, unrelated text
+        other = self.post(self.seller, 'Calculus textbook', self.books,
+                          'Stewart calculus, early transcendentals, 8th edition, some highlighting.')
+        self.assertIsNone(self.flagged(other))
+
+        # Sold listings are no longer candidates
+        original.is_sold = repost.is_sold = True
+        original.save()
+        repost.save()
+        self.assertIsNone(self.flagged(self.post(self.other, 'HP laptop, 8GB RAM', self.books)))
+
+    def test_image_hash_survives_resizing_and_recompression(self):
+        image = Image.new('RGB', (640, 480))
+        draw = ImageDraw.Draw(image)
+        for x in range(640):
+            draw.line([(x, 0), (x, 480)], fill=(x % 256, (x * 3) % 256, 120))
+        draw.ellipse([100, 100, 300, 300], fill=(255, 0, 0))
+        other = Image.new('RGB', (640, 480), (0, 200, 0))
+        ImageDraw.Draw(other).rectangle([300, 50, 600, 400], fill=(0, 0, 255))
+
+        def jpeg(img, quality):
+            buffer = BytesIO()
+            img.save(buffer, 'JPEG', quality=quality)
+            buffer.seek(0)
+            return buffer
+
+        original = image_fingerprint(jpeg(image, 90))
+        self.assertLessEqual(hamming(original, image_fingerprint(jpeg(image.resize((320, 240)), 40))), 2)
+        self.assertGreater(hamming(original, image_fingerprint(jpeg(other, 90))), 20)
+        self.assertIsNone(image_fingerprint(StringIO('not an image')))
+
+
+class ProductPopularityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = get_user_model().objects.create_user(username='seller', password='pw')
+        cls.buyer = get_user_model().objects.create_user(username='buyer', password='pw')
+        cls.category = Category.objects.create(name='Popularity Test')
+        cls.lamp, cls.chair, cls.desk = [
+            Product.objects.create(
+                seller=cls.seller, category=cls.category, title=title, description='Used item',
+                price=100, condition='good',
+            )
+            for title in ('Lamp', 'Chair', 'Desk')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        view_buffer.drain()
+        self.client.force_login(self.buyer)
+
+    def view(self, product, times=1):
+        for _ in range(times):
+            self.client.get(reverse('marketplace:product_detail', args=[product.pk]))
+
+    def test_views_are_buffered_and_flushed_in_bulk(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.view(self.lamp, 3)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.view(self.chair)
+        self.client.force_login(self.seller)
+        self.view(self.chair)  # sellers don't count
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(flush_views(), 4)
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(Product.objects.get(pk=self.lamp.pk).views_count, 3)
+        self.assertEqual(Product.objects.get(pk=self.chair.pk).views_count, 1)
+        self.assertEqual(flush_views(), 0)
+
+        # A full save of a stale instance keeps the counter
+        self.lamp.title = 'Desk lamp'
+        self.lamp.save()
+        self.assertEqual(Product.objects.get(pk=self.lamp.pk).views_count, 3)
+
+    def test_full_saves_of_deleted_or_deferred_instances(self):
+        # A row deleted meanwhile is re-inserted, as Model.save() does
+        stale = Product.objects.get(pk=self.desk.pk)
+        Product.objects.filter(pk=self.desk.pk).delete()
+        stale.save()
+        self.assertEqual(Product.objects.get(pk=self.desk.pk).title, 'Desk')
+
+        # Deferred fields aren't fetched one by one just to be written back
+        product = Product.objects.defer('views_count', 'popularity').get(pk=self.chair.pk)
+        product.title = 'Armchair'
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+        deferred_loads = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT "marketplace_product"."id", "marketplace_product"."')
+        ]
+        self.assertEqual(deferred_loads, [])
+        self.assertEqual(Product.objects.get(pk=self.chair.pk).title, 'Armchair')
+
+    def test_popular_sort_decays_old_views(self):
+        now = timezone.now()
+        self.view(self.lamp, 12)
+        flush_views(now=now - timedelta(days=21))  # three half-lives ago: worth 1.5 views today
+        self.view(self.chair, 2)
+        flush_views(now=now)
+        self.view(self.desk)
+        flush_views(now=now)
 
-# Create your tests here.
+        response = self.client.get(reverse('marketplace:home'), {'sort': 'popular', 'category': self.category.pk})
+        titles = [product.title for product in response.context['products']]
+        self.assertEqual(titles, ['Chair', 'Lamp', 'Desk'])
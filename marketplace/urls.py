@@ -1,6 +1,6 @@
 # marketplace/urls.py
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'marketplace'
 
@@ -13,8 +13,24 @@ urlpatterns = [
     path('categories/', views.categories_list, name='categories'),
     path('favorites/', views.favorites_list, name='favorites'),
     path('my-listings/', views.my_listings, name='my_listings'),
+    path('my-listings/bulk/', views.bulk_listings, name='bulk_listings'),
+    path('suggest/', views.suggest, name='suggest'),
+    path('saved-searches/', views.saved_searches, name='saved_searches'),
+    path('saved-searches/new/', views.save_search, name='save_search'),
+    path('saved-searches/<int:search_id>/delete/', views.delete_saved_search, name='delete_saved_search'),
     path('store/<str:username>/', views.seller_store, name='seller_store'),
     
+    # "Load more" fragments (next page of product cards)
+    path('more/', views.marketplace_home, {'fragment': True}, name='home_more'),
+    path('my-products/more/', views.my_products, {'fragment': True}, name='my_products_more'),
+    path('my-listings/more/', views.my_listings, {'fragment': True}, name='my_listings_more'),
+    path('category/<str:category_name>/more/', views.category_view, {'fragment': True}, name='category_more'),
+    path('store/<str:username>/more/', views.seller_store, {'fragment': True}, name='seller_store_more'),
+    path('favorites/more/', views.favorites_list, {'fragment': True}, name='favorites_more'),
+    
+    # JSON API
+    path('api/v1/products/', api.products, name='api_products'),
+    
     # CRUD operations
     path('create/', views.create_product, name='create_product'),
     path('edit/<int:product_id>/', views.update_product, name='update_product'),
@@ -22,6 +38,7 @@ urlpatterns = [
     
     # Product management
     path('sold/<int:product_id>/', views.mark_as_sold, name='mark_as_sold'),
+    path('favorite/<int:product_id>/', views.toggle_favorite, name='toggle_favorite'),
     
     # Filter endpoints (optional for AJAX)
     # path('category/<int:category_id>/', views.category_products, name='category_products'),
@@ -0,0 +1,43 @@
+# marketplace/versions.py
+"""
+Version counters kept in the cache backend.
+
+Cached data that depends on many rows (facet counts, category lists, rendered
+fragments...) is keyed on a version number instead of being deleted key by
+key. Bumping the version makes every old entry unreachable at once; the
+stale entries then simply age out of the cache.
+"""
+import time
+
+from django.core.cache import cache
+
+VERSION_TIMEOUT = None  # version counters never expire on their own
+
+
+def _key(name):
+    return f'marketplace:version:{name}'
+
+
+def _fresh_version():
+    # A counter that was evicted must not restart at a number that old
+    # entries may still be stored under, so (re)start from the clock.
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Current version of ``name``."""
+    version = cache.get(_key(name))
+    if version is None:
+        cache.add(_key(name), _fresh_version(), VERSION_TIMEOUT)
+        version = cache.get(_key(name))
+    return version
+
+
+def bump_version(name):
+    """Invalidate everything cached under the current version of ``name``."""
+    try:
+        return cache.incr(_key(name))
+    except ValueError:
+        version = _fresh_version()
+        cache.set(_key(name), version, VERSION_TIMEOUT)
+        return version
@@ -1,66 +1,93 @@
 # marketplace/views.py
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_POST, require_safe
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
-from django.db.models import Q
-from .models import Product, Category
+from django.db import transaction
+from .models import Product, SavedSearch
 from .forms import ProductForm
-from accounts.models import SellerProfile
+from django.contrib.auth import get_user_model
+from .search import search_page
+from .pagination import paginate_by_score, paginate_keyset
+from .facets import apply_filters, facet_links, get_facets, normalize_filters
+from .categories import category_registry
+from .policy import request_seller_policy
+from .counters import reserve_listing_slot
+from .favorites import favorite_ids, toggle_favorite as flip_favorite, with_favorites
+from .storefront import render_storefront
+from .bulk import BulkActionError, run_bulk_action
+from .api import api_login_required
+from .suggest import CATEGORY, suggest_index
+from .alerts import SavedSearchError, save_search as store_search
+from .duplicates import KEEP, check_listing, image_fingerprint
+from .popularity import record_view
+
+def _next_page_url(request, more_url, page):
+    """URL of the "load more" fragment that continues ``page``."""
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    params.update(page.next_params)
+    return f'{more_url}?{params.urlencode()}'
+
+def _render_listing(request, template, context, more_url, fragment=False):
+    """Render a product listing page, or just the next page of cards for "load more"."""
+    context['next_url'] = _next_page_url(request, more_url, context['page'])
+    if fragment:
+        return render(request, 'marketplace/product_page.html', context)
+    return render(request, template, context)
 
 @login_required
-def marketplace_home(request):
-    products = Product.objects.filter(is_sold=False).order_by('-created_at')
-    categories = Category.objects.all()
-    
-    # Filter by category
-    category_id = request.GET.get('category')
-    if category_id:
-        products = products.filter(category_id=category_id)
+def marketplace_home(request, fragment=False):
+    categories = category_registry.all()
+    filters = normalize_filters(request.GET)
+    products = apply_filters(
+        with_favorites(Product.objects.filter(is_sold=False), request.user), filters, skip=('search',)
+    )
     
-    # Search functionality
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(seller__username__icontains=search_query)
-        )
-    
-    # Filter by condition
-    condition = request.GET.get('condition')
-    if condition:
-        products = products.filter(condition=condition)
-    
-    # Price range filter
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
+    # Search results are ranked by relevance; everything else is newest or most popular first
+    sort = 'popular' if request.GET.get('sort') == 'popular' else 'newest'
+    if filters['search']:
+        page = search_page(products, filters['search'], request.GET.get('page'))
+    elif sort == 'popular':
+        page = paginate_by_score(products, 'popularity', request.GET.get('cursor'))
+    else:
+        page = paginate_keyset(products, request.GET.get('cursor'))
     
     context = {
-        'products': products,
+        'products': page,
+        'page': page,
         'categories': categories,
         'title': 'Marketplace',
-        'search_query': search_query or '',
-        'selected_category': category_id,
+        'search_query': request.GET.get('search') or request.GET.get('q') or '',
+        'selected_category': filters['category'],
+        'sort': sort,
+        'filters_active': any(value is not None for value in filters.values()),
     }
-    return render(request, 'marketplace/home.html', context)
+    if not fragment:
+        context['facets'] = facet_links(request.GET, filters, get_facets(filters), categories)
+    return _render_listing(request, 'marketplace/home.html', context,
+                           reverse('marketplace:home_more'), fragment)
 
 @login_required
 def product_detail(request, product_id):
     product = get_object_or_404(Product, pk=product_id)
+    if product.seller_id != request.user.pk:
+        record_view(product.pk)  # buffered; flushed off the request path
     
-    # Get related products (same category, excluding current)
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_sold=False
-    ).exclude(pk=product.pk).order_by('-created_at')[:4]
+    # Precomputed neighbours (manage.py build_recommendations)
+    related_products = product.related_products(queryset=with_favorites(Product.objects.all(), request.user))
     
     context = {
         'product': product,
+        'is_favorited': product.pk in favorite_ids(request.user),
         'related_products': related_products,
         'title': product.title,
     }
@@ -68,8 +95,8 @@ def product_detail(request, product_id):
 
 @login_required
 def create_product(request):
-    seller_profile, created = SellerProfile.objects.get_or_create(user=request.user)
-    if not seller_profile.can_post_more_listings():
+    policy = request_seller_policy(request)
+    if not policy.can_post_more_listings():
         messages.error(request, 'You have reached your maximum active listings. Become a verified seller to post more.')
         return redirect('marketplace:my_listings')
     
@@ -78,7 +105,17 @@ def create_product(request):
         if form.is_valid():
             product = form.save(commit=False)
             product.seller = request.user
-            product.save()
+            # Hash the upload locally before it goes to Cloudinary
+            image_hash = image_fingerprint(request.FILES.get('image'))
+            with transaction.atomic():
+                # The policy check above is advisory; this is the atomic one
+                reserved = reserve_listing_slot(product)
+                if reserved:
+                    product.save()
+            if not reserved:
+                messages.error(request, 'You have reached your maximum active listings. Become a verified seller to post more.')
+                return redirect('marketplace:my_listings')
+            check_listing(product, image_hash)  # flags near-duplicates for the admin
             messages.success(request, 'Product listed successfully!')
             return redirect('marketplace:product_detail', product_id=product.id)
         else:
@@ -106,7 +143,9 @@ def update_product(request, product_id):
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
             updated_product = form.save(commit=False)
+            image_hash = image_fingerprint(request.FILES['image']) if 'image' in request.FILES else KEEP
             updated_product.save()
+            check_listing(updated_product, image_hash)
             messages.success(request, 'Product updated successfully!')
             return redirect('marketplace:product_detail', product_id=updated_product.pk)
         else:
@@ -131,7 +170,10 @@ def delete_product(request, product_id):
         return redirect('marketplace:product_detail', product_id=product.pk)
     
     if request.method == 'POST':
-        product.delete()
+        with transaction.atomic():
+            # Lock the row so a concurrent sale/delete can't decrement the counters twice
+            product = get_object_or_404(Product.objects.select_for_update(), id=product_id, seller=request.user)
+            product.delete()
         messages.success(request, 'Product deleted successfully!')
         return redirect('marketplace:my_listings')
     
@@ -141,8 +183,8 @@ def delete_product(request, product_id):
     })
 
 @login_required
-def my_products(request):
-    products = Product.objects.filter(seller=request.user).order_by('-created_at')
+def my_products(request, fragment=False):
+    products = Product.objects.filter(seller=request.user)
     
     # Filter sold/unsold
     filter_type = request.GET.get('filter')
@@ -151,55 +193,136 @@ def my_products(request):
     elif filter_type == 'unsold':
         products = products.filter(is_sold=False)
     
+    page = paginate_keyset(products, request.GET.get('cursor'))
     context = {
-        'products': products,
+        'products': page,
+        'page': page,
         'title': 'My Products',
         'filter_type': filter_type,
+        'owner_actions': True,
     }
-    return render(request, 'marketplace/my_products.html', context)
+    return _render_listing(request, 'marketplace/my_products.html', context,
+                           reverse('marketplace:my_products_more'), fragment)
 
 def categories_list(request):
     """Display all categories"""
-    categories = Category.objects.all()
+    categories = category_registry.with_counts()
     return render(request, 'marketplace/categories.html', {
         'categories': categories
     })
 
 @login_required
-def my_listings(request):
+def my_listings(request, fragment=False):
     """Display user's own listings"""
-    products = Product.objects.filter(seller=request.user).order_by('-created_at')
-    return render(request, 'marketplace/my_listings.html', {
-        'products': products,
-        'categories': Category.objects.all()
+    page = paginate_keyset(Product.objects.filter(seller=request.user), request.GET.get('cursor'))
+    context = {
+        'products': page,
+        'page': page,
+        'categories': category_registry.all(),
+        'owner_actions': True,
+        'bulk_select': True,
+        'column_class': 'col-md-4 col-sm-6',
+    }
+    return _render_listing(request, 'marketplace/my_listings.html', context,
+                           reverse('marketplace:my_listings_more'), fragment)
+
+@login_required
+@require_POST
+def bulk_listings(request):
+    """Apply one action to the selected listings (marketplace/bulk.py)"""
+    wants_json = 'application/json' in request.headers.get('Accept', '')
+    action = request.POST.get('action', '')
+    try:
+        changed, skipped = run_bulk_action(request.user, action, request.POST.getlist('ids'), request.POST)
+    except BulkActionError as exc:
+        if wants_json:
+            return JsonResponse({'error': str(exc)}, status=400)
+        messages.error(request, str(exc))
+        return redirect('marketplace:my_listings')
+    if wants_json:
+        return JsonResponse({'action': action, 'changed': changed, 'skipped': skipped})
+    
+    message = f"{changed} listing{'' if changed == 1 else 's'} updated."
+    if skipped:
+        message += f' {skipped} skipped: you have reached your maximum active listings.'
+    messages.success(request, message)
+    return redirect('marketplace:my_listings')
+
+@login_required
+def saved_searches(request):
+    """List the user's saved searches"""
+    searches = request.user.saved_searches.select_related('category')
+    return render(request, 'marketplace/saved_searches.html', {
+        'saved_searches': searches,
+        'title': 'Saved Searches',
     })
-  
+
+@login_required
+@require_POST
+def save_search(request):
+    """Save the current browse filters; new matching listings are emailed in digests"""
+    try:
+        saved = store_search(request.user, request.POST)
+    except SavedSearchError as exc:
+        messages.error(request, str(exc))
+    else:
+        messages.success(request, f'Saved search {saved.name}. We\'ll email you when new listings match.')
+    return redirect('marketplace:saved_searches')
+
+@login_required
+@require_POST
+def delete_saved_search(request, search_id):
+    get_object_or_404(SavedSearch, pk=search_id, user=request.user).delete()
+    messages.success(request, 'Saved search removed.')
+    return redirect('marketplace:saved_searches')
+
 @login_required
-def favorites_list(request):
+def favorites_list(request, fragment=False):
     """Display user's favorite products"""
-    # We'll implement this properly later
-    return render(request, 'marketplace/favorites.html', {
-        'categories': Category.objects.all()
-    })    
+    favorite_ids(request.user)  # warm the cache for the grids
+    products = with_favorites(Product.objects.filter(favorited_by__user=request.user), request.user)
+    page = paginate_keyset(products, request.GET.get('cursor'))
+    context = {
+        'products': page,
+        'page': page,
+        'categories': category_registry.all(),
+        'column_class': 'col-md-4 col-sm-6',
+        'empty_message': 'No favorites yet. Items you mark as favorite will appear here.',
+    }
+    return _render_listing(request, 'marketplace/favorites.html', context,
+                           reverse('marketplace:favorites_more'), fragment)
 
 @login_required
-def category_view(request, category_name):
-    # Get the category or return 404
-    category = get_object_or_404(Category, name__iexact=category_name)
+@require_POST
+def toggle_favorite(request, product_id):
+    """Add/remove a product from the user's favorites"""
+    product = get_object_or_404(Product, pk=product_id)
+    favorited = flip_favorite(request.user, product)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'product': product.pk, 'favorited': favorited})
+    
+    messages.success(request, 'Added to favorites!' if favorited else 'Removed from favorites.')
+    next_url = request.POST.get('next') or request.headers.get('Referer')
+    if next_url and url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        return redirect(next_url)
+    return redirect('marketplace:product_detail', product_id=product.pk)
+
+@login_required
+def category_view(request, category_name, fragment=False):
+    # Get the category or return 404 (by name, any case, or slug)
+    category = category_registry.get_by_name(category_name)
+    if category is None:
+        raise Http404('No such category')
+    # The header shows the live listing count
+    category, = category_registry.with_counts([category])
     
     # Get products in this category
-    products = Product.objects.filter(
+    products = with_favorites(Product.objects.filter(
         category=category,
         is_sold=False
-    ).order_by('-created_at')
+    ), request.user)
     
-    # Apply search filter if provided
     search_query = request.GET.get('q', '')
-    if search_query:
-        products = products.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
     
     # Apply price filter if provided
     min_price = request.GET.get('min_price')
@@ -210,41 +333,73 @@ def category_view(request, category_name):
     if max_price:
         products = products.filter(price__lte=max_price)
     
+    # Apply search filter if provided
+    if search_query:
+        page = search_page(products, search_query, request.GET.get('page'))
+    else:
+        page = paginate_keyset(products, request.GET.get('cursor'))
+    
     context = {
         'category': category,
-        'products': products,
+        'products': page,
+        'page': page,
         'search_query': search_query,
-        'categories': Category.objects.all(),  # For dropdowns
+        'categories': category_registry.all(),  # For dropdowns
+        'column_class': 'col-md-4 col-sm-6',
     }
     
-    return render(request, 'marketplace/category.html', context)
+    return _render_listing(request, 'marketplace/category.html', context,
+                           reverse('marketplace:category_more', args=[category.name]), fragment)
 
 @login_required
-def mark_as_sold(request, pk):
-    product = get_object_or_404(Product, id=pk, seller=request.user)
+def mark_as_sold(request, product_id):
+    product = get_object_or_404(Product, id=product_id, seller=request.user)
     
     # Check ownership
     if product.seller != request.user:
         messages.error(request, 'You do not have permission to update this product.')
-        return redirect('marketplace:product_detail', pk=product.pk)
+        return redirect('marketplace:product_detail', product_id=product.pk)
     
-    product.is_sold = True
-    product.save()
+    with transaction.atomic():
+        # Re-read under a row lock so two clicks can't both count the sale
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        if not product.is_sold:
+            product.is_sold = True
+            product.save()
     messages.success(request, 'Product marked as sold!')
-    return redirect('marketplace:product_detail', pk=product.pk)
+    return redirect('marketplace:product_detail', product_id=product.pk)
 
 @login_required
-def seller_store(request, username):
-    seller = get_object_or_404(User, username=username)
-    seller_profile = seller.seller_profile
-    products = Product.objects.filter(
-        seller=seller, 
-        is_sold=False, 
-        expired=False
-    ).order_by('-created_at')
-    
+def seller_store(request, username, fragment=False):
+    seller = get_object_or_404(get_user_model(), username=username)
+    # Shared, versioned HTML (marketplace/storefront.py); hearts are filled in client-side
+    html = render_storefront(seller, request.GET.get('cursor'), fragment)
+    if fragment:
+        return HttpResponse(html)
+    get_token(request)  # the cached hearts post with the CSRF cookie
     return render(request, 'marketplace/seller_store.html', {
         'seller': seller,
-        'seller_profile': seller_profile,
-        'products': products
-    })
\ No newline at end of file
+        'storefront': html,
+        'favorite_ids': sorted(favorite_ids(request.user)),
+    })
+
+@require_safe
+@api_login_required
+def suggest(request):
+    """Typeahead suggestions for the search box, from the in-memory index (marketplace/suggest.py)"""
+    query = request.GET.get('q', '')[:100]
+    suggestions = []
+    for item in suggest_index.suggest(query):
+        if item.kind == CATEGORY:
+            url = f"{reverse('marketplace:home')}?category={item.id}"
+        else:
+            url = reverse('marketplace:product_detail', args=[item.id])
+        suggestions.append({
+            'type': 'category' if item.kind == CATEGORY else 'product',
+            'id': item.id,
+            'label': item.label,
+            'url': url,
+        })
+    response = JsonResponse({'query': query, 'suggestions': suggestions})
+    patch_cache_control(response, private=True, max_age=30)
+    return response
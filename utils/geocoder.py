@@ -1,29 +1,114 @@
 # utils/geocoder.py
+"""
+Address -> coordinates lookups.
+
+``get_geocoder()`` returns the backend named by ``GEOCODER_BACKEND``:
+
+* ``NominatimGeocoder`` - OpenStreetMap's public Nominatim API. Its usage
+  policy allows at most one request per second, which the geocoding queue
+  (``geocoding/pipeline.py``) enforces; don't call it in a loop yourself.
+* ``FakeGeocoder`` - a deterministic, offline stand-in for tests and
+  benchmarks: every address maps to a stable point near Nairobi, except
+  addresses containing "nowhere", which are not found.
+
+``geocode()`` returns ``(latitude, longitude)``, or None when the address
+isn't found; transport failures raise ``GeocodingError`` so callers can tell
+"no such place" (cacheable) from "try again later" (not).
+"""
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+
 import requests
 from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+COUNTRY = 'Kenya'
+TIMEOUT = 10  # seconds
+
+_PUNCTUATION_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+
+class GeocodingError(Exception):
+    """The lookup failed (network, timeout, rate limit); the address may still exist."""
+
+
+def normalize_address(address, city=''):
+    """Canonical form of an address, so trivially different spellings share one lookup."""
+    text = unicodedata.normalize('NFKC', f'{address or ""} {city or ""}').lower()
+    return ' '.join(_PUNCTUATION_RE.sub(' ', text).split())
+
+
+def address_query(address, city=''):
+    """Free-text query for ``address`` as the geocoder should see it."""
+    parts = [part.strip() for part in (address, city, COUNTRY) if part and part.strip()]
+    return ', '.join(parts)
+
+
+class NominatimGeocoder:
+    url = 'https://nominatim.openstreetmap.org/search'
+    headers = {'User-Agent': 'CampusMarketplace/1.0 (contact@example.com)'}
+
+    def geocode(self, query):
+        try:
+            response = requests.get(
+                self.url,
+                params={'q': query, 'format': 'json', 'limit': 1},
+                headers=self.headers,
+                timeout=TIMEOUT,
+            )
+            response.raise_for_status()
+            data = response.json()
+            if not data:
+                return None
+            return float(data[0]['lat']), float(data[0]['lon'])
+        except (requests.RequestException, ValueError, LookupError, TypeError) as e:
+            raise GeocodingError(f'Nominatim lookup of {query!r} failed: {e}') from e
+
+
+class FakeGeocoder:
+    """Offline geocoder: stable pseudo-random points within ~10 km of central Nairobi."""
+
+    CENTER = (-1.2864, 36.8172)
+    SPREAD = 0.09  # degrees
+
+    def __init__(self, latency=None):
+        # Seconds each lookup takes, to make benchmarks feel the rate limit
+        self.latency = getattr(settings, 'GEOCODER_FAKE_LATENCY', 0) if latency is None else latency
+        self.calls = []
+
+    def geocode(self, query):
+        self.calls.append(query)
+        if self.latency:
+            time.sleep(self.latency)
+        if 'nowhere' in query.lower():
+            return None
+        digest = hashlib.blake2b(normalize_address(query).encode(), digest_size=8).digest()
+        a, b = int.from_bytes(digest[:4], 'big'), int.from_bytes(digest[4:], 'big')
+        return (
+            round(self.CENTER[0] + (a / 0xFFFFFFFF - 0.5) * 2 * self.SPREAD, 6),
+            round(self.CENTER[1] + (b / 0xFFFFFFFF - 0.5) * 2 * self.SPREAD, 6),
+        )
+
+
+def get_geocoder():
+    return import_string(getattr(settings, 'GEOCODER_BACKEND', 'utils.geocoder.NominatimGeocoder'))()
+
 
 def geocode_address(address, city="Nairobi"):
-    """Convert address to coordinates using Nominatim (OpenStreetMap)"""
+    """
+    Convert address to coordinates right now, bypassing the queue and its
+    cache. Returns ``{'latitude', 'longitude'}`` or None.
+    """
     try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': f"{address}, {city}, Kenya",
-            'format': 'json',
-            'limit': 1
-        }
-        headers = {
-            'User-Agent': 'CampusMarketplace/1.0 (contact@example.com)'
-        }
-        
-        response = requests.get(url, params=params, headers=headers)
-        data = response.json()
-        
-        if data:
-            return {
-                'latitude': float(data[0]['lat']),
-                'longitude': float(data[0]['lon'])
-            }
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-    
-    return None
\ No newline at end of file
+        point = get_geocoder().geocode(address_query(address, city))
+    except GeocodingError:
+        logger.warning('Geocoding %r failed', address, exc_info=True)
+        return None
+    if point is None:
+        return None
+    return {'latitude': point[0], 'longitude': point[1]}
@@ -0,0 +1,115 @@
+# utils/images.py
+"""
+Responsive Cloudinary image URLs without the SDK in the render path.
+
+Delivery URLs are plain strings derived from the stored public_id:
+
+    https://res.cloudinary.com/<cloud>/<resource_type>/<type>/<transformation>/v<version>/<public_id>
+
+so they are built here by string formatting and memoized in an LRU keyed
+by (public_id, version, variant). Re-uploading an image changes its
+version, which is part of the key, so cached URLs never go stale. Every
+variant uses ``f_auto,q_auto``: Cloudinary serves WebP/AVIF to browsers
+that accept them.
+
+Templates use the ``{% responsive_img %}`` tag (``marketplace/templatetags/
+responsive_images.py``); Python code uses ``image_url()`` / ``srcset()``.
+"""
+from functools import lru_cache
+from urllib.parse import quote
+
+import cloudinary
+from django.conf import settings
+
+DELIVERY_HOST = 'https://res.cloudinary.com'
+BASE_TRANSFORMATION = 'f_auto,q_auto'
+
+# name -> (widths for srcset, aspect ratio or None, crop mode, sizes attribute)
+VARIANTS = {
+    'thumbnail': ((64, 128), '1:1', 'fill', '64px'),
+    'card': ((240, 360, 480, 720), '4:3', 'fill', '(min-width: 992px) 25vw, (min-width: 576px) 50vw, 100vw'),
+    'detail': ((480, 800, 1200, 1600), None, 'limit', '(min-width: 768px) 50vw, 100vw'),
+}
+
+
+@lru_cache(maxsize=1)
+def _cloud_name():
+    name = cloudinary.config().cloud_name
+    return name or getattr(settings, 'CLOUDINARY_STORAGE', {}).get('CLOUD_NAME')
+
+
+def _parts(image):
+    """(public_id, version, resource_type, type) of a stored image, or None."""
+    public_id = getattr(image, 'public_id', None)
+    if not public_id:
+        return None
+    return (
+        public_id,
+        getattr(image, 'version', None) or '',
+        getattr(image, 'resource_type', None) or 'image',
+        getattr(image, 'type', None) or 'upload',
+    )
+
+
+@lru_cache(maxsize=8192)
+def _build(cloud, public_id, version, resource_type, delivery_type, transformation):
+    path = [DELIVERY_HOST, cloud, resource_type, delivery_type, transformation]
+    if version:
+        path.append(f'v{version}')
+    path.append(quote(public_id, safe='/:-_.'))
+    return '/'.join(path)
+
+
+def _transformation(width, height=None, crop='fill', aspect_ratio=None):
+    parts = [f'c_{crop}', f'w_{width}']
+    if height:
+        parts.append(f'h_{height}')
+    if aspect_ratio:
+        parts.append(f'ar_{aspect_ratio}')
+    if crop in ('fill', 'thumb'):
+        parts.append('g_auto')
+    return ','.join(parts) + '/' + BASE_TRANSFORMATION
+
+
+def image_url(image, width, height=None, crop='fill'):
+    """
+    URL of ``image`` (a CloudinaryField value) scaled to ``width``
+    (and ``height``). Falls back to the SDK URL when there is no cloud name
+    to build from, and to None when there is no image.
+    """
+    parts = _parts(image) if image else None
+    if parts is None or not _cloud_name():
+        return getattr(image, 'url', None) if image else None
+    return _build(_cloud_name(), *parts, _transformation(width, height, crop))
+
+
+@lru_cache(maxsize=8192)
+def _variant(cloud, public_id, version, resource_type, delivery_type, variant):
+    widths, aspect_ratio, crop, _ = VARIANTS[variant]
+    urls = [
+        (width, _build(cloud, public_id, version, resource_type, delivery_type,
+                       _transformation(width, crop=crop, aspect_ratio=aspect_ratio)))
+        for width in widths
+    ]
+    src = urls[len(urls) // 2][1]
+    return src, ', '.join(f'{url} {width}w' for width, url in urls)
+
+
+def srcset(image, variant='card'):
+    """
+    ``(src, srcset, sizes)`` for ``image`` in one of ``VARIANTS``. srcset is
+    empty when the URL can't be built locally; src is then the SDK URL.
+    """
+    sizes = VARIANTS[variant][3]
+    parts = _parts(image) if image else None
+    if parts is None or not _cloud_name():
+        return (getattr(image, 'url', None) if image else None), '', sizes
+    src, candidates = _variant(_cloud_name(), *parts, variant)
+    return src, candidates, sizes
+
+
+def clear_cache():
+    """Forget memoized URLs, e.g. after changing the Cloudinary configuration."""
+    _cloud_name.cache_clear()
+    _build.cache_clear()
+    _variant.cache_clear()
@@ -0,0 +1,217 @@
+# utils/tiles.py
+"""
+Clustered GeoJSON map tiles for Leaflet.
+
+Map pages ask for ``<app>/tiles/<z>/<x>/<y>.json`` in the usual slippy-map
+(Web Mercator) numbering instead of downloading every listing. A tile is
+built from the listings inside its bounds (read through the layer's
+spatial filter) and clustered on a quadtree grid: each tile is split into
+``2 ** CELL_BITS`` x ``2 ** CELL_BITS`` cells, which are exactly the tiles
+``CELL_BITS`` zoom levels down, so clusters line up across neighbouring
+tiles and split cleanly as the user zooms in. A cell holding one listing
+becomes a marker; a busier cell becomes a single cluster at its members'
+centroid, with their count and bounds. From ``CLUSTER_MAX_ZOOM`` on
+every listing is its own marker.
+
+Rendered tiles are cached per ``(layer, z, x, y)`` with a strong ETag over
+the body, so map panning mostly costs a cache hit and a 304. A saved,
+moved or deleted listing drops only the tiles containing its old and new
+positions, one per zoom level (``TileLayer.invalidate``), once its
+transaction commits.
+"""
+import hashlib
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+MAX_ZOOM = 19
+CLUSTER_MAX_ZOOM = 17
+CELL_BITS = 3  # 8x8 cluster cells per tile, 32px on a 256px tile
+MAX_LATITUDE = 85.05112878  # Web Mercator's limit
+TILE_TIMEOUT = 60 * 60  # seconds; saves invalidate the tiles they touch
+
+# Same attribute names as housing.spatial.BBox, so either works as a filter
+Bounds = namedtuple('Bounds', 'min_lat min_lng max_lat max_lng')
+
+
+def tile_bounds(z, x, y):
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return Bounds(lat(y + 1), x / n * 360 - 180, lat(y), (x + 1) / n * 360 - 180)
+
+
+def project(lats, lngs, z):
+    """Integer tile columns and rows of points at zoom ``z``."""
+    n = 1 << z
+    lats = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    xs = (np.asarray(lngs, dtype=np.float64) + 180) / 360
+    ys = (1 - np.log(np.tan(lats) + 1 / np.cos(lats)) / math.pi) / 2
+    return (
+        np.clip(np.floor(xs * n), 0, n - 1).astype(np.int64),
+        np.clip(np.floor(ys * n), 0, n - 1).astype(np.int64),
+    )
+
+
+def tiles_for_point(lat, lng):
+    """``(z, x, y)`` of the tile containing ``(lat, lng)`` at every zoom level."""
+    tiles = []
+    for z in range(MAX_ZOOM + 1):
+        xs, ys = project([lat], [lng], z)
+        tiles.append((z, int(xs[0]), int(ys[0])))
+    return tiles
+
+
+def _feature(lat, lng, properties):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [round(lng, 6), round(lat, 6)]},
+        'properties': properties,
+    }
+
+
+class TileLayer:
+    """
+    One app's listings as map tiles.
+
+    ``get_queryset()`` gives the listings to plot, ``within(queryset,
+    bounds)`` narrows them to a box (ideally through an index), and
+    ``describe(row)`` turns a ``values_list('pk', 'latitude', 'longitude',
+    *fields)`` row into a marker's properties.
+    """
+
+    def __init__(self, name, get_queryset, within, fields, describe):
+        self.name = name
+        self.get_queryset = get_queryset
+        self.within = within
+        self.fields = fields
+        self.describe = describe
+
+    def _key(self, z, x, y):
+        return f'tiles:{self.name}:{z}:{x}:{y}'
+
+    def features(self, z, x, y):
+        queryset = self.within(self.get_queryset(), tile_bounds(z, x, y))
+        rows = list(
+            queryset.filter(latitude__isnull=False, longitude__isnull=False)
+            .order_by('pk')
+            .values_list('pk', 'latitude', 'longitude', *self.fields)
+        )
+        if not rows:
+            return []
+        lats = np.array([float(row[1]) for row in rows])
+        lngs = np.array([float(row[2]) for row in rows])
+        # Quadtree cells: the tiles CELL_BITS levels down
+        cell_zoom = z + CELL_BITS
+        cell_x, cell_y = project(lats, lngs, cell_zoom)
+        # The box filter is inclusive; keep only points this tile owns
+        inside = np.flatnonzero(((cell_x >> CELL_BITS) == x) & ((cell_y >> CELL_BITS) == y))
+        if z >= CLUSTER_MAX_ZOOM:
+            return [_feature(lats[i], lngs[i], self.describe(rows[i])) for i in inside]
+
+        keys = cell_x[inside] * (1 << cell_zoom) + cell_y[inside]
+        cells, first, members, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        lat_sums = np.bincount(members, weights=lats[inside], minlength=len(cells))
+        lng_sums = np.bincount(members, weights=lngs[inside], minlength=len(cells))
+        south = np.full(len(cells), np.inf)
+        west = np.full(len(cells), np.inf)
+        north = np.full(len(cells), -np.inf)
+        east = np.full(len(cells), -np.inf)
+        np.minimum.at(south, members, lats[inside])
+        np.minimum.at(west, members, lngs[inside])
+        np.maximum.at(north, members, lats[inside])
+        np.maximum.at(east, members, lngs[inside])
+
+        features = []
+        for cell, count in enumerate(counts):
+            if count == 1:
+                i = inside[first[cell]]
+                features.append(_feature(lats[i], lngs[i], self.describe(rows[i])))
+            else:
+                features.append(_feature(lat_sums[cell] / count, lng_sums[cell] / count, {
+                    'cluster': True,
+                    'count': int(count),
+                    'bbox': [round(float(v), 6) for v in (west[cell], south[cell], east[cell], north[cell])],
+                }))
+        return features
+
+    def tile(self, z, x, y):
+        """``(etag, JSON body)`` of a tile, from the cache when possible."""
+        key = self._key(z, x, y)
+        cached = cache.get(key)
+        if cached is None:
+            body = json.dumps(
+                {'type': 'FeatureCollection', 'features': self.features(z, x, y)},
+                separators=(',', ':'),
+            ).encode()
+            cached = (quote_etag(hashlib.sha1(body).hexdigest()), body)
+            cache.set(key, cached, TILE_TIMEOUT)
+        return cached
+
+    def invalidate(self, points):
+        """Drop the cached tiles containing any of ``points`` (``(lat, lng)`` pairs or None)."""
+        keys = {self._key(*tile) for point in points if point for tile in tiles_for_point(*point)}
+        if keys:
+            cache.delete_many(list(keys))
+
+
+def _point(lat, lng):
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+def track_tiles(layer, model, ignored_updates=()):
+    """
+    Connect signals dropping ``layer``'s tiles when a ``model`` row is saved,
+    moved or deleted, once the transaction commits (so a tile rebuilt
+    meanwhile can't cache the old rows). Saves of only ``ignored_updates``
+    fields leave tiles be.
+    """
+    def invalidate_on_commit(points):
+        transaction.on_commit(lambda: layer.invalidate(points))
+
+    def skip(raw, update_fields):
+        return raw or (update_fields is not None and set(update_fields) <= set(ignored_updates))
+
+    def remember_position(sender, instance, raw=False, update_fields=None, **kwargs):
+        instance._tile_point = None
+        if instance.pk and not skip(raw, update_fields):
+            old = model._base_manager.filter(pk=instance.pk).values_list('latitude', 'longitude').first()
+            instance._tile_point = old and _point(*old)
+
+    def saved(sender, instance, raw=False, update_fields=None, **kwargs):
+        if not skip(raw, update_fields):
+            invalidate_on_commit([getattr(instance, '_tile_point', None), _point(instance.latitude, instance.longitude)])
+
+    def deleted(sender, instance, **kwargs):
+        invalidate_on_commit([_point(instance.latitude, instance.longitude)])
+
+    uid = f'tiles.{layer.name}'
+    pre_save.connect(remember_position, sender=model, weak=False, dispatch_uid=f'{uid}.pre_save')
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=f'{uid}.post_save')
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f'{uid}.post_delete')
+
+
+def tile_response(request, layer, z, x, y):
+    """Serve one tile of ``layer``, answering a matching ``If-None-Match`` with 304."""
+    if z > MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+        raise Http404('No such tile')
+    etag, body = layer.tile(z, x, y)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Same for every visitor; browsers revalidate, which the ETag makes cheap
+    response['Cache-Control'] = 'public, no-cache'
+    return response